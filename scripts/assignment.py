@@ -0,0 +1,711 @@
+#!/usr/bin/env python3
+"""
+Incremental interceptor-to-track assignment
+Matches N drones to M target tracks every control tick. The cost of sending
+drone i after track j, in seconds, is
+
+  time to intercept   tau: the earliest time the drone, flying at its WPNAV
+                      speed, can meet the track on its current course
+  + distance term     DISTANCE_WEIGHT * straight-line distance / speed
+  + battery term      BATTERY_WEIGHT * the share of the drone's remaining
+                      endurance the intercept and the flight home would use
+
+Pairs the battery cannot cover (keeping BATTERY_RESERVE) are infeasible, and
+a pair costing more than UNASSIGNED_COST is left unassigned.
+
+The matching is an auction (Bertsekas): drones bid for tracks, prices rise,
+and the result is within N * epsilon of the optimal total cost. A cold
+solve scales epsilon down in phases. Between ticks the prices and matches
+are kept per drone and track id. A new tick compares the cost matrix with
+the last one: only the drones on a changed or vanished track bid again, and
+each changed track is re-priced to the least at which no other drone
+prefers it, so every other match and price stands and a few moved tracks
+cost a few bids. After a complete solve all prices are lowered together as
+far as the result allows, which keeps those bids from turning into long
+price wars. Tracks left unmatched while still priced above zero bid back
+for drones (the reverse auction), so prices from an earlier phase or tick
+never skew the result. Every solve has a time budget: when it runs out,
+the drones still unmatched take the best free track greedily for this
+tick, and the auction resumes from where it stopped on the next one.
+
+Results are intercept points for Swarm.send_positions() or pursuit
+velocities for Swarm.send_velocities().
+
+Usage:
+  python3 assignment.py --bench
+  python3 fake_vehicle.py --count 8 --battery 40 &
+  python3 assignment.py --count 8 --tracks 6 --takeoff 10 --duration 90
+  python3 assignment.py --count 8 --tracks 6 --takeoff 10 --output position
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import time
+
+import numpy as np
+
+from formation import fleet_positions, limit_velocities, speed_limits, wait_altitude
+from scheduler import RateScheduler
+from separation import spawn_offsets
+from swarm import BASE_PORT, PORT_STEP, Swarm
+
+# Cost weights (the time term has weight 1; costs are in seconds)
+DISTANCE_WEIGHT = 0.5
+BATTERY_WEIGHT = 60.0
+# Pairs costing more than this are left unassigned (s)
+UNASSIGNED_COST = 600.0
+
+# Hover seconds on a full battery, and the charge kept for the flight home (%)
+FULL_ENDURANCE = 1200.0
+BATTERY_RESERVE = 20.0
+
+# Auction: final epsilon (s), epsilon-scaling factor, and the per-tick budget (s)
+EPSILON = 0.1
+EPSILON_SCALING = 5.0
+BUDGET = 0.025
+# Auction state of a drone: still bidding, or better off unassigned
+FREE = -1
+IDLE = -2
+
+# Output rate and telemetry for the demo
+TICK_RATE = 10
+STREAM_PROFILE = "intercept"
+
+# Demo tracks: spawn radius (m), speed range (m/s), altitude range (m),
+# turn rate (deg/s), and the radii of an intercept and of the defended zone
+TRACK_RADIUS = 40.0
+TRACK_SPEED = (0.2, 0.8)
+TRACK_ALTITUDE = (8.0, 20.0)
+TRACK_TURN = 10.0
+INTERCEPT_RADIUS = 2.0
+DEFENDED_RADIUS = 5.0
+
+BENCH_SIZES = ((10, 10), (50, 50), (100, 100), (200, 200), (200, 50), (50, 200))
+# Tracks changed between ticks in the incremental benchmark, and the most
+# drones a warm tick may re-bid per changed track before the benchmark fails
+BENCH_CHANGED = 5
+BENCH_RELEASE_LIMIT = 2
+
+
+# ----------------------------------------------------------------------
+# Costs
+# ----------------------------------------------------------------------
+
+def intercept_times(drones, tracks, velocities, speed):
+    """(N, M) earliest meeting time of each drone at speed with each track (inf if never)."""
+    r = tracks[None, :, :] - drones[:, None, :]
+    # |r + v tau| = speed * tau  ->  a tau^2 + b tau + c = 0
+    a = np.einsum("mk,mk->m", velocities, velocities)[None, :] - speed * speed
+    b = 2.0 * np.einsum("nmk,mk->nm", r, velocities)
+    c = np.einsum("nmk,nmk->nm", r, r)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        disc = np.sqrt(b * b - 4.0 * a * c)
+        roots = np.stack(((-b - disc) / (2.0 * a), (-b + disc) / (2.0 * a)))
+        # Track exactly as fast as the drone: the equation is linear
+        linear = np.where(b < 0, -c / b, np.inf)
+    roots = np.where(roots >= 0, roots, np.inf)
+    tau = np.where(np.abs(a) < 1e-9, linear, roots.min(axis=0))
+    tau[c < 1e-12] = 0.0
+    return np.where(np.isnan(tau), np.inf, tau)
+
+
+def assignment_costs(drones, batteries, tracks, velocities, speed, homes=None):
+    """(N, M) cost in seconds, inf where infeasible; batteries in % (-1 = unknown)."""
+    tau = intercept_times(drones, tracks, velocities, speed)
+    meet = tracks[None, :, :] + velocities[None, :, :] * np.where(np.isinf(tau), 0.0, tau)[..., None]
+    homes = np.zeros_like(drones) if homes is None else homes
+    home_time = np.linalg.norm(meet - homes[:, None, :], axis=2) / speed
+    charge = np.where(batteries < 0, 100.0, batteries)
+    endurance = np.maximum(charge - BATTERY_RESERVE, 0.0)[:, None] / 100.0 * FULL_ENDURANCE
+    needed = tau + home_time
+    distance = np.linalg.norm(tracks[None, :, :] - drones[:, None, :], axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cost = tau + DISTANCE_WEIGHT * distance / speed + BATTERY_WEIGHT * needed / endurance
+    cost[needed > endurance] = np.inf
+    return cost
+
+
+def intercept_points(drones, tracks, velocities, speed, assignment):
+    """(N, 3) meeting point of each drone with its track (its own position if unassigned)."""
+    points = drones.copy()
+    matched = np.flatnonzero(assignment >= 0)
+    if matched.size:
+        j = assignment[matched]
+        tau = intercept_times(drones[matched], tracks[j], velocities[j], speed)
+        tau = np.diagonal(tau)
+        tau = np.where(np.isfinite(tau), tau, 0.0)
+        points[matched] = tracks[j] + velocities[j] * tau[:, None]
+    return points
+
+
+def pursuit_velocities(drones, points, limits, gain=1.0):
+    """(N, 3) velocities toward the intercept points, at full speed until close."""
+    velocity = (points - drones) * gain
+    # Full horizontal speed until within one second of the point
+    horizontal = np.hypot(velocity[:, 0], velocity[:, 1])
+    boost = np.where(horizontal > 0, limits[0] / np.maximum(horizontal, 1e-9), 0.0)
+    velocity[:, :2] *= np.maximum(boost, 1.0)[:, None]
+    return limit_velocities(velocity, limits)
+
+
+# ----------------------------------------------------------------------
+# Auction
+# ----------------------------------------------------------------------
+
+class Assigner:
+    """Warm-started auction over drone and track ids, within a time budget."""
+
+    def __init__(self, epsilon=EPSILON, budget=BUDGET, unassigned_cost=UNASSIGNED_COST):
+        self.epsilon = epsilon
+        self.budget = budget
+        self.unassigned_cost = unassigned_cost
+        # Kept between ticks, by id
+        self.prices = {}
+        self.matches = {}
+        self._last = None        # (cost, drone index, track index) of the last solve
+        # Last solve
+        self.rounds = 0
+        self.released = 0
+        self.complete = True
+        self.elapsed = 0.0
+
+    def reset(self):
+        self.prices.clear()
+        self.matches.clear()
+        self._last = None
+
+    def _changed_tracks(self, cost, drone_ids, track_ids):
+        """(M,) True for tracks that are new or whose cost to any known drone changed."""
+        if self._last is None:
+            return np.ones(len(track_ids), dtype=bool)
+        last, drone_index, track_index = self._last
+        rows = np.array([drone_index.get(d, -1) for d in drone_ids], dtype=int)
+        cols = np.array([track_index.get(t, -1) for t in track_ids], dtype=int)
+        changed = cols < 0
+        known = np.flatnonzero(~changed)
+        # New drones start free and bid anyway; compare the drones seen before
+        seen = np.flatnonzero(rows >= 0)
+        if known.size and seen.size:
+            before = last[np.ix_(rows[seen], cols[known])]
+            changed[known] = (before != cost[np.ix_(seen, known)]).any(axis=0)
+        return changed
+
+    def solve(self, cost, drone_ids=None, track_ids=None, warm=True):
+        """(N,) track index per drone (-1 = unassigned) for an (N, M) cost matrix."""
+        start = time.perf_counter()
+        deadline = None if self.budget is None else start + self.budget
+        count, tracks = cost.shape
+        drone_ids = list(range(count)) if drone_ids is None else list(drone_ids)
+        track_ids = list(range(tracks)) if track_ids is None else list(track_ids)
+        # Benefit of a pair over leaving the drone idle (worth 0 at a price
+        # that never rises); infeasible pairs are worth less than idling
+        benefit = np.where(np.isfinite(cost), self.unassigned_cost - cost, -self.unassigned_cost)
+
+        warm = warm and bool(self.matches)
+        prices = np.array([self.prices.get(t, 0.0) for t in track_ids]) if warm else np.zeros(tracks)
+        person_obj = np.full(count, FREE)
+        obj_owner = np.full(tracks, FREE)
+        if warm:
+            index = {t: j for j, t in enumerate(track_ids)}
+            for i, drone in enumerate(drone_ids):
+                match = self.matches.get(drone, FREE)
+                j = IDLE if match == IDLE else index.get(match, FREE)
+                if j >= 0 and obj_owner[j] < 0:
+                    person_obj[i], obj_owner[j] = j, i
+                elif j == IDLE:
+                    person_obj[i] = IDLE
+            # Only a changed track can break a held match (unchanged ones kept
+            # their costs and prices): drones on a changed or vanished track
+            # re-bid, and each changed track is re-priced to the least at which
+            # no other held drone prefers it, which keeps their matches
+            changed = self._changed_tracks(cost, drone_ids, track_ids)
+            own = np.where(person_obj >= 0, changed[np.maximum(person_obj, 0)], False)
+            obj_owner[person_obj[own]] = FREE
+            person_obj[own] = FREE
+            held = np.flatnonzero(person_obj != FREE)
+            columns = np.flatnonzero(changed)
+            if columns.size:
+                profit = self._profits(benefit, prices, person_obj)[held]
+                floor = (benefit[np.ix_(held, columns)] - profit[:, None]).max(axis=0, initial=0.0)
+                prices[columns] = np.maximum(floor, 0.0)
+            if not self.complete:
+                # The last solve stopped early, so unchanged tracks prove nothing
+                best = np.maximum((benefit[held] - prices).max(axis=1, initial=0.0), 0.0)
+                profit = self._profits(benefit, prices, person_obj)[held]
+                # A won bid leaves a drone exactly epsilon short; allow for rounding
+                drop = held[best - profit > self.epsilon * (1 + 1e-6)]
+                obj_owner[person_obj[drop][person_obj[drop] >= 0]] = FREE
+                person_obj[drop] = FREE
+            phases = [self.epsilon]
+        else:
+            # Epsilon scaling: coarse phases settle the prices quickly, the
+            # last one gives the answer. Prices may need to climb all the way
+            # to the benefits (more drones than tracks), so scale from those
+            spread = max(float(np.abs(benefit).max()) if benefit.size else 0.0, self.epsilon)
+            phases = []
+            eps = spread / EPSILON_SCALING
+            while eps > self.epsilon:
+                phases.append(eps)
+                eps /= EPSILON_SCALING
+            phases.append(self.epsilon)
+        self.released = int(np.count_nonzero(person_obj == FREE))
+
+        self.rounds = 0
+        self.complete = True
+        for n, eps in enumerate(phases):
+            if n:
+                person_obj[:] = FREE
+                obj_owner[:] = FREE
+            if not (self._forward(benefit, prices, person_obj, obj_owner, eps, deadline) and
+                    self._reverse(benefit, prices, person_obj, obj_owner, eps, deadline)):
+                self.complete = False
+                break
+
+        if self.complete:
+            self._lower_prices(benefit, prices, person_obj, obj_owner)
+        # Remember the auction state, then fill gaps greedily for this tick only
+        self._last = (cost.copy(), {d: i for i, d in enumerate(drone_ids)},
+                      {t: j for j, t in enumerate(track_ids)})
+        self.prices = dict(zip(track_ids, prices.tolist()))
+        self.matches = {drone: (track_ids[j] if j >= 0 else IDLE)
+                        for drone, j in zip(drone_ids, person_obj.tolist()) if j != FREE}
+        if not self.complete:
+            self._greedy(benefit, prices, person_obj, obj_owner)
+
+        assignment = np.where(person_obj >= 0, person_obj, -1)
+        rows = np.flatnonzero(assignment >= 0)
+        assignment[rows[~(cost[rows, assignment[rows]] <= self.unassigned_cost)]] = -1
+        self.elapsed = time.perf_counter() - start
+        return assignment
+
+    @staticmethod
+    def _profits(benefit, prices, person_obj):
+        """What each drone gets from its match at the current prices (0 if idle or free)."""
+        matched = person_obj >= 0
+        mine = np.maximum(person_obj, 0)
+        return np.where(matched, benefit[np.arange(len(person_obj)), mine] - prices[mine]
+                        if len(prices) else 0.0, 0.0)
+
+    def _forward(self, benefit, prices, person_obj, obj_owner, eps, deadline):
+        """Drones bid for tracks until every drone is matched or idle; False if out of time."""
+        tracks = len(prices)
+        while True:
+            free = np.flatnonzero(person_obj == FREE)
+            if not free.size:
+                return True
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            self.rounds += 1
+            if not tracks:
+                person_obj[free] = IDLE
+                continue
+            if free.size == 1:
+                # Warm ticks mostly have one bidder at a time: skip the batching
+                i = free[0]
+                values = benefit[i] - prices
+                j = int(values.argmax())
+                value = values[j]
+                if value <= 0.0:
+                    person_obj[i] = IDLE
+                    continue
+                values[j] = 0.0
+                bid = prices[j] + value - max(values.max(), 0.0) + eps
+                outbid = obj_owner[j]
+                if outbid >= 0:
+                    person_obj[outbid] = FREE
+                obj_owner[j], person_obj[i], prices[j] = i, j, bid
+                continue
+            values = benefit[free] - prices
+            rows = np.arange(free.size)
+            if tracks > 1:
+                top = np.argpartition(-values, 1, axis=1)[:, :2]
+                best = top[:, 0]
+                second = np.maximum(values[rows, top[:, 1]], 0.0)
+            else:
+                best = np.zeros(free.size, dtype=int)
+                second = np.zeros(free.size)
+            value = values[rows, best]
+            idle = value <= 0.0
+            person_obj[free[idle]] = IDLE
+            free, best = free[~idle], best[~idle]
+            if not free.size:
+                continue
+            bids = prices[best] + value[~idle] - second[~idle] + eps
+            # Highest bid per track wins it
+            order = np.lexsort((bids, best))
+            last = np.r_[best[order][1:] != best[order][:-1], True]
+            win = order[last]
+            objects, winners = best[win], free[win]
+            outbid = obj_owner[objects]
+            person_obj[outbid[outbid >= 0]] = FREE
+            obj_owner[objects] = winners
+            person_obj[winners] = objects
+            prices[objects] = bids[win]
+
+    def _reverse(self, benefit, prices, person_obj, obj_owner, eps, deadline):
+        """Unmatched tracks still priced above 0 bid for drones (or drop to 0).
+
+        Without this, a price left over from an earlier phase or tick could
+        keep a drone idle or on a worse track. Each bid raises the drone's
+        profit by at least eps, so it ends.
+        """
+        count = len(person_obj)
+        while True:
+            stale = np.flatnonzero((obj_owner < 0) & (prices > 0.0))
+            if not stale.size:
+                return True
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            self.rounds += 1
+            # Value of each drone to each stale track at its current profit
+            values = benefit[:, stale].T - self._profits(benefit, prices, person_obj)
+            if count > 1:
+                top = np.argpartition(-values, 1, axis=1)[:, :2]
+                cols = np.arange(stale.size)
+                person = top[:, 0]
+                value = values[cols, person]
+                second = values[cols, top[:, 1]]
+            else:
+                person = np.zeros(stale.size, dtype=int)
+                value = values[:, 0]
+                second = np.full(stale.size, -np.inf)
+            # Not worth a drone's switch: the price falls as far as it can
+            cheap = value <= eps
+            prices[stale[cheap]] = 0.0
+            stale, person, value, second = stale[~cheap], person[~cheap], value[~cheap], second[~cheap]
+            if not stale.size:
+                continue
+            offer = np.maximum(second - eps, 0.0)
+            gain = benefit[person, stale] - offer
+            # Each drone takes the track that leaves it the most
+            order = np.lexsort((gain, person))
+            last = np.r_[person[order][1:] != person[order][:-1], True]
+            win = order[last]
+            objects, winners = stale[win], person[win]
+            previous = person_obj[winners]
+            obj_owner[previous[previous >= 0]] = FREE
+            obj_owner[objects] = winners
+            person_obj[winners] = objects
+            prices[objects] = offer[win]
+
+    def _lower_prices(self, benefit, prices, person_obj, obj_owner):
+        """Lower every owned track's price by the most that keeps the result.
+
+        Prices only matter relative to each other and to idling. Left high
+        (they climb when every drone has a track), a drone whose track
+        changes may find every other track too dear, idle, and start a long
+        reverse auction; lowered, it simply bids.
+        """
+        owned = obj_owner >= 0
+        if not owned.any():
+            return
+        drop = float(prices[owned].min())
+        idle = np.flatnonzero(person_obj == IDLE)
+        if idle.size:
+            # Idle drones must still be within epsilon of preferring to idle
+            best = (benefit[np.ix_(idle, np.flatnonzero(owned))] - prices[owned]).max()
+            drop = min(drop, self.epsilon - float(best))
+        if drop > 0:
+            prices[owned] -= drop
+
+    @staticmethod
+    def _greedy(benefit, prices, person_obj, obj_owner):
+        for i in np.flatnonzero(person_obj == FREE):
+            values = np.where(obj_owner < 0, benefit[i] - prices, -np.inf)
+            j = int(values.argmax()) if values.size else -1
+            if j >= 0 and values[j] > 0:
+                person_obj[i], obj_owner[j] = j, i
+            else:
+                person_obj[i] = IDLE
+
+    def summary(self):
+        state = "complete" if self.complete else "budget hit, greedy fill"
+        return (f"{self.elapsed * 1000:.2f} ms, {self.rounds} rounds, "
+                f"{self.released} re-bid, {state}")
+
+
+def optimal_assignment(cost, unassigned_cost=UNASSIGNED_COST):
+    """Exact reference (Hungarian method, O(N^2 (N + M))) for checking the auction."""
+    count, tracks = cost.shape
+    # Minimise cost - unassigned_cost over tracks plus a private idle column per drone
+    big = 1e9
+    a = np.full((count, tracks + count), big)
+    a[:, :tracks] = np.where(cost <= unassigned_cost, cost - unassigned_cost, big)
+    a[np.arange(count), tracks + np.arange(count)] = 0.0
+    columns = tracks + count
+    u, v = np.zeros(count + 1), np.zeros(columns + 1)
+    owner = np.zeros(columns + 1, dtype=int)       # 1-based row of each column, 0 = none
+    way = np.zeros(columns + 1, dtype=int)
+    for i in range(1, count + 1):
+        owner[0] = i
+        j0 = 0
+        minv = np.full(columns + 1, np.inf)
+        used = np.zeros(columns + 1, dtype=bool)
+        while owner[j0]:
+            used[j0] = True
+            i0 = owner[j0]
+            reduced = a[i0 - 1] - u[i0] - v[1:]
+            better = ~used[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            j1 = int(np.argmin(np.where(used[1:], np.inf, minv[1:]))) + 1
+            delta = minv[j1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            minv[1:][~used[1:]] -= delta
+            j0 = j1
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    assignment = np.full(count, -1)
+    rows = owner[1:tracks + 1]
+    assignment[rows[rows > 0] - 1] = np.flatnonzero(rows > 0)
+    return assignment
+
+
+def total_benefit(cost, assignment, unassigned_cost=UNASSIGNED_COST):
+    """What the auction maximises: the cost saved over leaving each matched drone idle."""
+    rows = np.flatnonzero(assignment >= 0)
+    return float((unassigned_cost - cost[rows, assignment[rows]]).sum())
+
+
+# ----------------------------------------------------------------------
+# Simulated tracks
+# ----------------------------------------------------------------------
+
+class Tracks:
+    """Targets entering on a circle and heading for the defended zone."""
+
+    def __init__(self, count, radius=TRACK_RADIUS, seed=0):
+        self.radius = radius
+        self.random = random.Random(seed)
+        self.next_id = 0
+        self.ids = []
+        self.positions = np.zeros((0, 3))
+        self.velocities = np.zeros((0, 3))
+        for _ in range(count):
+            self.spawn()
+
+    def spawn(self):
+        bearing = self.random.uniform(0, 2 * math.pi)
+        speed = self.random.uniform(*TRACK_SPEED)
+        position = (self.radius * math.cos(bearing), self.radius * math.sin(bearing),
+                    -self.random.uniform(*TRACK_ALTITUDE))
+        velocity = (-speed * math.cos(bearing), -speed * math.sin(bearing), 0.0)
+        self.ids.append(self.next_id)
+        self.next_id += 1
+        self.positions = np.vstack((self.positions, position))
+        self.velocities = np.vstack((self.velocities, velocity))
+
+    def remove(self, index):
+        del self.ids[index]
+        self.positions = np.delete(self.positions, index, axis=0)
+        self.velocities = np.delete(self.velocities, index, axis=0)
+
+    def step(self, dt):
+        """Move every track; some of them turn a little."""
+        self.positions += self.velocities * dt
+        for k in range(len(self.ids)):
+            if self.random.random() < 0.05:
+                angle = math.radians(self.random.uniform(-TRACK_TURN, TRACK_TURN))
+                c, s = math.cos(angle), math.sin(angle)
+                vn, ve = self.velocities[k, :2]
+                self.velocities[k, :2] = (c * vn - s * ve, s * vn + c * ve)
+
+
+# ----------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------
+
+def shortfall(cost, assignment):
+    """% of the optimal total benefit an assignment misses."""
+    best = total_benefit(cost, optimal_assignment(cost))
+    return 100 * (best - total_benefit(cost, assignment)) / max(best, 1e-9)
+
+
+def bench_case(drones, tracks, seed=0, rounds=20, reference=True):
+    """{cold_ms, warm_ms, gap_pct, ...} for one fleet size (gap only with reference)."""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform((-100, -100, -30), (100, 100, -5), (drones, 3))
+    batteries = rng.uniform(30, 100, drones)
+    targets = rng.uniform((-150, -150, -30), (150, 150, -5), (tracks, 3))
+    velocities = rng.normal(0, 0.5, (tracks, 3)) * (1, 1, 0)
+    speed = speed_limits()[0]
+
+    start = time.perf_counter()
+    cost = assignment_costs(positions, batteries, targets, velocities, speed)
+    cost_ms = (time.perf_counter() - start) * 1000
+
+    assigner = Assigner(budget=None)
+    cold = []
+    for _ in range(max(1, rounds // 4)):
+        assigner.reset()
+        start = time.perf_counter()
+        assignment = assigner.solve(cost)
+        cold.append(time.perf_counter() - start)
+    cold_rounds = assigner.rounds
+    gaps = [shortfall(cost, assignment)] if reference else []
+
+    # A few tracks move each tick; re-solve warm
+    warm, released = [], []
+    changes = min(BENCH_CHANGED, tracks)
+    for _ in range(rounds):
+        changed = rng.choice(tracks, changes, replace=False)
+        targets[changed] += rng.normal(0, 5, (len(changed), 3)) * (1, 1, 0)
+        cost = assignment_costs(positions, batteries, targets, velocities, speed)
+        start = time.perf_counter()
+        assignment = assigner.solve(cost)
+        warm.append(time.perf_counter() - start)
+        released.append(assigner.released)
+        if reference:
+            gaps.append(shortfall(cost, assignment))
+    if max(released) > BENCH_RELEASE_LIMIT * changes:
+        raise AssertionError(f"{drones}x{tracks}: a warm solve re-bid {max(released)} drones "
+                             f"for {changes} changed tracks")
+    return {
+        "cost_ms": cost_ms,
+        "cold_ms": 1000 * float(np.median(cold)),
+        "cold_rounds": cold_rounds,
+        "warm_ms": 1000 * float(np.median(warm)),
+        "warm_max_ms": 1000 * max(warm),
+        "over_budget": sum(t > BUDGET for t in warm),
+        "released": float(np.mean(released)),
+        "gap_pct": max(gaps) if gaps else None,
+    }
+
+
+def run_bench():
+    print(f"{'drones x tracks':>15} {'cost ms':>8} {'cold ms':>8} {'rounds':>7} "
+          f"{'warm ms':>8} {'warm max':>9} {'> budget':>9} {'re-bid':>7} {'gap %':>6}")
+    for drones, tracks in BENCH_SIZES:
+        r = bench_case(drones, tracks)
+        print(f"{f'{drones} x {tracks}':>15} {r['cost_ms']:>8.2f} {r['cold_ms']:>8.2f} "
+              f"{r['cold_rounds']:>7} {r['warm_ms']:>8.2f} {r['warm_max_ms']:>9.2f} "
+              f"{r['over_budget']:>9} "
+              f"{r['released']:>7.1f} {r['gap_pct']:>6.3f}")
+    print(f"warm: {BENCH_CHANGED} tracks moved per tick; > budget: warm solves over "
+          f"{BUDGET * 1000:g} ms (of 20); gap: worst shortfall of a warm or cold solve's "
+          f"total benefit against the exact (Hungarian) optimum")
+
+
+# ----------------------------------------------------------------------
+# Demo
+# ----------------------------------------------------------------------
+
+async def fly(args):
+    swarm = Swarm.from_ports(args.count, args.base_port, args.port_step, verbose=args.verbose)
+    print(f"Connecting to {len(swarm)} vehicles...")
+    missing = await swarm.connect(timeout=args.timeout)
+    if missing:
+        print(f"No heartbeat from: {', '.join(missing)}")
+    if not len(swarm):
+        print("No vehicles connected. Exiting.")
+        return
+    try:
+        await swarm.apply_profile(STREAM_PROFILE, verify=False)
+        if args.takeoff:
+            print(f"GUIDED + arm + takeoff to {args.takeoff}m...")
+            await swarm.set_mode("GUIDED")
+            await swarm.arm()
+            await swarm.takeoff(args.takeoff)
+            if not await wait_altitude(swarm, args.takeoff):
+                print("✗ Not every vehicle reached the takeoff altitude")
+
+        limits = speed_limits()
+        tracks = Tracks(args.tracks, seed=args.seed)
+        assigner = Assigner(budget=args.budget / 1000)
+        drone_ids = [v.name for v in swarm.vehicles]
+        offsets = spawn_offsets(len(swarm))
+        positions = np.empty((len(swarm), 3))
+        batteries = np.empty(len(swarm))
+        stats = {"intercepts": 0, "leaks": 0, "solves": [], "greedy": 0}
+        last = [time.monotonic()]
+
+        def tick():
+            now = time.monotonic()
+            tracks.step(now - last[0])
+            last[0] = now
+            fleet_positions(swarm.vehicles, out=positions)
+            positions[:] += offsets
+            for i, v in enumerate(swarm.vehicles):
+                batteries[i] = v.state.battery_remaining
+
+            # Tracks caught by a drone or reaching the defended zone are replaced
+            if len(tracks.ids):
+                gaps = np.linalg.norm(tracks.positions[None, :, :] - positions[:, None, :], axis=2)
+                caught = gaps.min(axis=0) < INTERCEPT_RADIUS
+                leaked = np.hypot(tracks.positions[:, 0], tracks.positions[:, 1]) < DEFENDED_RADIUS
+                for j in np.flatnonzero(caught | leaked)[::-1]:
+                    if caught[j]:
+                        stats["intercepts"] += 1
+                        if args.verbose:
+                            print(f"  track {tracks.ids[j]} intercepted")
+                    else:
+                        stats["leaks"] += 1
+                        print(f"  ✗ track {tracks.ids[j]} reached the defended zone")
+                    tracks.remove(j)
+                    tracks.spawn()
+
+            cost = assignment_costs(positions, batteries, tracks.positions, tracks.velocities,
+                                    limits[0], homes=offsets)
+            assignment = assigner.solve(cost, drone_ids, tracks.ids)
+            stats["solves"].append(assigner.elapsed)
+            stats["greedy"] += not assigner.complete
+            points = intercept_points(positions, tracks.positions, tracks.velocities,
+                                      limits[0], assignment)
+            if args.output == "position":
+                # Idle drones hold where they are; send_positions is per vehicle frame
+                swarm.send_positions((points - offsets).tolist())
+            else:
+                swarm.send_velocities(pursuit_velocities(positions, points, limits).tolist())
+
+        print(f"{len(swarm)} drones against {args.tracks} tracks for {args.duration:.0f}s, "
+              f"{args.output} setpoints at {args.rate} Hz, {args.budget} ms budget")
+        scheduler = RateScheduler()
+        task = scheduler.add_task(tick, args.rate, "assignment")
+        await scheduler.run_async(args.duration)
+
+        solves = 1000 * np.array(stats["solves"] or [0.0])
+        print(f"✓ {task.runs} ticks: {stats['intercepts']} intercepts, {stats['leaks']} leaks")
+        print(f"Solve: median {np.median(solves):.2f} ms, max {solves.max():.2f} ms, "
+              f"{stats['greedy']} ticks over budget")
+        if args.rtl:
+            print("Returning fleet to launch...")
+            await swarm.set_mode("RTL")
+    finally:
+        swarm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental interceptor-to-track assignment")
+    parser.add_argument("--count", type=int, default=8)
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--port-step", type=int, default=PORT_STEP)
+    parser.add_argument("--timeout", type=float, default=30, help="heartbeat timeout (s)")
+    parser.add_argument("--takeoff", type=float, help="GUIDED, arm and take off to this altitude first")
+    parser.add_argument("--tracks", type=int, default=6, help="simulated targets at a time")
+    parser.add_argument("--seed", type=int, default=0, help="track generator seed")
+    parser.add_argument("--output", choices=("velocity", "position"), default="velocity",
+                        help="pursuit velocities or intercept-point position targets")
+    parser.add_argument("--budget", type=float, default=BUDGET * 1000, help="solve budget per tick (ms)")
+    parser.add_argument("--rate", type=float, default=TICK_RATE, help="tick rate (Hz)")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--rtl", action="store_true", help="RTL at the end")
+    parser.add_argument("--bench", action="store_true", help="time the costs and the auction and exit")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_bench()
+        return
+    try:
+        asyncio.run(fly(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the control stack
+Repeatable numbers for the code paths the control scripts use, measured on
+UDP loopback against fake_vehicle.py (started as a subprocess on its own
+port range, so a running SITL on 14550 is not disturbed):
+
+  decode    messages/s through recv_msg(), a type-filtered recv_match() and
+            VehicleState.pump()
+  encode    cost per call of SimpleController.send_velocity, wasd send_rc,
+            control_drone.send_velocity_ned and plain pymavlink, with the
+            setpoint changing (sent) and unchanged (coalesced), and of the
+            fast encoder with and without a LinkMonitor on the link
+  command   round trip of control_drone.set_mode(), the dispatcher and
+            MavLink.command_long(), and the recv_match() helpers
+  input     key-to-wire latency of the keyboard input pipeline (synthetic
+            key events from a thread, 10 Hz control loop)
+  jitter    RateScheduler start jitter of a pump + setpoint loop at 10/50/100 Hz
+  swarm     connect time, fleet-wide command latency, message rate and CPU
+            for 1..200 vehicles on one event loop
+  planning  cost of one vectorized planner step (formation.py) and one
+            deconflicted separation tick (separation.py) for 10..2000
+            vehicles, geodetic -> NED points/s (geodesy.py), cold and warm
+            200x200 drone-to-track auctions (assignment.py), and minimum-jerk
+            planning and re-planning (trajectory.py), no network
+
+Results are written as JSON; --compare flags every metric that got worse
+than a saved baseline by more than --threshold and exits non-zero.
+
+Usage:
+  python3 benchmark.py --output baseline.json
+  python3 benchmark.py --compare baseline.json
+  python3 benchmark.py --only decode,encode --quick
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from pymavlink import mavutil
+from pymavlink.dialects.v20 import ardupilotmega as mavlink2
+
+import assignment
+import control_drone
+import formation
+import geodesy
+import separation
+import trajectory
+import wasd_control
+from command_dispatcher import dispatcher_for
+from fast_encode import _mcrf4xx, position_target_encoder
+from input_pipeline import Axis, InputPipeline
+from link_monitor import LinkMonitor
+from scheduler import RateScheduler
+from setpoint_stream import SetpointStream
+from vehicle_state import VehicleState
+
+FAKE_VEHICLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_vehicle.py")
+
+# Port ranges for the fake endpoints (clear of the usual 14550.. layout)
+BASE_PORT = 15550
+SWARM_BASE_PORT = 16550
+PORT_STEP = 10
+
+CATEGORIES = ("decode", "encode", "command", "input", "jitter", "swarm", "planning")
+LOOP_RATES = (10, 50, 100)
+SWARM_SIZES = (1, 10, 50, 100, 200)
+
+# Default allowed change before a metric counts as a regression
+THRESHOLD = 0.15
+
+# Frames per datagram in the decode benchmark
+DECODE_BATCH = 64
+
+# Points per call in the geodesy benchmark
+GEODESY_POINTS = 10000
+# Drones x tracks of the assignment benchmark
+ASSIGNMENT_SIZE = (200, 200)
+# Vehicles planned at once in the trajectory benchmark
+TRAJECTORY_VEHICLES = 100
+
+
+def metric(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def fake_vehicles(count, base_port, speedup=1.0):
+    """Run fake_vehicle.py in a subprocess for the duration of the block."""
+    proc = subprocess.Popen([sys.executable, FAKE_VEHICLE, "--count", str(count),
+                             "--base-port", str(base_port), "--port-step", str(PORT_STEP),
+                             "--speedup", str(speedup), "--status-interval", "10"],
+                            stdout=subprocess.DEVNULL)
+    try:
+        yield proc
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _quiet(fn, *args):
+    """Call a helper that prints progress, discarding the output."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+
+# ----------------------------------------------------------------------
+# Decode throughput
+# ----------------------------------------------------------------------
+
+def _telemetry_datagram():
+    """One datagram of a typical telemetry mix from system 1."""
+    mav = mavlink2.MAVLink(None, srcSystem=1, srcComponent=1)
+    frames = []
+    for i in range(DECODE_BATCH // 8):
+        t = i * 20
+        frames += [
+            mav.local_position_ned_encode(t, 1.0, 2.0, -10.0, 0.1, 0.2, 0.0).pack(mav),
+            mav.attitude_encode(t, 0.01, 0.02, 1.5, 0.0, 0.0, 0.0).pack(mav),
+            mav.vfr_hud_encode(1.0, 1.0, 90, 35, 778.0, 0.0).pack(mav),
+            mav.global_position_int_encode(t, -69003000, 1076186000, 778000, 10000,
+                                           0, 0, 0, 9000).pack(mav),
+            mav.servo_output_raw_encode(t * 1000, 0, 1500, 1500, 1500, 1500,
+                                        0, 0, 0, 0).pack(mav),
+            mav.gps_raw_int_encode(t * 1000, 3, -69003000, 1076186000, 778000,
+                                   80, 100, 0, 0, 12).pack(mav),
+            mav.ekf_status_report_encode(0x1FF, 0.1, 0.1, 0.1, 0.1, 0.0).pack(mav),
+            mav.sys_status_encode(0, 0, 0, 500, 12600, -1, -1, 0, 0, 0, 0, 0, 0).pack(mav),
+        ]
+    return b"".join(frames)
+
+
+def _drain_rate(conn, reader, seconds):
+    """Send telemetry datagrams to conn and count what reader() consumes per second."""
+    datagram = _telemetry_datagram()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = ("127.0.0.1", conn.port.getsockname()[1])
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        sender.sendto(datagram, address)
+        count += reader()
+    elapsed = time.perf_counter() - start
+    sender.close()
+    return count / elapsed
+
+
+def bench_decode(seconds):
+    results = {}
+    conn = mavutil.mavlink_connection(f"udpin:127.0.0.1:{_free_port()}")
+
+    def recv_all():
+        n = 0
+        while conn.recv_msg() is not None:
+            n += 1
+        return n
+
+    def recv_filtered():
+        # One wanted type out of eight, like the helpers waiting for VFR_HUD
+        n = 0
+        while conn.recv_match(type='VFR_HUD') is not None:
+            n += 1
+        return n * 8
+
+    state = VehicleState(sysid=1)
+
+    results["decode.recv_msg"] = metric(_drain_rate(conn, recv_all, seconds), "msg/s", "higher")
+    results["decode.recv_match_filtered"] = metric(_drain_rate(conn, recv_filtered, seconds),
+                                                   "msg/s", "higher")
+    results["decode.state_pump"] = metric(
+        _drain_rate(conn, lambda: state.pump(conn), seconds), "msg/s", "higher")
+    conn.close()
+    return results
+
+
+# ----------------------------------------------------------------------
+# Encode and send cost
+# ----------------------------------------------------------------------
+
+def _velocity_sender(conn):
+    """SimpleController.send_velocity on conn.
+
+    simple_control.py needs pynput and, through it, a display at import;
+    without either the benchmark drives the same stream (SetpointStream over
+    the position_target encoder).
+    """
+    stream = SetpointStream(position_target_encoder(conn), name="velocity")
+    fallback = lambda vx: stream.update(10, 0, 0, 0, vx, 0, 0, 0, 0, 0, 0, 0)
+    # Without pynput, importing simple_control would try to pip install it
+    if importlib.util.find_spec("pynput") is None:
+        return fallback
+    try:
+        from simple_control import SimpleController
+    except ImportError:
+        return fallback
+    controller = SimpleController()
+    controller.vehicle = conn
+    controller.velocity_stream = stream
+
+    def send(vx):
+        controller.vx = vx
+        controller.send_velocity()
+    return send
+
+
+def _rc_sender(conn):
+    """wasd_control.send_rc on conn, with a fresh stream for this connection."""
+    wasd_control.rc_stream = None
+
+    def send(throttle):
+        wasd_control.throttle_val = throttle
+        return wasd_control.send_rc(conn)
+    return send
+
+
+def _per_call_us(fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def _sink_connection(sink):
+    conn = mavutil.mavlink_connection(f"udpout:127.0.0.1:{sink.getsockname()[1]}",
+                                      source_system=255)
+    conn.target_system = conn.target_component = 1
+    conn.auto_mavlink_version(b"\xfd")
+    return conn
+
+
+def bench_encode(n):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    conn = _sink_connection(sink)
+    monitored = _sink_connection(sink)
+    LinkMonitor(monitored, "benchmark")
+
+    velocity = _velocity_sender(conn)
+    rc = _rc_sender(conn)
+    fast = position_target_encoder(conn)
+    fast_monitored = position_target_encoder(monitored)
+    cases = {
+        "pymavlink_position_target": lambda i: conn.mav.set_position_target_local_ned_send(
+            10, 1, 1, mavutil.mavlink.MAV_FRAME_LOCAL_NED, 0b0000111111000111,
+            0, 0, 0, (i & 7) * 0.1, 0, 0, 0, 0, 0, 0, 0),
+        "send_velocity_ned": lambda i: control_drone.send_velocity_ned(
+            conn, (i & 7) * 0.1, 0, 0),
+        "send_velocity_changed": lambda i: velocity((i & 7) * 0.1),
+        "send_velocity_unchanged": lambda i: velocity(1.0),
+        "send_rc_changed": lambda i: rc(1400 + (i & 7) * 10),
+        "send_rc_unchanged": lambda i: rc(1500),
+        "fast_position_target": lambda i: fast.send(10, 0, 0, 0, (i & 7) * 0.1,
+                                                    0, 0, 0, 0, 0, 0, 0),
+        "fast_position_target_monitored": lambda i: fast_monitored.send(
+            10, 0, 0, 0, (i & 7) * 0.1, 0, 0, 0, 0, 0, 0, 0),
+    }
+    results = {f"encode.{name}": metric(_per_call_us(fn, n), "us/call", "lower")
+               for name, fn in cases.items()}
+    conn.close()
+    monitored.close()
+    sink.close()
+    return results
+
+
+# ----------------------------------------------------------------------
+# Command round trip and recv_match helpers
+# ----------------------------------------------------------------------
+
+def _ms_stats(prefix, samples):
+    samples = [s * 1000 for s in samples]
+    return {
+        f"{prefix}.p50": metric(statistics.median(samples), "ms", "lower"),
+        f"{prefix}.max": metric(max(samples), "ms", "lower"),
+    }
+
+
+async def _async_command_rtts(port, n):
+    from mav_link import MavLink
+    async with MavLink(f"udpin:127.0.0.1:{port}", verbose=False) as link:
+        await link.wait_heartbeat(10)
+        for _ in range(n):
+            await link.command_long(mavutil.mavlink.MAV_CMD_DO_SET_MODE,
+                                    mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED, 4)
+        return list(link.command_rtts)
+
+
+def bench_command(n):
+    results = {}
+    with fake_vehicles(1, BASE_PORT):
+        vehicle = mavutil.mavlink_connection(f"udpin:127.0.0.1:{BASE_PORT}")
+        vehicle.wait_heartbeat(timeout=10)
+
+        samples = []
+        for _ in range(n):
+            start = time.perf_counter()
+            _quiet(control_drone.set_mode, vehicle, "GUIDED")
+            samples.append(time.perf_counter() - start)
+        results.update(_ms_stats("command.control_drone_set_mode", samples))
+
+        dispatcher = dispatcher_for(vehicle)
+        samples = []
+        for _ in range(n):
+            start = time.perf_counter()
+            dispatcher.command(mavutil.mavlink.MAV_CMD_DO_SET_MODE,
+                               mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED, 4)
+            samples.append(time.perf_counter() - start)
+        results.update(_ms_stats("command.dispatcher", samples))
+
+        samples = []
+        for _ in range(max(n // 5, 3)):
+            start = time.perf_counter()
+            _quiet(control_drone.get_altitude, vehicle)
+            samples.append(time.perf_counter() - start)
+        results.update(_ms_stats("command.get_altitude", samples))
+
+        start = time.perf_counter()
+        _quiet(control_drone.check_ekf_status, vehicle)
+        results["command.check_ekf_status"] = metric(
+            (time.perf_counter() - start) * 1000, "ms", "lower")
+        vehicle.close()
+
+    with fake_vehicles(1, BASE_PORT):
+        samples = asyncio.run(_async_command_rtts(BASE_PORT, n))
+        results.update(_ms_stats("command.mavlink_async", samples))
+    return results
+
+
+# ----------------------------------------------------------------------
+# Keyboard input latency
+# ----------------------------------------------------------------------
+
+def bench_input(presses, rate=10):
+    """Key events from a listener-like thread through InputPipeline onto the wire."""
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    conn = mavutil.mavlink_connection(f"udpout:127.0.0.1:{sink.getsockname()[1]}")
+    conn.target_system = conn.target_component = 1
+    rc = _rc_sender(conn)
+    pipeline = InputPipeline({"roll": Axis("a", "d")},
+                             lambda axes: rc(1500 + round(axes["roll"] * 200)))
+    scheduler = RateScheduler(sleep=pipeline.wait)
+    scheduler.add_task(pipeline.tick, rate, "rc")
+
+    def typist():
+        # Presses land at arbitrary points of the control period
+        for i in range(presses):
+            key = SimpleNamespace(char="ad"[i % 2])
+            time.sleep(0.013 + (i % 7) * 0.009)
+            pipeline.on_press(key)
+            time.sleep(0.02)
+            pipeline.on_release(key)
+        scheduler.stop()
+
+    threading.Thread(target=typist, daemon=True).start()
+    scheduler.run()
+    conn.close()
+    sink.close()
+    latency = pipeline.latency.snapshot(1000)
+    return {
+        "input.key_to_wire.p50": metric(latency.get("p50", 0.0), "ms", "lower"),
+        "input.key_to_wire.p99": metric(latency.get("p99", 0.0), "ms", "lower"),
+    }
+
+
+# ----------------------------------------------------------------------
+# Control-loop jitter
+# ----------------------------------------------------------------------
+
+def bench_jitter(seconds):
+    results = {}
+    with fake_vehicles(1, BASE_PORT):
+        vehicle = mavutil.mavlink_connection(f"udpin:127.0.0.1:{BASE_PORT}")
+        vehicle.wait_heartbeat(timeout=10)
+        state = VehicleState(sysid=vehicle.target_system)
+        for rate in LOOP_RATES:
+            scheduler = RateScheduler()
+
+            def tick():
+                state.pump(vehicle)
+                control_drone.send_velocity_ned(vehicle, 0.5, 0, 0)
+
+            task = scheduler.add_task(tick, rate, f"loop{rate}")
+            scheduler.run(seconds)
+            report = task.report()
+            prefix = f"jitter.{rate}hz"
+            results[f"{prefix}.p50"] = metric(report["jitter_ms"].get("p50", 0.0), "ms", "lower")
+            results[f"{prefix}.p99"] = metric(report["jitter_ms"].get("p99", 0.0), "ms", "lower")
+            results[f"{prefix}.overruns"] = metric(report["overruns"], "count", "lower")
+        vehicle.close()
+    return results
+
+
+# ----------------------------------------------------------------------
+# Swarm scaling
+# ----------------------------------------------------------------------
+
+async def _swarm_round(count, window):
+    from swarm import Swarm
+    swarm = Swarm.from_ports(count, SWARM_BASE_PORT, PORT_STEP)
+    try:
+        start = time.perf_counter()
+        missing = await swarm.connect(timeout=15)
+        connect_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await swarm.set_mode("GUIDED")
+        command_ms = (time.perf_counter() - start) * 1000
+
+        received = sum(v.link.messages_received for v in swarm.vehicles)
+        cpu, wall = time.process_time(), time.perf_counter()
+        await asyncio.sleep(window)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        rate = (sum(v.link.messages_received for v in swarm.vehicles) - received) / wall
+        return {
+            f"swarm.{count}.connected": metric(count - len(missing), "vehicles", "higher"),
+            f"swarm.{count}.connect_s": metric(connect_s, "s", "lower"),
+            f"swarm.{count}.set_mode_ms": metric(command_ms, "ms", "lower"),
+            f"swarm.{count}.msgs_per_s": metric(rate, "msg/s", "higher"),
+            f"swarm.{count}.cpu_pct": metric(100 * cpu / wall, "%", "lower"),
+        }
+    finally:
+        swarm.close()
+
+
+def bench_swarm(max_vehicles, window):
+    results = {}
+    for count in (n for n in SWARM_SIZES if n <= max_vehicles):
+        with fake_vehicles(count, SWARM_BASE_PORT):
+            results.update(asyncio.run(_swarm_round(count, window)))
+        print(f"  {count} vehicles: {results[f'swarm.{count}.msgs_per_s']['value']:.0f} msg/s, "
+              f"{results[f'swarm.{count}.cpu_pct']['value']:.1f}% CPU")
+    return results
+
+
+def bench_planning(rounds):
+    results = {}
+    for count in formation.BENCH_SIZES:
+        results[f"planning.formation.{count}.step_us"] = metric(
+            formation.bench_step(count, rounds), "us/step", "lower")
+    print("  formation step: " + ", ".join(
+        f"{count}: {results[f'planning.formation.{count}.step_us']['value']:.0f} us"
+        for count in formation.BENCH_SIZES))
+    for count in separation.BENCH_SIZES:
+        results[f"planning.separation.{count}.tick_us"] = metric(
+            separation.bench_tick(count, max(1, rounds // 10), brute_force=False)["tick_us"], "us/tick", "lower")
+    print("  separation tick: " + ", ".join(
+        f"{count}: {results[f'planning.separation.{count}.tick_us']['value']:.0f} us"
+        for count in separation.BENCH_SIZES))
+    rates = geodesy.bench(geodesy.local_frame(), GEODESY_POINTS, max(1, rounds // 100))
+    for mode in ("exact", "fast"):
+        results[f"planning.geodesy.{mode}.pts_per_s"] = metric(
+            rates[("lla->ned", mode)], "pts/s", "higher")
+    print(f"  geodesy lla->ned: exact {rates[('lla->ned', 'exact')]:,.0f}, "
+          f"fast {rates[('lla->ned', 'fast')]:,.0f} pts/s")
+    drones, tracks = ASSIGNMENT_SIZE
+    case = assignment.bench_case(drones, tracks, rounds=max(4, rounds // 100), reference=False)
+    for phase in ("cold", "warm"):
+        results[f"planning.assignment.{drones}x{tracks}.{phase}_ms"] = metric(
+            case[f"{phase}_ms"], "ms", "lower")
+    print(f"  assignment {drones}x{tracks}: cold {case['cold_ms']:.1f} ms, "
+          f"warm {case['warm_ms']:.1f} ms")
+    timing = trajectory.bench_plan(TRAJECTORY_VEHICLES, max(2, rounds // 200))
+    results[f"planning.trajectory.{TRAJECTORY_VEHICLES}.plan_ms"] = metric(timing["plan_ms"], "ms", "lower")
+    results["planning.trajectory.replan_us"] = metric(timing["replan_us"], "us", "lower")
+    print(f"  trajectory: {TRAJECTORY_VEHICLES} vehicles planned in {timing['plan_ms']:.1f} ms, "
+          f"one re-planned in {timing['replan_us']:.0f} us")
+    return results
+
+
+# ----------------------------------------------------------------------
+# Reports
+# ----------------------------------------------------------------------
+
+def environment():
+    return {
+        "time": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "crc": "fastcrc" if _mcrf4xx is not None else "python",
+    }
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """Print a comparison table; returns the names of regressed metrics."""
+    regressions = []
+    print(f"\n{'metric':<44} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, entry in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        old, new = base["value"], entry["value"]
+        change = (new - old) / abs(old) if old else 0.0
+        worse = change < -threshold if entry["better"] == "higher" else change > threshold
+        # Tiny absolute values (sub-0.1 ms jitter, zero overruns) are noise
+        if entry["unit"] in ("ms", "count") and abs(new - old) < 0.5:
+            worse = False
+        if worse:
+            regressions.append(name)
+        print(f"{'✗' if worse else '✓'} {name:<42} {old:>11.2f} {new:>11.2f} {change:>+7.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the control stack on loopback")
+    parser.add_argument("--only", help=f"comma-separated subset of {', '.join(CATEGORIES)}")
+    parser.add_argument("--quick", action="store_true", help="shorter runs, up to 50 vehicles")
+    parser.add_argument("--max-vehicles", type=int, default=max(SWARM_SIZES))
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a saved run")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="relative change counted as a regression (default 0.15)")
+    args = parser.parse_args()
+
+    selected = args.only.split(",") if args.only else CATEGORIES
+    seconds = 1.0 if args.quick else 3.0
+    max_vehicles = min(args.max_vehicles, 50) if args.quick else args.max_vehicles
+    runners = {
+        "decode": lambda: bench_decode(seconds),
+        "encode": lambda: bench_encode(5000 if args.quick else 50000),
+        "command": lambda: bench_command(20 if args.quick else 100),
+        "input": lambda: bench_input(40 if args.quick else 200),
+        "jitter": lambda: bench_jitter(seconds),
+        "swarm": lambda: bench_swarm(max_vehicles, seconds),
+        "planning": lambda: bench_planning(200 if args.quick else 2000),
+    }
+
+    results = {}
+    for name in selected:
+        print(f"Running {name}...")
+        results.update(runners[name]())
+
+    print(f"\n{'metric':<44} {'value':>11}  unit")
+    for name, entry in results.items():
+        print(f"  {name:<42} {entry['value']:>11.2f}  {entry['unit']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=1)
+        print(f"\n✓ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✓ No regressions")
+
+
+if __name__ == "__main__":
+    main()
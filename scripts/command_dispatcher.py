@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Command dispatcher with ACK correlation
+Every COMMAND_LONG is tracked by (target system, target component, command)
+until the COMMAND_ACK with the same triple arrives, so an ACK left over from
+an earlier command is never taken as the answer to a new one, and any number
+of commands can be outstanding at once. A command without an answer is
+resent with its confirmation field incremented, as the MAVLink command
+protocol asks; MAV_RESULT_IN_PROGRESS extends the wait without a resend.
+
+ACKs carry no request ID, so two outstanding commands with the same triple
+are answered by the same ACK.
+
+Blocking scripts use dispatcher_for(vehicle) and wait(); ACKs are picked up
+by whatever reads the connection (the wait itself, or another thread's
+recv_msg loop). Asyncio code awaits command_async(); mav_link.MavLink owns
+a dispatcher and feeds it from its reader.
+
+Usage:
+  python3 command_dispatcher.py --count 20        # fleet-wide arm/disarm timing
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+
+from pymavlink import mavutil
+
+# Wait per attempt (s) and resends after the first attempt
+ACK_TIMEOUT = 1.0
+RETRIES = 2
+
+# Slice used by blocking waits between checks (s)
+WAIT_SLICE = 0.05
+
+
+class PendingCommand:
+    """One outstanding command; ack is the COMMAND_ACK, or None on timeout."""
+
+    __slots__ = ("key", "params", "timeout", "retries", "attempts", "sent", "first_sent",
+                 "deadline", "ack", "done", "_event", "_callbacks")
+
+    def __init__(self, key, params, timeout, retries):
+        self.key = key
+        self.params = params
+        self.timeout = timeout
+        self.retries = retries
+        self.attempts = 0
+        self.sent = self.first_sent = self.deadline = None
+        self.ack = None
+        self.done = False
+        self._event = threading.Event()
+        self._callbacks = []
+
+    @property
+    def accepted(self):
+        return self.ack is not None and self.ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED
+
+    @property
+    def rtt(self):
+        """Seconds from the last send to the ACK (None if unanswered)."""
+        return self.ack._received - self.sent if self.ack is not None else None
+
+    def add_done_callback(self, callback):
+        if self.done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _finish(self, ack):
+        self.ack = ack
+        self.done = True
+        self._event.set()
+        for callback in self._callbacks:
+            callback(self)
+        self._callbacks.clear()
+
+
+class CommandDispatcher:
+    """Outstanding COMMAND_LONGs on one connection, keyed by (system, component, command).
+
+    With hook=True the dispatcher sees ACKs through pymavlink's parse
+    callback, whoever reads the connection; otherwise call on_ack() for each
+    COMMAND_ACK (MavLink subscribes it).
+    """
+
+    def __init__(self, conn, timeout=ACK_TIMEOUT, retries=RETRIES, hook=True):
+        self.conn = conn
+        self.timeout = timeout
+        self.retries = retries
+        self.outstanding = {}   # key -> [PendingCommand]
+        self.resends = 0
+        self.timeouts = 0
+        self._lock = threading.RLock()
+        if hook:
+            mav = conn.mav
+            self._chained = (mav.callback, mav.callback_args, mav.callback_kwargs)
+            mav.set_callback(self._on_receive)
+
+    def _on_receive(self, msg, *args, **kwargs):
+        if msg.get_type() == 'COMMAND_ACK':
+            self.on_ack(msg)
+        callback, cargs, ckwargs = self._chained
+        if callback is not None:
+            callback(msg, *cargs, **ckwargs)
+
+    # ------------------------------------------------------------------
+    # Sending and matching
+    # ------------------------------------------------------------------
+
+    def send(self, command, *params, target_system=None, target_component=None,
+             timeout=None, retries=None):
+        """Send a COMMAND_LONG and return its PendingCommand."""
+        system = self.conn.target_system if target_system is None else target_system
+        component = self.conn.target_component if target_component is None else target_component
+        params = (list(params) + [0] * 7)[:7]
+        pending = PendingCommand((system, component, command), params,
+                                 self.timeout if timeout is None else timeout,
+                                 self.retries if retries is None else retries)
+        with self._lock:
+            self.outstanding.setdefault(pending.key, []).append(pending)
+            self._transmit(pending, time.monotonic())
+        return pending
+
+    def _transmit(self, pending, now):
+        system, component, command = pending.key
+        # confirmation: 0 on the first send, incremented on every resend
+        self.conn.mav.command_long_send(system, component, command, pending.attempts,
+                                        *pending.params)
+        pending.attempts += 1
+        pending.sent = now
+        if pending.first_sent is None:
+            pending.first_sent = now
+        pending.deadline = now + pending.timeout
+
+    def on_ack(self, msg):
+        system, component = msg.get_srcSystem(), msg.get_srcComponent()
+        with self._lock:
+            # Commands sent to component 0 (broadcast) are answered by the autopilot
+            key = (system, component, msg.command)
+            waiting = self.outstanding.get(key) or self.outstanding.get((system, 0, msg.command))
+            if not waiting:
+                return
+            now = time.monotonic()
+            if msg.result == mavutil.mavlink.MAV_RESULT_IN_PROGRESS:
+                for pending in waiting:
+                    pending.deadline = now + pending.timeout
+                return
+            del self.outstanding[waiting[0].key]
+        msg._received = now
+        for pending in waiting:
+            pending._finish(msg)
+
+    def poll(self, now=None):
+        """Resend or give up on commands past their deadline; returns the next deadline."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        next_deadline = None
+        with self._lock:
+            for key, waiting in list(self.outstanding.items()):
+                for pending in list(waiting):
+                    if now >= pending.deadline:
+                        if pending.attempts > pending.retries:
+                            waiting.remove(pending)
+                            expired.append(pending)
+                            continue
+                        self._transmit(pending, now)
+                        self.resends += 1
+                    if next_deadline is None or pending.deadline < next_deadline:
+                        next_deadline = pending.deadline
+                if not waiting:
+                    del self.outstanding[key]
+        self.timeouts += len(expired)
+        for pending in expired:
+            pending._finish(None)
+        return next_deadline
+
+    # ------------------------------------------------------------------
+    # Blocking use
+    # ------------------------------------------------------------------
+
+    def wait(self, pending, read=True):
+        """Block until pending (a PendingCommand or a list of them) is answered or expires.
+
+        With read=True the wait reads the connection itself; use read=False
+        when another thread is already reading it.
+        """
+        waiting = pending if isinstance(pending, (list, tuple)) else [pending]
+        while not all(p.done for p in waiting):
+            self.poll()
+            if read:
+                self.conn.recv_match(blocking=True, timeout=WAIT_SLICE)
+            else:
+                next(p for p in waiting if not p.done)._event.wait(WAIT_SLICE)
+        return pending.ack if pending is not waiting else [p.ack for p in waiting]
+
+    def command(self, command, *params, read=True, **kwargs):
+        """Send one command and block for its ACK (None on timeout)."""
+        return self.wait(self.send(command, *params, **kwargs), read)
+
+    # ------------------------------------------------------------------
+    # Asyncio use
+    # ------------------------------------------------------------------
+
+    async def command_async(self, command, *params, **kwargs):
+        """Send one command and await it; returns the finished PendingCommand."""
+        loop = asyncio.get_running_loop()
+        pending = self.send(command, *params, **kwargs)
+        future = loop.create_future()
+        pending.add_done_callback(
+            lambda p: future.done() or future.set_result(p.ack))
+        while not future.done():
+            delay = max(pending.deadline - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(asyncio.shield(future), delay)
+            except asyncio.TimeoutError:
+                self.poll()
+        return pending
+
+
+def dispatcher_for(conn):
+    """The connection's dispatcher, created on first use (hooks the parser)."""
+    dispatcher = conn.__dict__.get("_command_dispatcher")
+    if dispatcher is None:
+        dispatcher = conn.__dict__["_command_dispatcher"] = CommandDispatcher(conn)
+    return dispatcher
+
+
+def command_accepted(vehicle, command, *params, read=True, **kwargs):
+    """Send a command on a mavutil connection; True if it was ACKed as accepted."""
+    ack = dispatcher_for(vehicle).command(command, *params, read=read, **kwargs)
+    return bool(ack and ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED)
+
+
+# ----------------------------------------------------------------------
+# Fleet timing against fake_vehicle.py or SITL
+# ----------------------------------------------------------------------
+
+async def run(args):
+    from swarm import Swarm
+    swarm = Swarm.from_ports(args.count, args.base_port, args.port_step)
+    print(f"Connecting to {len(swarm)} vehicles...")
+    await swarm.connect(timeout=args.timeout)
+    print(f"✓ {len(swarm)} vehicles connected")
+    try:
+        for label, action in (("GUIDED", lambda: swarm.set_mode("GUIDED")),
+                              ("arm", swarm.arm), ("disarm", swarm.disarm)):
+            start = time.monotonic()
+            results = await action()
+            elapsed = time.monotonic() - start
+            ok = sum(r is True for r in results.values())
+            print(f"{'✓' if ok == len(results) else '✗'} {label:<7} {ok}/{len(results)} "
+                  f"accepted in {elapsed * 1000:.1f} ms")
+    finally:
+        swarm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time fleet-wide commands through the dispatcher")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--base-port", type=int, default=14550)
+    parser.add_argument("--port-step", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30, help="heartbeat timeout (s)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,15 +8,36 @@ import time
 import sys
 from pymavlink import mavutil
 
+from command_dispatcher import command_accepted
+from fast_encode import encoder_for
+import phase_profiler
+from phase_profiler import profiled
+from stream_profiles import apply_profile
+from vehicle_state import VFR_HUD, VehicleState
+import waits
+
 # Connection string for SITL
 # This connects to the MAVProxy output port
 CONNECTION_STRING = "udp:127.0.0.1:14550"
 
+# Mission waits (timeouts are in simulated seconds)
+TAKEOFF_ALTITUDE = 10
+ALTITUDE_TOLERANCE = 0.3
+WAYPOINT_RADIUS = 1.0
+READY_TIMEOUT = 30
+TAKEOFF_TIMEOUT = 60
+WAYPOINT_TIMEOUT = 90
+LANDING_TIMEOUT = 180
+
+# Telemetry requested from the vehicle (see stream_profiles.py)
+STREAM_PROFILE = "mission"
+
 
+@profiled("heartbeat")
 def connect_to_vehicle():
     """Connect to the vehicle and wait for heartbeat."""
     print(f"Connecting to vehicle on {CONNECTION_STRING}...")
-    vehicle = mavutil.mavlink_connection(CONNECTION_STRING)
+    vehicle = phase_profiler.watch(mavutil.mavlink_connection(CONNECTION_STRING))
     
     # Wait for the first heartbeat
     print("Waiting for heartbeat...")
@@ -25,21 +46,13 @@ def connect_to_vehicle():
     return vehicle
 
 
+@profiled("arm")
 def arm_vehicle(vehicle):
     """Arm the vehicle."""
     print("Arming vehicle...")
-    vehicle.mav.command_long_send(
-        vehicle.target_system,
-        vehicle.target_component,
-        mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
-        0,  # confirmation
-        1,  # arm (1 to arm, 0 to disarm)
-        0, 0, 0, 0, 0, 0
-    )
-    
-    # Wait for ACK
-    ack = vehicle.recv_match(type='COMMAND_ACK', blocking=True, timeout=3)
-    if ack and ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED:
+    # Waits for the COMMAND_ACK of this command, retrying if none arrives
+    if command_accepted(vehicle, mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                        1):  # arm (1 to arm, 0 to disarm)
         print("Vehicle armed!")
         return True
     else:
@@ -47,6 +60,7 @@ def arm_vehicle(vehicle):
         return False
 
 
+@profiled(lambda vehicle, mode: f"set_mode {mode}")
 def set_mode(vehicle, mode):
     """Set the flight mode."""
     print(f"Setting mode to {mode}...")
@@ -60,19 +74,9 @@ def set_mode(vehicle, mode):
     mode_id = vehicle.mode_mapping()[mode]
     
     # Use DO_SET_MODE command instead of set_mode_send
-    vehicle.mav.command_long_send(
-        vehicle.target_system,
-        vehicle.target_component,
-        mavutil.mavlink.MAV_CMD_DO_SET_MODE,
-        0,  # confirmation
-        mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,  # param1: mode
-        mode_id,  # param2: custom mode
-        0, 0, 0, 0, 0  # params 3-7
-    )
-    
-    # Wait for ACK
-    ack = vehicle.recv_match(type='COMMAND_ACK', blocking=True, timeout=3)
-    if ack and ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED:
+    if command_accepted(vehicle, mavutil.mavlink.MAV_CMD_DO_SET_MODE,
+                        mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,  # param1: mode
+                        mode_id):  # param2: custom mode
         print(f"Mode set to {mode}")
         return True
     else:
@@ -80,22 +84,14 @@ def set_mode(vehicle, mode):
         return False
 
 
+@profiled("takeoff_command")
 def takeoff(vehicle, altitude):
     """Command the vehicle to take off to specified altitude (meters)."""
     print(f"Taking off to {altitude} meters...")
-    vehicle.mav.command_long_send(
-        vehicle.target_system,
-        vehicle.target_component,
-        mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
-        0,  # confirmation
-        0, 0, 0, 0,  # params 1-4
-        0, 0,  # latitude, longitude (0 = current position)
-        altitude  # altitude
-    )
-    
-    # Wait for ACK
-    ack = vehicle.recv_match(type='COMMAND_ACK', blocking=True, timeout=3)
-    if ack and ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED:
+    if command_accepted(vehicle, mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
+                        0, 0, 0, 0,  # params 1-4
+                        0, 0,  # latitude, longitude (0 = current position)
+                        altitude):  # altitude
         print("Takeoff command accepted")
         return True
     else:
@@ -124,21 +120,26 @@ def goto_position_ned(vehicle, north, east, down):
     )
 
 
+def send_velocity_ned(vehicle, vx, vy, vz):
+    """
+    Send a velocity setpoint in the local NED frame.
+    vx, vy, vz in m/s; must be repeated (ArduPilot stops after ~3 s without one)
+    """
+    encoder_for(vehicle, "position_target").send(
+        10,  # time_boot_ms (not used)
+        0, 0, 0,  # position (not used)
+        vx, vy, vz,  # velocity
+        0, 0, 0,  # acceleration (not used)
+        0, 0  # yaw, yaw_rate (not used)
+    )
+
+
+@profiled("disarm")
 def disarm_vehicle(vehicle):
     """Disarm the vehicle."""
     print("Disarming vehicle...")
-    vehicle.mav.command_long_send(
-        vehicle.target_system,
-        vehicle.target_component,
-        mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
-        0,  # confirmation
-        0,  # disarm
-        0, 0, 0, 0, 0, 0
-    )
-    
-    # Wait for ACK
-    ack = vehicle.recv_match(type='COMMAND_ACK', blocking=True, timeout=3)
-    if ack and ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED:
+    if command_accepted(vehicle, mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                        0):  # disarm
         print("Vehicle disarmed!")
         return True
     else:
@@ -146,14 +147,23 @@ def disarm_vehicle(vehicle):
         return False
 
 
-def get_altitude(vehicle):
-    """Get current altitude from VFR_HUD."""
+def get_altitude(vehicle, state=None):
+    """Get current altitude from VFR_HUD.
+
+    If a VehicleState is given and holds a recent VFR_HUD, it is returned
+    without touching the socket.
+    """
+    if state is not None:
+        state.pump(vehicle)
+        if state.fresh(VFR_HUD):
+            return state.alt
     msg = vehicle.recv_match(type='VFR_HUD', blocking=True, timeout=1)
     if msg:
         return msg.alt
     return None
 
 
+@profiled("gps_lock")
 def check_gps_lock(vehicle, timeout=30):
     """Wait for GPS 3D lock."""
     print("Waiting for GPS lock...")
@@ -172,6 +182,7 @@ def check_gps_lock(vehicle, timeout=30):
     return False
 
 
+@profiled("ekf_check")
 def check_ekf_status(vehicle):
     """Check if EKF is healthy."""
     print("Checking EKF status...")
@@ -183,7 +194,8 @@ def check_ekf_status(vehicle):
     return True  # Continue anyway for simulation
 
 
-def wait_until_ready(vehicle):
+@profiled("readiness")
+def wait_until_ready(vehicle, state=None, clock=None):
     """Wait for vehicle to be ready for flight."""
     print("\n=== Checking vehicle readiness ===")
     
@@ -194,9 +206,12 @@ def wait_until_ready(vehicle):
     # Check EKF
     check_ekf_status(vehicle)
     
-    # Wait for system status
-    print("Waiting for system to be ready...")
-    time.sleep(3)
+    # Wait for the EKF to report a usable position solution
+    if state is None:
+        state = VehicleState(sysid=vehicle.target_system)
+    if not waits.wait_until(vehicle, state, waits.ekf_healthy(), READY_TIMEOUT, clock,
+                            "EKF flags healthy"):
+        print("WARNING: EKF not fully healthy, but continuing for simulation...")
     
     print("=== Vehicle ready! ===\n")
     return True
@@ -204,12 +219,23 @@ def wait_until_ready(vehicle):
 
 def main():
     """Main control sequence."""
+    phase_profiler.enable_from_env("control_drone")
     try:
         # Connect to vehicle
         vehicle = connect_to_vehicle()
+        with phase_profiler.phase("stream_profile"):
+            profile_ok = apply_profile(vehicle, STREAM_PROFILE)
+        if not profile_ok:
+            print("WARNING: stream profile not fully applied, continuing with vehicle defaults")
+        state = VehicleState(sysid=vehicle.target_system)
+        clock = waits.SimClock.from_param_file()
+        
+        def wait_for(predicate, timeout, description):
+            with phase_profiler.phase(description):
+                return waits.wait_until(vehicle, state, predicate, timeout, clock, description)
         
         # Wait for vehicle to be ready
-        if not wait_until_ready(vehicle):
+        if not wait_until_ready(vehicle, state, clock):
             print("Vehicle not ready. Exiting.")
             return
         
@@ -220,10 +246,9 @@ def main():
             print("Trying alternative method...")
             # Try using mavutil.mode_string_v10
             vehicle.set_mode('GUIDED')
-            time.sleep(2)
-            print("Check if mode changed in MAVProxy/QGC")
+            if not wait_for(waits.mode_is("GUIDED"), 5, "GUIDED mode"):
+                print("Check if mode changed in MAVProxy/QGC")
         
-        time.sleep(1)
         
         # Arm the vehicle
         if not arm_vehicle(vehicle):
@@ -233,42 +258,45 @@ def main():
             print("Exiting.")
             return
         
-        time.sleep(2)
+        wait_for(waits.armed(), 5, "armed heartbeat")
         
         # Takeoff
-        if not takeoff(vehicle, 10):
+        if not takeoff(vehicle, TAKEOFF_ALTITUDE):
             print("Takeoff failed. Exiting.")
             return
         
         # Wait for takeoff to complete
-        print("Waiting for takeoff to 10m...")
-        time.sleep(15)
+        wait_for(waits.altitude_reached(TAKEOFF_ALTITUDE, ALTITUDE_TOLERANCE),
+                 TAKEOFF_TIMEOUT, f"takeoff to {TAKEOFF_ALTITUDE}m")
+        phase_profiler.mark("airborne")
         
         # Check altitude
-        alt = get_altitude(vehicle)
+        alt = get_altitude(vehicle, state)
         if alt:
             print(f"Current altitude: {alt:.1f}m")
         
         # Move forward 20 meters
         print("\nMoving forward 20 meters...")
         goto_position_ned(vehicle, 20, 0, -10)
-        time.sleep(10)
+        wait_for(waits.position_reached(20, 0, -10, WAYPOINT_RADIUS),
+                 WAYPOINT_TIMEOUT, "waypoint N=20 E=0")
         
         # Move right 10 meters
         print("\nMoving right 10 meters...")
         goto_position_ned(vehicle, 20, 10, -10)
-        time.sleep(10)
+        wait_for(waits.position_reached(20, 10, -10, WAYPOINT_RADIUS),
+                 WAYPOINT_TIMEOUT, "waypoint N=20 E=10")
         
         # Return to launch
         print("\nReturning to launch...")
         set_mode(vehicle, "RTL")
         
-        # Wait for landing
-        print("Waiting for landing...")
-        time.sleep(20)
+        # Wait for landing (RTL disarms automatically after touchdown)
+        wait_for(waits.landed_and_disarmed(), LANDING_TIMEOUT, "landing and disarm")
         
         # Disarm
-        disarm_vehicle()
+        if state.armed:
+            disarm_vehicle(vehicle)
         
         print("\nMission complete!")
         
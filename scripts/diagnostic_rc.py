@@ -6,30 +6,49 @@ Diagnostic - Check if RC override is being received by ArduPilot
 import time
 from pymavlink import mavutil
 
+from link_monitor import LinkMonitor
+import phase_profiler
+from phase_profiler import phase
+from stream_profiles import apply_profile
+
 CONNECTION = "udp:127.0.0.1:14551"
 
+# PHASE_PROFILE=<dir> times each step (see phase_profiler.py)
+phase_profiler.enable_from_env("diagnostic_rc")
+
 print("="*60)
 print("RC OVERRIDE DIAGNOSTIC")
 print("="*60)
 
-vehicle = mavutil.mavlink_connection(CONNECTION)
-vehicle.wait_heartbeat()
-print(f"\n✓ Connected to system {vehicle.target_system}")
+with phase("connect"):
+    vehicle = phase_profiler.watch(mavutil.mavlink_connection(CONNECTION))
+    vehicle.wait_heartbeat()
+    print(f"\n✓ Connected to system {vehicle.target_system}")
+
+# Loss, TIMESYNC round trip and command ACK latency for the summary below
+monitor = LinkMonitor(vehicle, "diagnostic")
+
+# High-rate SERVO_OUTPUT_RAW and RC_CHANNELS, everything else off
+with phase("stream_profile"):
+    apply_profile(vehicle, "diagnostic")
 
 # Set STABILIZE
-mode_id = vehicle.mode_mapping()['STABILIZE']
-vehicle.set_mode(mode_id)
-time.sleep(2)
-print("✓ STABILIZE mode")
+with phase("set_mode STABILIZE"):
+    mode_id = vehicle.mode_mapping()['STABILIZE']
+    vehicle.set_mode(mode_id)
+    time.sleep(2)
+    print("✓ STABILIZE mode")
 
 # Arm
-print("\nArming...")
-vehicle.mav.command_long_send(
-    vehicle.target_system, vehicle.target_component,
-    mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
-    0, 1, 0, 0, 0, 0, 0, 0)
-time.sleep(3)
-print("✓ Armed")
+with phase("arm"):
+    print("\nArming...")
+    vehicle.mav.command_long_send(
+        vehicle.target_system, vehicle.target_component,
+        mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+        0, 1, 0, 0, 0, 0, 0, 0)
+    time.sleep(3)
+    print("✓ Armed")
+    phase_profiler.mark("armed")
 
 print("\n" + "="*60)
 print("Sending RC override and monitoring servo output...")
@@ -37,23 +56,26 @@ print("If working, you should see SERVO_OUTPUT_RAW messages")
 print("="*60 + "\n")
 
 # Send RC override and listen for servo output
-for i in range(10):
-    # Send RC override
-    vehicle.mav.rc_channels_override_send(
-        vehicle.target_system, vehicle.target_component,
-        1500, 1500, 1600, 1500, 0, 0, 0, 0)
+with phase("rc_override_check"):
+    for i in range(10):
+        # Send RC override
+        vehicle.mav.rc_channels_override_send(
+            vehicle.target_system, vehicle.target_component,
+            1500, 1500, 1600, 1500, 0, 0, 0, 0)
     
-    # Try to read servo output
-    msg = vehicle.recv_match(type='SERVO_OUTPUT_RAW', blocking=True, timeout=0.5)
-    if msg:
-        print(f"Servo 1: {msg.servo1_raw}, Servo 2: {msg.servo2_raw}, " +
-              f"Servo 3: {msg.servo3_raw}, Servo 4: {msg.servo4_raw}")
-    else:
-        print(f"{i+1}. No SERVO_OUTPUT_RAW received")
+        # Try to read servo output
+        msg = vehicle.recv_match(type='SERVO_OUTPUT_RAW', blocking=True, timeout=0.5)
+        if msg:
+            print(f"Servo 1: {msg.servo1_raw}, Servo 2: {msg.servo2_raw}, " +
+                  f"Servo 3: {msg.servo3_raw}, Servo 4: {msg.servo4_raw}")
+        else:
+            print(f"{i+1}. No SERVO_OUTPUT_RAW received")
     
-    time.sleep(0.5)
+        time.sleep(0.5)
 
 print("\n" + "="*60)
 print("If you see servo values changing, RC override is working")
 print("If you see 'No SERVO_OUTPUT_RAW', there's a communication issue")
 print("="*60)
+print("\nLink health:")
+print(monitor.summary())
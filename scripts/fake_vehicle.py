@@ -0,0 +1,1117 @@
+#!/usr/bin/env python3
+"""
+Fake vehicle: a lightweight stand-in for AirSim + ArduPilot SITL
+A point-mass copter that speaks the MAVLink subset the scripts use:
+heartbeat, COMMAND_LONG with COMMAND_ACK (arm/disarm, DO_SET_MODE, takeoff,
+land, RTL, SET_MESSAGE_INTERVAL, REQUEST_MESSAGE), SET_MODE,
+REQUEST_DATA_STREAM, the parameter protocol, the mission protocol with AUTO
+mode (takeoff, waypoints, loiter, land, RTL, speed changes), TIMESYNC, RC
+override, position and velocity targets, and VFR_HUD / GPS_RAW_INT / EKF_STATUS_REPORT /
+SERVO_OUTPUT_RAW / position and attitude telemetry streams (SYS_STATUS,
+RC_CHANNELS and MISSION_CURRENT on request). SYS_STATUS reports a battery
+that drains while armed; --battery sets the lowest starting charge. A position
+target carrying a velocity is tracked with that velocity as feed-forward.
+
+Like a MAVProxy --out, each vehicle sends to a script's listening port from
+its own socket, so the scripts connect to it unchanged. All vehicles share
+one timer on one asyncio loop, which keeps hundreds of them in one process.
+
+Flight behaviour follows the parameter table (WPNAV speeds and acceleration,
+LAND_SPEED, SITL's SIM_WIND_SPD/DIR/TURB wind, ...), which boots with config/ardupilot/airsim.parm applied and
+can be changed with PARAM_SET. Time runs at --speedup times wall time; stream rates and
+time_boot_ms follow simulated time, as they do in SITL.
+
+Usage:
+  python3 fake_vehicle.py                          # one copter -> udp:127.0.0.1:14550
+  python3 fake_vehicle.py --count 50 --speedup 5   # 50 copters -> 14550, 14560, ...
+  python3 fake_vehicle.py --listen                 # wait on 14550 for a udpout: client
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import struct
+import time
+from collections import deque
+
+from pymavlink import mavutil
+from pymavlink.dialects.v20 import ardupilotmega as mavlink2
+
+from geodesy import local_frame
+from scheduler import RateScheduler
+import waits
+
+TARGET_HOST = "127.0.0.1"
+BASE_PORT = 14550
+PORT_STEP = 10
+
+# AirSim OriginGeopoint (config/airsim/settings.json)
+HOME_LAT = -6.9003
+HOME_LON = 107.6186
+HOME_ALT = 768.0
+
+# Wall-clock rate of the shared physics/stream timer
+TICK_RATE = 50
+# Longest physics substep (simulated seconds)
+MAX_STEP = 0.1
+# Most frames of one stream sent in a single tick
+MAX_BURST = 16
+
+# Simulated seconds after boot before GPS 3D fix and a healthy EKF
+GPS_FIX_DELAY = 2.0
+EKF_READY_DELAY = 4.0
+
+# GUIDED velocity targets and RC override expire like ArduPilot's (3 s)
+TARGET_TIMEOUT = 3.0
+# Speed limit for velocity targets and full RC stick deflection (m/s)
+MAX_SPEED = 10.0
+# Position controller gain (1/s)
+POSITION_GAIN = 1.0
+
+# Wind: drift per m/s of wind the position controller has not trimmed out
+# yet, the time its integrator takes to trim a change out (s), drag on the
+# airframe (1/s, for the lean into the wind) and the time constant of gusts (s)
+WIND_DRIFT = 0.3
+WIND_TRIM_TIME = 3.0
+WIND_DRAG = 0.1
+GUST_TIME = 2.0
+
+GRAVITY = 9.81
+HOVER_THROTTLE = 35
+
+# Battery: simulated seconds of armed flight from full to empty, and the
+# voltage of a full and an empty 3S pack (V)
+BATTERY_ENDURANCE = 1200.0
+BATTERY_FULL = 12.6
+BATTERY_EMPTY = 10.5
+
+# Default telemetry rates (Hz of simulated time)
+STREAM_RATES = {
+    "HEARTBEAT": 1,
+    "GPS_RAW_INT": 5,
+    "GLOBAL_POSITION_INT": 5,
+    "LOCAL_POSITION_NED": 5,
+    "ATTITUDE": 10,
+    "VFR_HUD": 5,
+    "EKF_STATUS_REPORT": 2,
+    "SERVO_OUTPUT_RAW": 5,
+}
+
+# ArduCopter defaults for the parameters the model uses; airsim.parm overrides
+PARAM_DEFAULTS = {
+    "WPNAV_SPEED": 500,      # cm/s
+    "WPNAV_SPEED_UP": 250,
+    "WPNAV_SPEED_DN": 150,
+    "WPNAV_ACCEL": 250,      # cm/s/s
+    "WPNAV_ACCEL_Z": 100,
+    "LAND_SPEED": 50,
+    "RTL_ALT": 1500,         # cm
+    "ANGLE_MAX": 3000,       # cdeg
+    "ATC_RATE_Y_MAX": 90,    # deg/s
+    "DISARM_DELAY": 10,      # s
+    "WPNAV_RADIUS": 200,     # cm
+    "SIM_WIND_SPD": 0,       # m/s
+    "SIM_WIND_DIR": 180,     # deg, direction the wind blows from
+    "SIM_WIND_TURB": 0,      # m/s, gust strength
+}
+
+# Other ArduCopter defaults, including everything airsim.parm sets
+FIRMWARE_DEFAULTS = {
+    "ARMING_CHECK": 1,
+    "SCHED_LOOP_RATE": 400,
+    "ATC_SLEW_YAW": 6000,
+    "ATC_ACCEL_Y_MAX": 27000,
+    "WPNAV_ACCEL_C": 0,
+    "SIM_SPEEDUP": 1,
+    "GPS_HDOP_GOOD": 140,
+    "EKF3_REQ_HDOP": 2.5,
+    "FS_GCS_ENABLE": 0,
+    "FS_THR_ENABLE": 1,
+    "SYSID_THISMAV": 1,
+}
+# ArduCopter exposes about this many parameters; the table is padded to it so
+# a full download costs what it does on the real firmware
+PARAM_COUNT = 1000
+# Parameters sent per tick while answering PARAM_REQUEST_LIST
+PARAMS_PER_TICK = 8
+
+# Reported in AUTOPILOT_VERSION (4.5.7 official)
+FIRMWARE_VERSION = (4 << 24) | (5 << 16) | (7 << 8) | 255
+
+MODES = {name: number for number, name in mavutil.mode_mapping_acm.items()}
+ARMABLE_MODES = {MODES[m] for m in ("STABILIZE", "ACRO", "ALT_HOLD", "GUIDED", "LOITER",
+                                    "POSHOLD", "SPORT", "DRIFT", "BRAKE")}
+# Modes flown from RC sticks (centred sticks hold position and altitude)
+STICK_MODES = {MODES[m] for m in ("STABILIZE", "ACRO", "ALT_HOLD", "LOITER", "POSHOLD",
+                                  "SPORT", "DRIFT")}
+
+EKF_READY_FLAGS = (mavutil.mavlink.EKF_ATTITUDE | mavutil.mavlink.EKF_VELOCITY_HORIZ |
+                   mavutil.mavlink.EKF_VELOCITY_VERT | mavutil.mavlink.EKF_POS_HORIZ_REL |
+                   mavutil.mavlink.EKF_POS_HORIZ_ABS | mavutil.mavlink.EKF_POS_VERT_ABS |
+                   mavutil.mavlink.EKF_PRED_POS_HORIZ_REL |
+                   mavutil.mavlink.EKF_PRED_POS_HORIZ_ABS)
+EKF_ALIGNING_FLAGS = mavutil.mavlink.EKF_ATTITUDE | mavutil.mavlink.EKF_CONST_POS_MODE
+
+BASE_MODE = (mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED |
+             mavutil.mavlink.MAV_MODE_FLAG_GUIDED_ENABLED |
+             mavutil.mavlink.MAV_MODE_FLAG_STABILIZE_ENABLED |
+             mavutil.mavlink.MAV_MODE_FLAG_MANUAL_INPUT_ENABLED)
+
+# Mission upload: wall seconds before an unanswered item request is repeated,
+# and repeats before the upload is cancelled
+MISSION_RETRY = 1.0
+MISSION_RETRIES = 5
+MISSION_TYPE = mavutil.mavlink.MAV_MISSION_TYPE_MISSION
+# Global frames of mission items whose z is relative to home (others are AMSL)
+RELATIVE_FRAMES = (mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                   mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT)
+
+# Position/velocity/yaw "ignore" bits of SET_POSITION_TARGET_LOCAL_NED.type_mask
+IGNORE_POSITION = 0b111
+IGNORE_VELOCITY = 0b111 << 3
+IGNORE_YAW = 1 << 10
+
+ACCEPTED = mavutil.mavlink.MAV_RESULT_ACCEPTED
+FAILED = mavutil.mavlink.MAV_RESULT_FAILED
+UNSUPPORTED = mavutil.mavlink.MAV_RESULT_UNSUPPORTED
+
+
+def load_params(path=waits.PARAM_FILE, factory=False):
+    """Parameter table: ArduCopter defaults, with the .parm file applied
+    (as SITL does with --defaults) unless factory is set."""
+    params = dict(FIRMWARE_DEFAULTS, **PARAM_DEFAULTS)
+    for i in range(PARAM_COUNT - len(params)):
+        params[f"FAKE_PAD{i:04d}"] = 0
+    if not factory:
+        try:
+            file_params = waits.load_param_file(path)
+        except OSError:
+            file_params = {}
+        params.update((k, v) for k, v in file_params.items() if k in params)
+    return params
+
+
+def _float32(value):
+    return struct.unpack('<f', struct.pack('<f', value))[0]
+
+
+def _clamp(value, limit):
+    return max(-limit, min(limit, value))
+
+
+def _stick(pwm):
+    """RC pulse width to -1..1 (0 for centred or unset channels)."""
+    if not 800 <= pwm <= 2200:
+        return 0.0
+    return _clamp((pwm - 1500) / 500.0, 1.0)
+
+
+class _Protocol(asyncio.DatagramProtocol):
+
+    def __init__(self, vehicle):
+        self.vehicle = vehicle
+
+    def datagram_received(self, data, addr):
+        self.vehicle.receive(data, addr)
+
+    def error_received(self, exc):
+        # Nobody listening on the target port yet; keep streaming
+        pass
+
+
+class FakeVehicle:
+    """Point-mass copter answering MAVLink like ArduCopter SITL."""
+
+    def __init__(self, sysid=1, params=None, home=(HOME_LAT, HOME_LON, HOME_ALT), loss=0.0,
+                 battery=100.0):
+        self.sysid = sysid
+        self.params = dict(params or load_params())
+        self.params["SYSID_THISMAV"] = sysid
+        self.param_names = sorted(self.params)
+        self.param_index = {name: i for i, name in enumerate(self.param_names)}
+        self.param_queue = deque()
+        self.home = home
+        # Scale factors only; the per-tick conversion stays scalar
+        self.frame = local_frame(tuple(home))
+        # Fraction of outgoing frames dropped, to exercise retries and loss accounting
+        self.loss = loss
+        # Remaining charge (%), drained while armed
+        self.battery = battery
+        self._random = random.Random(sysid)
+        self.mav = mavlink2.MAVLink(self, srcSystem=sysid, srcComponent=1)
+        self.parser = mavlink2.MAVLink(None)
+        self.parser.robust_parsing = True
+        self.transport = None
+        self.peer = None
+        self.listening = False
+
+        self.sim_time = 0.0
+        self.pos = [0.0, 0.0, 0.0]   # NED from home (m)
+        self.vel = [0.0, 0.0, 0.0]
+        self.accel = [0.0, 0.0, 0.0]
+        self.yaw = 0.0
+        self.yaw_rate = 0.0
+        self.roll = 0.0
+        self.pitch = 0.0
+        self.gust = [0.0, 0.0]
+        self.wind_trim = [0.0, 0.0]
+
+        self.armed = False
+        self.custom_mode = MODES["STABILIZE"]
+        self.target_pos = None
+        self.target_vel = None
+        self.target_vel_time = 0.0
+        # Velocity feed-forward sent with a position target, and when
+        self.target_ff = None
+        self.target_ff_time = 0.0
+        self.target_yaw = None
+        self.rc = [0] * 8
+        self.rc_time = -math.inf
+        self.rtl_alt = 0.0
+        self.rtl_descending = False
+        self.idle_since = 0.0
+
+        # Mission items (seq 0 is home, as in ArduPilot) and AUTO progress
+        self.mission = []
+        self.mission_seq = 0
+        self.mission_running = False
+        self.mission_complete = False
+        self.auto_speed = None
+        self.item_anchor = None
+        self.item_reached_at = None
+        self.upload = None
+        self.last_upload = None
+
+        # Telemetry streams: message type -> interval (simulated s), next due time
+        self.intervals = {name: 1.0 / rate for name, rate in STREAM_RATES.items()}
+        # Staggered by system ID so a large fleet does not burst on the same tick
+        phase = (sysid % 50) / 50.0
+        self.next_due = {name: phase * interval for name, interval in self.intervals.items()}
+        self._stream_senders = {
+            "HEARTBEAT": self.send_heartbeat,
+            "GPS_RAW_INT": self.send_gps_raw_int,
+            "GLOBAL_POSITION_INT": self.send_global_position_int,
+            "LOCAL_POSITION_NED": self.send_local_position_ned,
+            "ATTITUDE": self.send_attitude,
+            "VFR_HUD": self.send_vfr_hud,
+            "EKF_STATUS_REPORT": self.send_ekf_status_report,
+            "SERVO_OUTPUT_RAW": self.send_servo_output_raw,
+            "SYS_STATUS": self.send_sys_status,
+            "RC_CHANNELS": self.send_rc_channels,
+            "MISSION_CURRENT": self.send_mission_current,
+        }
+        self._handlers = {
+            "COMMAND_LONG": self.handle_command_long,
+            "SET_MODE": self.handle_set_mode,
+            "RC_CHANNELS_OVERRIDE": self.handle_rc_override,
+            "SET_POSITION_TARGET_LOCAL_NED": self.handle_position_target,
+            "REQUEST_DATA_STREAM": self.handle_request_data_stream,
+            "PARAM_REQUEST_LIST": self.handle_param_request_list,
+            "PARAM_REQUEST_READ": self.handle_param_request_read,
+            "PARAM_SET": self.handle_param_set,
+            "TIMESYNC": self.handle_timesync,
+            "MISSION_COUNT": self.handle_mission_count,
+            "MISSION_ITEM_INT": self.handle_mission_item_int,
+            "MISSION_REQUEST_LIST": self.handle_mission_request_list,
+            "MISSION_REQUEST_INT": self.handle_mission_request_int,
+            "MISSION_CLEAR_ALL": self.handle_mission_clear_all,
+        }
+        self._commands = {
+            mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM: self.command_arm_disarm,
+            mavutil.mavlink.MAV_CMD_DO_SET_MODE: lambda m: self.set_mode(int(m.param2)),
+            mavutil.mavlink.MAV_CMD_NAV_TAKEOFF: self.command_takeoff,
+            mavutil.mavlink.MAV_CMD_NAV_LAND: lambda m: self.set_mode(MODES["LAND"]),
+            mavutil.mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH: lambda m: self.set_mode(MODES["RTL"]),
+            mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL: self.command_set_message_interval,
+            mavutil.mavlink.MAV_CMD_REQUEST_MESSAGE: self.command_request_message,
+            mavutil.mavlink.MAV_CMD_REQUEST_AUTOPILOT_CAPABILITIES:
+                lambda m: self.send_autopilot_version() or ACCEPTED,
+            mavutil.mavlink.MAV_CMD_MISSION_START: self.command_mission_start,
+        }
+
+        self.messages_received = 0
+        self.messages_sent = 0
+        self.messages_dropped = 0
+
+    # ------------------------------------------------------------------
+    # Transport
+    # ------------------------------------------------------------------
+
+    async def open(self, port, host=TARGET_HOST, listen=False):
+        """Send to host:port from an ephemeral socket, or listen on it."""
+        loop = asyncio.get_running_loop()
+        self.listening = listen
+        local = (host, port) if listen else (host, 0)
+        self.peer = None if listen else (host, port)
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _Protocol(self), local_addr=local)
+        return self
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def write(self, buf):
+        """Called by self.mav for every packed message."""
+        if self.transport is not None and self.peer is not None:
+            if self.loss and self._random.random() < self.loss:
+                self.messages_dropped += 1
+                return
+            self.transport.sendto(buf, self.peer)
+            self.messages_sent += 1
+
+    def receive(self, data, addr):
+        if self.listening:
+            self.peer = addr
+        for msg in self.parser.parse_buffer(data) or ():
+            handler = self._handlers.get(msg.get_type())
+            if handler is not None:
+                self.messages_received += 1
+                handler(msg)
+
+    def _for_me(self, msg):
+        return msg.target_system in (0, self.sysid)
+
+    # ------------------------------------------------------------------
+    # Command handling
+    # ------------------------------------------------------------------
+
+    @property
+    def mode(self):
+        return mavutil.mode_mapping_acm.get(self.custom_mode, str(self.custom_mode))
+
+    @property
+    def landed(self):
+        return self.pos[2] >= -0.05
+
+    def handle_command_long(self, msg):
+        if not self._for_me(msg):
+            return
+        command = self._commands.get(msg.command)
+        result = command(msg) if command else UNSUPPORTED
+        self.mav.command_ack_send(msg.command, result, 0, 0,
+                                  msg.get_srcSystem(), msg.get_srcComponent())
+
+    def handle_set_mode(self, msg):
+        if self._for_me(msg):
+            self.set_mode(msg.custom_mode)
+
+    def handle_rc_override(self, msg):
+        if not self._for_me(msg):
+            return
+        self.rc = [msg.chan1_raw, msg.chan2_raw, msg.chan3_raw, msg.chan4_raw,
+                   msg.chan5_raw, msg.chan6_raw, msg.chan7_raw, msg.chan8_raw]
+        self.rc_time = self.sim_time
+
+    def handle_position_target(self, msg):
+        if not self._for_me(msg) or self.custom_mode != MODES["GUIDED"]:
+            return
+        frame = msg.coordinate_frame
+        if frame in (mavutil.mavlink.MAV_FRAME_BODY_NED, mavutil.mavlink.MAV_FRAME_BODY_OFFSET_NED):
+            c, s = math.cos(self.yaw), math.sin(self.yaw)
+            rotate = lambda x, y: (x * c - y * s, x * s + y * c)
+        else:
+            rotate = lambda x, y: (x, y)
+        if not msg.type_mask & IGNORE_POSITION:
+            n, e = rotate(msg.x, msg.y)
+            d = msg.z
+            if frame in (mavutil.mavlink.MAV_FRAME_LOCAL_OFFSET_NED,
+                         mavutil.mavlink.MAV_FRAME_BODY_OFFSET_NED):
+                n, e, d = n + self.pos[0], e + self.pos[1], d + self.pos[2]
+            self.target_pos = (n, e, d)
+            self.target_vel = None
+            # Position with velocity: trajectory tracking, as in ArduCopter's
+            # GUIDED pos/vel controller (acceleration feed-forward is accepted;
+            # the point mass reaches its velocity within WPNAV_ACCEL anyway)
+            self.target_ff = None
+            if not msg.type_mask & IGNORE_VELOCITY:
+                self.target_ff = (*rotate(msg.vx, msg.vy), msg.vz)
+                self.target_ff_time = self.sim_time
+        elif not msg.type_mask & IGNORE_VELOCITY:
+            vn, ve = rotate(msg.vx, msg.vy)
+            self.target_vel = (vn, ve, msg.vz)
+            self.target_vel_time = self.sim_time
+        if not msg.type_mask & IGNORE_YAW:
+            self.target_yaw = msg.yaw
+
+    def handle_request_data_stream(self, msg):
+        """Legacy stream control: all streams off, or all at one rate."""
+        if not self._for_me(msg):
+            return
+        for name in list(self.intervals):
+            if name != "HEARTBEAT":
+                self.set_stream_interval(name, None)
+        if msg.start_stop and msg.req_message_rate > 0:
+            for name in STREAM_RATES:
+                if name != "HEARTBEAT":
+                    self.set_stream_interval(name, 1.0 / msg.req_message_rate)
+
+    def command_set_message_interval(self, msg):
+        cls = mavlink2.mavlink_map.get(int(msg.param1))
+        if cls is None or cls.msgname not in self._stream_senders:
+            return FAILED
+        name = cls.msgname
+        if msg.param2 < 0:
+            self.set_stream_interval(name, None)
+        elif msg.param2 == 0:
+            default = STREAM_RATES.get(name)
+            self.set_stream_interval(name, 1.0 / default if default else None)
+        else:
+            self.set_stream_interval(name, msg.param2 / 1e6)
+        return ACCEPTED
+
+    def command_request_message(self, msg):
+        msgid = int(msg.param1)
+        if msgid == mavutil.mavlink.MAVLINK_MSG_ID_AUTOPILOT_VERSION:
+            self.send_autopilot_version()
+            return ACCEPTED
+        cls = mavlink2.mavlink_map.get(msgid)
+        if cls is None or cls.msgname not in self._stream_senders:
+            return FAILED
+        self._stream_senders[cls.msgname]()
+        return ACCEPTED
+
+    def handle_param_request_list(self, msg):
+        if self._for_me(msg):
+            self.param_queue = deque(range(len(self.param_names)))
+
+    def handle_param_request_read(self, msg):
+        if not self._for_me(msg):
+            return
+        if msg.param_index >= 0:
+            if msg.param_index < len(self.param_names):
+                self.send_param_value(self.param_names[msg.param_index])
+        elif msg.param_id in self.params:
+            self.send_param_value(msg.param_id)
+
+    def handle_param_set(self, msg):
+        # Unknown names are ignored, as ArduPilot does
+        if self._for_me(msg) and msg.param_id in self.params:
+            value = msg.param_value
+            if float(self.params[msg.param_id]).is_integer():
+                value = round(value)
+            self.params[msg.param_id] = _float32(value)
+            self.send_param_value(msg.param_id)
+
+    def handle_timesync(self, msg):
+        # Requests carry tc1 == 0; answer with our clock and the sender's ts1
+        if msg.tc1 == 0:
+            self.mav.timesync_send(int(self.sim_time * 1e9), msg.ts1)
+
+    def _for_mission(self, msg):
+        return self._for_me(msg) and msg.mission_type == MISSION_TYPE
+
+    def handle_mission_count(self, msg):
+        if not self._for_mission(msg):
+            return
+        peer = (msg.get_srcSystem(), msg.get_srcComponent())
+        if msg.count == 0:
+            self.mission = []
+            self.mav.mission_ack_send(*peer, mavutil.mavlink.MAV_MISSION_ACCEPTED, MISSION_TYPE)
+            return
+        self.upload = {"peer": peer, "count": msg.count, "items": [], "tries": 0}
+        self._request_item()
+
+    def _request_item(self):
+        upload = self.upload
+        self.mav.mission_request_int_send(*upload["peer"], len(upload["items"]), MISSION_TYPE)
+        upload["requested"] = time.monotonic()
+        upload["tries"] += 1
+
+    def handle_mission_item_int(self, msg):
+        upload = self.upload
+        if not self._for_mission(msg):
+            return
+        if upload is None:
+            # The final item again: our MISSION_ACK was lost, so repeat it
+            if self.last_upload and msg.seq == self.last_upload["count"] - 1:
+                self.mav.mission_ack_send(*self.last_upload["peer"],
+                                          mavutil.mavlink.MAV_MISSION_ACCEPTED, MISSION_TYPE)
+            return
+        if msg.seq != len(upload["items"]):
+            # A repeat of an earlier item means our request was lost: ask again
+            self._request_item()
+            return
+        upload["items"].append(msg)
+        upload["tries"] = 0
+        if len(upload["items"]) < upload["count"]:
+            self._request_item()
+            return
+        self.mission = upload["items"]
+        self.upload = None
+        self.last_upload = upload
+        self.mission_seq = 1 if len(self.mission) > 1 else 0
+        self.mission_running = self.mission_complete = False
+        self.mav.mission_ack_send(*upload["peer"], mavutil.mavlink.MAV_MISSION_ACCEPTED,
+                                  MISSION_TYPE)
+
+    def handle_mission_request_list(self, msg):
+        if self._for_mission(msg):
+            self.mav.mission_count_send(msg.get_srcSystem(), msg.get_srcComponent(),
+                                        len(self.mission), MISSION_TYPE)
+
+    def handle_mission_request_int(self, msg):
+        if not self._for_mission(msg) or msg.seq >= len(self.mission):
+            return
+        item = self.mission[msg.seq]
+        self.mav.mission_item_int_send(msg.get_srcSystem(), msg.get_srcComponent(), item.seq,
+                                       item.frame, item.command, int(item.seq == self.mission_seq),
+                                       item.autocontinue, item.param1, item.param2, item.param3,
+                                       item.param4, item.x, item.y, item.z, MISSION_TYPE)
+
+    def handle_mission_clear_all(self, msg):
+        if self._for_mission(msg):
+            self.mission = []
+            self.mission_seq = 0
+            self.mission_running = False
+            self.mav.mission_ack_send(msg.get_srcSystem(), msg.get_srcComponent(),
+                                      mavutil.mavlink.MAV_MISSION_ACCEPTED, MISSION_TYPE)
+
+    def _check_upload(self):
+        """Repeat an unanswered item request; cancel the upload after MISSION_RETRIES."""
+        upload = self.upload
+        if upload is None or time.monotonic() - upload["requested"] < MISSION_RETRY:
+            return
+        if upload["tries"] > MISSION_RETRIES:
+            self.mav.mission_ack_send(*upload["peer"],
+                                      mavutil.mavlink.MAV_MISSION_OPERATION_CANCELLED, MISSION_TYPE)
+            self.upload = None
+            return
+        self._request_item()
+
+    def set_stream_interval(self, name, interval):
+        """Stream a message every interval simulated seconds (None stops it)."""
+        if interval is None:
+            self.intervals.pop(name, None)
+            self.next_due.pop(name, None)
+            return
+        self.intervals[name] = interval
+        self.next_due[name] = self.sim_time
+
+    def set_mode(self, custom_mode):
+        if custom_mode not in mavutil.mode_mapping_acm:
+            return FAILED
+        if custom_mode == MODES["AUTO"] and len(self.mission) < 2:
+            return FAILED
+        if self.armed and custom_mode == MODES["GUIDED"]:
+            self.target_pos = tuple(self.pos)
+        else:
+            self.target_pos = None
+        self.target_vel = None
+        self.target_ff = None
+        self.target_yaw = None
+        if custom_mode == MODES["RTL"]:
+            self.rtl_alt = max(-self.pos[2], self.params["RTL_ALT"] / 100.0)
+            self.rtl_descending = False
+        self.custom_mode = custom_mode
+        self.mission_running = False
+        if custom_mode == MODES["AUTO"] and self.armed and not self.landed:
+            # Entering AUTO in the air resumes the mission at the current item
+            self._start_item(max(self.mission_seq, 1))
+        return ACCEPTED
+
+    def command_arm_disarm(self, msg):
+        if msg.param1 >= 0.5:
+            if self.armed:
+                return ACCEPTED
+            if self.custom_mode not in ARMABLE_MODES or self.sim_time < EKF_READY_DELAY:
+                return FAILED
+            self.armed = True
+            self.idle_since = self.sim_time
+            return ACCEPTED
+        if not self.landed and int(msg.param2) != 21196:
+            return FAILED
+        self.disarm()
+        return ACCEPTED
+
+    def command_takeoff(self, msg):
+        if not self.armed or self.custom_mode != MODES["GUIDED"] or not self.landed:
+            return FAILED
+        self.target_pos = (self.pos[0], self.pos[1], -msg.param7)
+        self.target_vel = None
+        self.target_ff = None
+        return ACCEPTED
+
+    def command_mission_start(self, msg):
+        if self.custom_mode != MODES["AUTO"] or not self.armed:
+            return FAILED
+        self.mission_complete = False
+        self._start_item(max(int(msg.param1), 1))
+        return ACCEPTED
+
+    def disarm(self):
+        self.armed = False
+        self.target_pos = None
+        self.target_vel = None
+        self.target_ff = None
+
+    # ------------------------------------------------------------------
+    # Point-mass model
+    # ------------------------------------------------------------------
+
+    def _toward(self, target, speed=None):
+        """Velocity toward a NED target, limited to the WPNAV speeds (or speed)."""
+        dn, de, dd = (t - p for t, p in zip(target, self.pos))
+        distance = math.hypot(dn, de)
+        speed = min(speed or self.params["WPNAV_SPEED"] / 100.0, POSITION_GAIN * distance)
+        scale = speed / distance if distance > 1e-6 else 0.0
+        vz = POSITION_GAIN * dd
+        vz = max(-self.params["WPNAV_SPEED_UP"] / 100.0,
+                 min(self.params["WPNAV_SPEED_DN"] / 100.0, vz))
+        return dn * scale, de * scale, vz
+
+    def _desired_velocity(self):
+        mode = self.custom_mode
+        if mode == MODES["GUIDED"]:
+            if self.target_vel and self.sim_time - self.target_vel_time < TARGET_TIMEOUT:
+                return tuple(_clamp(v, MAX_SPEED) for v in self.target_vel)
+            if self.target_pos and self.target_ff and \
+                    self.sim_time - self.target_ff_time < TARGET_TIMEOUT:
+                return tuple(_clamp(v + POSITION_GAIN * (t - p), MAX_SPEED)
+                             for v, t, p in zip(self.target_ff, self.target_pos, self.pos))
+            if self.target_pos:
+                return self._toward(self.target_pos)
+            return 0.0, 0.0, 0.0
+        if mode == MODES["LAND"]:
+            return 0.0, 0.0, self.params["LAND_SPEED"] / 100.0
+        if mode == MODES["RTL"]:
+            return self._rtl_velocity()
+        if mode == MODES["AUTO"]:
+            if self.mission_running:
+                return self._auto_velocity()
+            return self._toward(self.item_anchor) if self.item_anchor else (0.0, 0.0, 0.0)
+        if mode in STICK_MODES:
+            if self.sim_time - self.rc_time < TARGET_TIMEOUT:
+                roll, pitch, throttle, yaw = (_stick(pwm) for pwm in self.rc[:4])
+            else:
+                roll = pitch = throttle = yaw = 0.0
+            self.yaw_rate = math.radians(self.params["ATC_RATE_Y_MAX"]) * yaw
+            forward, right = -pitch * MAX_SPEED, roll * MAX_SPEED
+            c, s = math.cos(self.yaw), math.sin(self.yaw)
+            climb = self.params["WPNAV_SPEED_UP" if throttle > 0 else "WPNAV_SPEED_DN"] / 100.0
+            return forward * c - right * s, forward * s + right * c, -throttle * climb
+        return 0.0, 0.0, 0.0
+
+    def _rtl_velocity(self, speed=None):
+        home_distance = math.hypot(self.pos[0], self.pos[1])
+        if home_distance > 0.5 and not self.rtl_descending:
+            if -self.pos[2] < self.rtl_alt - 0.5:
+                return self._toward((self.pos[0], self.pos[1], -self.rtl_alt), speed)
+            return self._toward((0.0, 0.0, -self.rtl_alt), speed)
+        # Final descent, still holding position over home
+        self.rtl_descending = True
+        vn, ve, _ = self._toward((0.0, 0.0, self.pos[2]), speed)
+        return vn, ve, self.params["LAND_SPEED"] / 100.0
+
+    # ------------------------------------------------------------------
+    # AUTO missions
+    # ------------------------------------------------------------------
+
+    def _start_item(self, seq):
+        """Make seq the current item; DO_CHANGE_SPEED items run immediately."""
+        while seq < len(self.mission) and \
+                self.mission[seq].command == mavutil.mavlink.MAV_CMD_DO_CHANGE_SPEED:
+            if self.mission[seq].param2 > 0:
+                self.auto_speed = self.mission[seq].param2
+            seq += 1
+        self.item_anchor = tuple(self.pos)
+        self.item_reached_at = None
+        if seq >= len(self.mission):
+            # End of mission: hold position, as ArduCopter does
+            self.mission_running = False
+            self.mission_complete = True
+            self.send_mission_current()
+            return
+        self.mission_seq = seq
+        self.mission_running = True
+        if self.mission[seq].command == mavutil.mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH:
+            self.rtl_alt = max(-self.pos[2], self.params["RTL_ALT"] / 100.0)
+            self.rtl_descending = False
+        self.send_mission_current()
+
+    def _item_done(self):
+        self.mav.mission_item_reached_send(self.mission_seq)
+        self._start_item(self.mission_seq + 1)
+
+    def _item_target(self, item):
+        """NED target of a mission item; a zero lat/lon or altitude keeps the current one."""
+        n, e, d = self.item_anchor
+        lat0, lon0, alt0 = self.home
+        if item.x or item.y:
+            n = (item.x / 1e7 - lat0) * self.frame.north_scale
+            e = (item.y / 1e7 - lon0) * self.frame.east_scale
+        if item.z:
+            d = -item.z if item.frame in RELATIVE_FRAMES else alt0 - item.z
+        return n, e, d
+
+    def _hold_done(self, target, radius, hold):
+        """True once within radius of target for hold simulated seconds."""
+        if math.dist(target, self.pos) > radius:
+            return False
+        if self.item_reached_at is None:
+            self.item_reached_at = self.sim_time
+        return self.sim_time - self.item_reached_at >= hold
+
+    def _auto_velocity(self):
+        item = self.mission[self.mission_seq]
+        command = item.command
+        speed = self.auto_speed
+        radius = self.params["WPNAV_RADIUS"] / 100.0
+        if command == mavutil.mavlink.MAV_CMD_NAV_TAKEOFF:
+            target = (self.item_anchor[0], self.item_anchor[1], -item.z)
+            if -self.pos[2] >= item.z - 0.5:
+                self._item_done()
+            return self._toward(target, speed)
+        if command == mavutil.mavlink.MAV_CMD_NAV_WAYPOINT:
+            target = self._item_target(item)
+            if self._hold_done(target, item.param2 or radius, item.param1):
+                self._item_done()
+            return self._toward(target, speed)
+        if command == mavutil.mavlink.MAV_CMD_NAV_LOITER_TIME:
+            target = self._item_target(item)
+            if self._hold_done(target, radius, item.param1):
+                self._item_done()
+            return self._toward(target, speed)
+        if command == mavutil.mavlink.MAV_CMD_NAV_LAND:
+            n, e, _ = self._item_target(item)
+            if math.hypot(n - self.pos[0], e - self.pos[1]) > radius:
+                return self._toward((n, e, self.pos[2]), speed)
+            return 0.0, 0.0, self.params["LAND_SPEED"] / 100.0
+        if command == mavutil.mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH:
+            return self._rtl_velocity(speed)
+        # Commands the model does not fly are skipped
+        self._item_done()
+        return 0.0, 0.0, 0.0
+
+    def _auto_landing(self):
+        return (self.custom_mode == MODES["AUTO"] and self.mission_running and
+                self.mission[self.mission_seq].command in (mavutil.mavlink.MAV_CMD_NAV_LAND,
+                                                           mavutil.mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH))
+
+    def step(self, dt):
+        """Advance the model by dt simulated seconds."""
+        self.sim_time += dt
+        if not self.armed:
+            self.yaw_rate = 0.0
+            self.accel = [0.0, 0.0, 0.0] if self.landed else [0.0, 0.0, GRAVITY]
+            self.vel = [0.0, 0.0, self.vel[2] + self.accel[2] * dt]
+            self.pos[2] = min(0.0, self.pos[2] + self.vel[2] * dt)
+            if self.landed:
+                self.vel[2] = 0.0
+            return
+
+        self.battery = max(0.0, self.battery - 100.0 * dt / BATTERY_ENDURANCE)
+        self.yaw_rate = 0.0
+        vn, ve, vd = self._desired_velocity()
+        old = list(self.vel)
+
+        # Acceleration-limited approach to the desired velocity
+        dn, de = vn - self.vel[0], ve - self.vel[1]
+        limit = self.params["WPNAV_ACCEL"] / 100.0 * dt
+        change = math.hypot(dn, de)
+        if change > limit:
+            dn, de = dn * limit / change, de * limit / change
+        self.vel[0] += dn
+        self.vel[1] += de
+        self.vel[2] += _clamp(vd - self.vel[2], self.params["WPNAV_ACCEL_Z"] / 100.0 * dt)
+
+        for i in range(3):
+            self.pos[i] += self.vel[i] * dt
+        wind = self.wind(dt)
+        if self.pos[2] < 0.0:
+            # Airborne: steady wind is trimmed out, changes and gusts push the copter off
+            blend = min(dt / WIND_TRIM_TIME, 1.0)
+            for i in range(2):
+                self.wind_trim[i] += (wind[i] - self.wind_trim[i]) * blend
+                self.pos[i] += (wind[i] - self.wind_trim[i]) * WIND_DRIFT * dt
+        else:
+            self.wind_trim = [0.0, 0.0]
+        if self.pos[2] >= 0.0:
+            # On the ground: no sinking and no sliding
+            self.pos[2] = 0.0
+            self.vel = [0.0, 0.0, min(self.vel[2], 0.0)]
+        self.accel = [(v - o) / dt for v, o in zip(self.vel, old)]
+
+        # Heading
+        max_rate = math.radians(self.params["ATC_RATE_Y_MAX"])
+        if self.target_yaw is not None and self.custom_mode == MODES["GUIDED"]:
+            error = (self.target_yaw - self.yaw + math.pi) % (2 * math.pi) - math.pi
+            self.yaw_rate = _clamp(error / dt, max_rate)
+        self.yaw = (self.yaw + self.yaw_rate * dt + math.pi) % (2 * math.pi) - math.pi
+
+        # Tilt needed for the horizontal acceleration and the wind, in the body frame
+        c, s = math.cos(self.yaw), math.sin(self.yaw)
+        an = self.accel[0] + WIND_DRAG * (self.vel[0] - wind[0])
+        ae = self.accel[1] + WIND_DRAG * (self.vel[1] - wind[1])
+        forward = an * c + ae * s
+        right = -an * s + ae * c
+        angle_max = math.radians(self.params["ANGLE_MAX"] / 100.0)
+        self.pitch = _clamp(-math.atan2(forward, GRAVITY), angle_max)
+        self.roll = _clamp(math.atan2(right, GRAVITY), angle_max)
+
+        # Landing completes with a disarm; an idle armed copter disarms itself
+        if self.landed and vd >= 0:
+            if self._auto_landing():
+                self._item_done()
+                self.disarm()
+            elif self.custom_mode in (MODES["LAND"], MODES["RTL"]):
+                self.disarm()
+            elif self.sim_time - self.idle_since > self.params["DISARM_DELAY"]:
+                self.disarm()
+        else:
+            self.idle_since = self.sim_time
+
+    def wind(self, dt):
+        """Wind velocity (north, east m/s): SIM_WIND_SPD from SIM_WIND_DIR plus gusts."""
+        speed = self.params["SIM_WIND_SPD"]
+        turbulence = self.params["SIM_WIND_TURB"]
+        if turbulence:
+            # First-order filtered noise, so gusts build and fade over GUST_TIME
+            blend = min(dt / GUST_TIME, 1.0)
+            for i in range(2):
+                self.gust[i] += (self._random.gauss(0.0, turbulence) - self.gust[i]) * blend
+        if not speed and not turbulence:
+            return 0.0, 0.0
+        towards = math.radians(self.params["SIM_WIND_DIR"] + 180.0)
+        return (speed * math.cos(towards) + self.gust[0],
+                speed * math.sin(towards) + self.gust[1])
+
+    def tick(self, dt):
+        """Advance dt simulated seconds and send whatever streams are due."""
+        while dt > 0:
+            sub = min(dt, MAX_STEP)
+            self.step(sub)
+            dt -= sub
+        now = self.sim_time
+        next_due = self.next_due
+        for name, interval in list(self.intervals.items()):
+            due = next_due[name]
+            if now < due:
+                continue
+            # Streams faster than the tick send several frames per tick
+            burst = min(int((now - due) / interval) + 1, MAX_BURST)
+            for _ in range(burst):
+                self._stream_senders[name]()
+            due += burst * interval
+            next_due[name] = due if due > now else now + interval
+        for _ in range(min(PARAMS_PER_TICK, len(self.param_queue))):
+            self.send_param_value(self.param_names[self.param_queue.popleft()])
+        self._check_upload()
+
+    # ------------------------------------------------------------------
+    # Telemetry
+    # ------------------------------------------------------------------
+
+    @property
+    def time_boot_ms(self):
+        return int(self.sim_time * 1000) & 0xFFFFFFFF
+
+    def global_position(self):
+        """(lat, lon, alt MSL) from the local position on the tangent plane at home."""
+        lat0, lon0, alt0 = self.home
+        lat = lat0 + self.pos[0] / self.frame.north_scale
+        lon = lon0 + self.pos[1] / self.frame.east_scale
+        return lat, lon, alt0 - self.pos[2]
+
+    @property
+    def throttle(self):
+        if not self.armed:
+            return 0
+        if self.landed and self.vel[2] >= 0:
+            return 10
+        return int(max(0, min(100, HOVER_THROTTLE * (1 - self.accel[2] / GRAVITY))))
+
+    def send_heartbeat(self):
+        base_mode = BASE_MODE
+        if self.armed:
+            base_mode |= mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED
+        status = (mavutil.mavlink.MAV_STATE_ACTIVE if self.armed
+                  else mavutil.mavlink.MAV_STATE_STANDBY)
+        self.mav.heartbeat_send(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                                base_mode, self.custom_mode, status)
+
+    def send_gps_raw_int(self):
+        lat, lon, alt = self.global_position()
+        fix = 3 if self.sim_time >= GPS_FIX_DELAY else 1
+        speed = math.hypot(self.vel[0], self.vel[1])
+        cog = int(math.degrees(math.atan2(self.vel[1], self.vel[0])) % 360 * 100)
+        self.mav.gps_raw_int_send(int(self.sim_time * 1e6), fix, int(lat * 1e7), int(lon * 1e7),
+                                  int(alt * 1000), 121, 200, int(speed * 100), cog,
+                                  10 if fix == 3 else 0)
+
+    def send_global_position_int(self):
+        lat, lon, alt = self.global_position()
+        heading = int(math.degrees(self.yaw) % 360 * 100)
+        self.mav.global_position_int_send(self.time_boot_ms, int(lat * 1e7), int(lon * 1e7),
+                                          int(alt * 1000), int(-self.pos[2] * 1000),
+                                          int(self.vel[0] * 100), int(self.vel[1] * 100),
+                                          int(self.vel[2] * 100), heading)
+
+    def send_local_position_ned(self):
+        self.mav.local_position_ned_send(self.time_boot_ms, *self.pos, *self.vel)
+
+    def send_attitude(self):
+        self.mav.attitude_send(self.time_boot_ms, self.roll, self.pitch, self.yaw,
+                               0.0, 0.0, self.yaw_rate)
+
+    def send_vfr_hud(self):
+        speed = math.hypot(self.vel[0], self.vel[1])
+        heading = int(math.degrees(self.yaw) % 360)
+        self.mav.vfr_hud_send(speed, speed, heading, self.throttle,
+                              self.global_position()[2], -self.vel[2])
+
+    def send_ekf_status_report(self):
+        flags = EKF_READY_FLAGS if self.sim_time >= EKF_READY_DELAY else EKF_ALIGNING_FLAGS
+        self.mav.ekf_status_report_send(flags, 0.02, 0.02, 0.02, 0.01, 0.0)
+
+    def send_param_value(self, name):
+        value = self.params[name]
+        param_type = (mavutil.mavlink.MAV_PARAM_TYPE_INT32 if float(value).is_integer()
+                      else mavutil.mavlink.MAV_PARAM_TYPE_REAL32)
+        self.mav.param_value_send(name.encode(), value, param_type, len(self.param_names),
+                                  self.param_index[name])
+
+    def send_autopilot_version(self):
+        self.mav.autopilot_version_send(
+            mavutil.mavlink.MAV_PROTOCOL_CAPABILITY_MAVLINK2 |
+            mavutil.mavlink.MAV_PROTOCOL_CAPABILITY_MISSION_INT |
+            mavutil.mavlink.MAV_PROTOCOL_CAPABILITY_SET_POSITION_TARGET_LOCAL_NED,
+            FIRMWARE_VERSION, 0, 0, 0, [0] * 8, [0] * 8, [0] * 8, 0, 0, self.sysid)
+
+    def send_mission_current(self):
+        if len(self.mission) < 2:
+            state = mavutil.mavlink.MISSION_STATE_NO_MISSION
+        elif self.mission_complete:
+            state = mavutil.mavlink.MISSION_STATE_COMPLETE
+        elif self.mission_running:
+            state = mavutil.mavlink.MISSION_STATE_ACTIVE
+        else:
+            state = mavutil.mavlink.MISSION_STATE_NOT_STARTED
+        self.mav.mission_current_send(self.mission_seq, len(self.mission), state)
+
+    def send_sys_status(self):
+        sensors = (mavutil.mavlink.MAV_SYS_STATUS_SENSOR_3D_GYRO |
+                   mavutil.mavlink.MAV_SYS_STATUS_SENSOR_3D_ACCEL |
+                   mavutil.mavlink.MAV_SYS_STATUS_SENSOR_GPS)
+        voltage = BATTERY_EMPTY + (BATTERY_FULL - BATTERY_EMPTY) * self.battery / 100.0
+        self.mav.sys_status_send(sensors, sensors, sensors, 100, int(voltage * 1000),
+                                 500 if self.armed else 0, int(self.battery), 0, 0, 0, 0, 0, 0)
+
+    def send_rc_channels(self):
+        fresh = self.sim_time - self.rc_time < TARGET_TIMEOUT
+        channels = [pwm if fresh and 800 <= pwm <= 2200 else 1500 for pwm in self.rc]
+        if not fresh or not 800 <= self.rc[2] <= 2200:
+            channels[2] = 1000
+        self.mav.rc_channels_send(self.time_boot_ms, 8, *channels, *([0] * 10), 255)
+
+    def send_servo_output_raw(self):
+        if not self.armed:
+            motors = [1000] * 4
+        else:
+            base = 1000 + self.throttle * 10
+            roll = int(self.roll * 200)
+            pitch = int(self.pitch * 200)
+            yaw = int(self.yaw_rate * 50)
+            # Quad X: front-right, rear-left, front-left, rear-right
+            motors = [base - roll + pitch + yaw, base + roll - pitch + yaw,
+                      base + roll + pitch - yaw, base - roll - pitch - yaw]
+        self.mav.servo_output_raw_send(int(self.sim_time * 1e6) & 0xFFFFFFFF, 0,
+                                       *motors, 0, 0, 0, 0)
+
+
+class FakeFleet:
+    """Fake vehicles stepped together by one fixed-rate timer."""
+
+    def __init__(self, count=1, base_port=BASE_PORT, port_step=PORT_STEP, host=TARGET_HOST,
+                 sysid=1, speedup=1.0, listen=False, params=None, loss=0.0, battery=100.0):
+        params = params or load_params()
+        # Starting charge drawn per vehicle between battery and 100%
+        self.vehicles = [
+            FakeVehicle(sysid + i, params, loss=loss,
+                        battery=random.Random(f"battery:{sysid + i}").uniform(battery, 100.0))
+            for i in range(count)
+        ]
+        self.ports = [base_port + i * port_step for i in range(count)]
+        self.host = host
+        self.listen = listen
+        self.speedup = speedup
+        self.scheduler = RateScheduler()
+        self._last_tick = None
+
+    async def open(self):
+        for vehicle, port in zip(self.vehicles, self.ports):
+            await vehicle.open(port, self.host, self.listen)
+
+    def close(self):
+        for vehicle in self.vehicles:
+            vehicle.close()
+
+    def tick(self):
+        now = time.monotonic()
+        dt = (now - self._last_tick) * self.speedup if self._last_tick is not None else 0.0
+        self._last_tick = now
+        for vehicle in self.vehicles:
+            vehicle.tick(dt)
+
+    async def run(self, duration=None, rate=TICK_RATE):
+        self.scheduler.add_task(self.tick, rate, "physics")
+        await self.scheduler.run_async(duration)
+
+    def print_status(self):
+        sent = sum(v.messages_sent for v in self.vehicles)
+        received = sum(v.messages_received for v in self.vehicles)
+        first = self.vehicles[0]
+        print(f"t={first.sim_time:7.1f}s  vehicles={len(self.vehicles)}  sent={sent}  "
+              f"received={received}  v{first.sysid}: {first.mode} "
+              f"{'armed' if first.armed else 'disarmed'} alt={-first.pos[2]:.1f}m")
+
+
+async def run(args):
+    fleet = FakeFleet(args.count, args.base_port, args.port_step, args.host, args.sysid,
+                      args.speedup, args.listen, load_params(factory=args.factory_params),
+                      args.loss, args.battery)
+    await fleet.open()
+    direction = "listening on" if args.listen else "sending to"
+    print(f"✓ {args.count} fake vehicle(s), sysid {args.sysid}+, {direction} "
+          f"{args.host}:{fleet.ports[0]}" + (f"..{fleet.ports[-1]}" if args.count > 1 else "") +
+          f" at {args.speedup:g}x")
+    fleet.scheduler.add_task(fleet.print_status, 1.0 / args.status_interval, "status")
+    try:
+        await fleet.run(args.duration)
+    finally:
+        fleet.close()
+    print()
+    fleet.scheduler.print_report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Point-mass MAVLink vehicles for local testing")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--host", default=TARGET_HOST)
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--port-step", type=int, default=PORT_STEP)
+    parser.add_argument("--sysid", type=int, default=1, help="system ID of the first vehicle")
+    parser.add_argument("--speedup", type=float, default=1.0, help="simulated seconds per wall second")
+    parser.add_argument("--listen", action="store_true",
+                        help="bind the ports and answer whoever sends (for udpout: clients)")
+    parser.add_argument("--factory-params", action="store_true",
+                        help="boot with ArduCopter defaults instead of airsim.parm applied")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="fraction of outgoing frames to drop (0-1)")
+    parser.add_argument("--battery", type=float, default=100.0,
+                        help="lowest starting charge (%%); each vehicle starts between this and 100")
+    parser.add_argument("--duration", type=float, help="seconds to run (default: until Ctrl+C)")
+    parser.add_argument("--status-interval", type=float, default=5, help="seconds (at most 10)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Pre-packed MAVLink encoder for hot setpoint messages
+pymavlink builds a message object, a header object and several bytes copies
+for every send. For the messages a control loop repeats every tick
+(SET_POSITION_TARGET_LOCAL_NED, RC_CHANNELS_OVERRIDE, HEARTBEAT) this module
+keeps one preallocated frame per connection with the constant fields already
+packed, and per send only patches the changing fields, the sequence number,
+the MAVLink 2 length and the CRC. Output is byte-identical to pymavlink.
+
+Signed links and connections with a send_callback fall back to pymavlink.
+
+Run directly for a correctness check and microbenchmark:
+  python3 fast_encode.py
+"""
+
+import struct
+import sys
+import time
+from pymavlink import mavutil
+
+# CRC using fastcrc when available (as pymavlink does), else a table-driven fallback
+try:
+    import fastcrc
+    _mcrf4xx = fastcrc.crc16.mcrf4xx
+except Exception:
+    _mcrf4xx = None
+
+
+def _make_crc_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def _crc_py(data, crc=0xFFFF):
+    table = _CRC_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+crc16 = _mcrf4xx if _mcrf4xx is not None else _crc_py
+
+V1_MAGIC = 0xFE
+V2_MAGIC = 0xFD
+_FIELD_FORMATS = {
+    "float": "f", "double": "d", "char": "c",
+    "int8_t": "b", "uint8_t": "B", "uint8_t_mavlink_version": "B",
+    "int16_t": "h", "uint16_t": "H", "int32_t": "i", "uint32_t": "I",
+    "int64_t": "q", "uint64_t": "Q",
+}
+
+POSITION_TARGET_FIELDS = ("time_boot_ms", "x", "y", "z", "vx", "vy", "vz",
+                          "afx", "afy", "afz", "yaw", "yaw_rate")
+RC_OVERRIDE_FIELDS = tuple(f"chan{i}_raw" for i in range(1, 9))
+
+# type_mask values used by the scripts
+TYPE_MASK_POSITION = 0b0000111111111000
+TYPE_MASK_VELOCITY = 0b0000111111000111
+# Position with velocity and acceleration feed-forward (trajectory.py)
+TYPE_MASK_TRAJECTORY = 0b0000110000000000
+
+
+def _dialect(mav):
+    return sys.modules[type(mav).__module__]
+
+
+class FrameEncoder:
+    """Preallocated frame for one message type on one connection.
+
+    variable_fields change on every send; fixed holds the constant fields.
+    target_system/target_component default to the connection's targets and
+    are re-packed automatically if those change.
+    """
+
+    def __init__(self, conn, msgname, variable_fields=(), **fixed):
+        self.conn = conn
+        self.msgname = msgname
+        self.variable_fields = tuple(variable_fields)
+        self.fixed = fixed
+        self.frames_sent = 0
+        self.last_len = 0
+        self._mav = None
+        self._build()
+
+    def _build(self):
+        conn = self.conn
+        mav = self._mav = conn.mav
+        dialect = _dialect(mav)
+        cls = getattr(dialect, f"MAVLink_{self.msgname.lower()}_message")
+        self.v2 = float(dialect.WIRE_PROTOCOL_VERSION) >= 2.0
+        self.msgid = cls.id
+        self.crc_extra = bytes([cls.crc_extra])
+
+        # Byte offset and struct code of every field in wire order
+        offsets = {}
+        codes = {}
+        offset = 0
+        for name in cls.ordered_fieldnames:
+            i = cls.fieldnames.index(name)
+            code = _FIELD_FORMATS[cls.fieldtypes[i]]
+            count = cls.array_lengths[i] or 1
+            offsets[name], codes[name] = offset, (code, count)
+            offset += struct.calcsize("<" + code) * count
+        self.payload_len = offset
+        self.header_len = 10 if self.v2 else 6
+
+        values = {name: 0 for name in cls.ordered_fieldnames}
+        if "target_system" in values:
+            values["target_system"] = conn.target_system
+            values["target_component"] = conn.target_component
+        values.update(self.fixed)
+        self._targets = (conn.target_system, conn.target_component)
+
+        buf = self.buf = bytearray(self.header_len + self.payload_len + 2)
+        self.view = memoryview(buf)
+        self._crc_offset = None
+        buf[0] = V2_MAGIC if self.v2 else V1_MAGIC
+        if self.v2:
+            buf[7:10] = struct.pack("<I", self.msgid)[:3]
+        else:
+            buf[1] = self.payload_len
+            buf[5] = self.msgid
+        for name in cls.ordered_fieldnames:
+            if name in self.variable_fields:
+                continue
+            code, count = codes[name]
+            value = values[name]
+            if code == "c":
+                value = value.encode() if isinstance(value, str) else value
+                struct.pack_into(f"<{count}s", buf, self.header_len + offsets[name], value)
+            elif count > 1:
+                struct.pack_into(f"<{count}{code}", buf, self.header_len + offsets[name], *value)
+            else:
+                struct.pack_into("<" + code, buf, self.header_len + offsets[name], value)
+
+        # Group the variable fields into contiguous wire-order runs
+        order = sorted(self.variable_fields, key=lambda n: offsets[n])
+        runs = []
+        for name in order:
+            code, count = codes[name]
+            if count > 1:
+                raise ValueError(f"array field {name} cannot be variable")
+            index = self.variable_fields.index(name)
+            if runs and runs[-1][2] == offsets[name]:
+                run = runs[-1]
+                run[1] += code
+                run[2] = offsets[name] + struct.calcsize("<" + code)
+                run[3].append(index)
+            else:
+                runs.append([offsets[name], code, offsets[name] + struct.calcsize("<" + code), [index]])
+        self._runs = [(struct.Struct("<" + fmt), self.header_len + start, tuple(indices))
+                      for start, fmt, _, indices in runs]
+        identity = tuple(range(len(self.variable_fields)))
+        self._single = (self._runs[0][0].pack_into, self._runs[0][1]) \
+            if len(self._runs) == 1 and self._runs[0][2] == identity else None
+
+    def encode(self, *values):
+        """Patch the frame and return a memoryview of it (valid until the next call)."""
+        conn = self.conn
+        mav = conn.mav
+        if mav is not self._mav or (conn.target_system, conn.target_component) != self._targets:
+            self._build()
+        buf = self.buf
+        # A truncated MAVLink 2 frame left its CRC inside the zero tail
+        crc_offset = self._crc_offset
+        if crc_offset is not None:
+            buf[crc_offset] = 0
+            buf[crc_offset + 1] = 0
+        if self._single is not None:
+            pack_into, offset = self._single
+            pack_into(buf, offset, *values)
+        else:
+            for packer, offset, indices in self._runs:
+                packer.pack_into(buf, offset, *[values[i] for i in indices])
+
+        hlen = self.header_len
+        if self.v2:
+            plen = self.payload_len
+            while plen > 1 and buf[hlen + plen - 1] == 0:
+                plen -= 1
+            buf[1] = plen
+            buf[4] = mav.seq
+            buf[5] = mav.srcSystem
+            buf[6] = mav.srcComponent
+        else:
+            plen = self.payload_len
+            buf[2] = mav.seq
+            buf[3] = mav.srcSystem
+            buf[4] = mav.srcComponent
+        end = hlen + plen
+        crc = crc16(self.crc_extra, crc16(self.view[1:end], 0xFFFF))
+        buf[end] = crc & 0xFF
+        buf[end + 1] = crc >> 8
+        if self.v2:
+            self._crc_offset = end if plen < self.payload_len else None
+        return self.view[:end + 2]
+
+    def send(self, *values):
+        """Encode and write one frame, keeping pymavlink's counters in step."""
+        mav = self.conn.mav
+        if mav.signing.sign_outgoing or mav.send_callback is not None:
+            self._send_slow(mav, values)
+            return
+        frame = self.encode(*values)
+        mav.file.write(frame)
+        mav.seq = (mav.seq + 1) % 256
+        mav.total_packets_sent += 1
+        mav.total_bytes_sent += len(frame)
+        self.frames_sent += 1
+        self.last_len = len(frame)
+
+    def _send_slow(self, mav, values):
+        fields = dict(self.fixed)
+        fields.setdefault("target_system", self.conn.target_system)
+        fields.setdefault("target_component", self.conn.target_component)
+        fields.update(zip(self.variable_fields, values))
+        cls = getattr(_dialect(mav), f"MAVLink_{self.msgname.lower()}_message")
+        msg = cls(**{name: fields.get(name, 0) for name in cls.fieldnames})
+        mav.send(msg)
+        self.frames_sent += 1
+        self.last_len = len(msg.get_msgbuf())
+
+
+# ----------------------------------------------------------------------
+# Ready-made encoders for the scripts' hot paths
+# ----------------------------------------------------------------------
+
+def position_target_encoder(conn, type_mask=TYPE_MASK_VELOCITY,
+                            frame=mavutil.mavlink.MAV_FRAME_LOCAL_NED):
+    """SET_POSITION_TARGET_LOCAL_NED; send(time_boot_ms, x, y, z, vx, vy, vz, afx, afy, afz, yaw, yaw_rate)."""
+    return FrameEncoder(conn, "SET_POSITION_TARGET_LOCAL_NED", POSITION_TARGET_FIELDS,
+                        type_mask=type_mask, coordinate_frame=frame)
+
+
+def rc_override_encoder(conn):
+    """RC_CHANNELS_OVERRIDE; send(chan1_raw, ..., chan8_raw)."""
+    return FrameEncoder(conn, "RC_CHANNELS_OVERRIDE", RC_OVERRIDE_FIELDS)
+
+
+def heartbeat_encoder(conn, mav_type=mavutil.mavlink.MAV_TYPE_GCS,
+                      autopilot=mavutil.mavlink.MAV_AUTOPILOT_INVALID):
+    """GCS HEARTBEAT; send() with no arguments."""
+    return FrameEncoder(conn, "HEARTBEAT", (), type=mav_type, autopilot=autopilot,
+                        base_mode=0, custom_mode=0, system_status=0, mavlink_version=3)
+
+
+def encoder_for(conn, kind, **kwargs):
+    """Cached encoder of the given kind ('position_target', 'rc_override', 'heartbeat') for conn."""
+    cache = conn.__dict__.setdefault("_fast_encoders", {})
+    key = (kind,) + tuple(sorted(kwargs.items()))
+    encoder = cache.get(key)
+    if encoder is None:
+        factory = {"position_target": position_target_encoder,
+                   "rc_override": rc_override_encoder,
+                   "heartbeat": heartbeat_encoder}[kind]
+        encoder = cache[key] = factory(conn, **kwargs)
+    return encoder
+
+
+# ----------------------------------------------------------------------
+# Correctness check and microbenchmark
+# ----------------------------------------------------------------------
+
+class _Sink:
+    """Stand-in mavutil connection that keeps the last written frame."""
+
+    def __init__(self, dialect):
+        self.last = b""
+        self.target_system = 1
+        self.target_component = 1
+        self.mav = dialect.MAVLink(self, srcSystem=255, srcComponent=190)
+
+    def write(self, buf):
+        self.last = bytes(buf)
+
+
+def _check(dialect, rounds=600):
+    import random
+    ref = _Sink(dialect)
+    fast = _Sink(dialect)
+    cases = [
+        (lambda v: ref.mav.send(dialect.MAVLink_set_position_target_local_ned_message(
+            v[0], 1, 1, mavutil.mavlink.MAV_FRAME_LOCAL_NED, TYPE_MASK_VELOCITY, *v[1:])),
+         position_target_encoder(fast),
+         lambda: [random.randrange(0, 2**32)] + [random.choice([0.0, random.uniform(-5, 5)])
+                                                   for _ in range(11)]),
+        (lambda v: ref.mav.rc_channels_override_send(1, 1, *v),
+         rc_override_encoder(fast),
+         lambda: [random.choice([0, 1500, random.randrange(1000, 2001)]) for _ in range(8)]),
+        (lambda v: ref.mav.heartbeat_send(mavutil.mavlink.MAV_TYPE_GCS,
+                                          mavutil.mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0),
+         heartbeat_encoder(fast),
+         lambda: []),
+    ]
+    for _ in range(rounds):
+        for send_ref, encoder, gen in cases:
+            values = gen()
+            send_ref(values)
+            encoder.send(*values)
+            if ref.last != fast.last:
+                raise AssertionError(f"{encoder.msgname} mismatch:\n{ref.last.hex()}\n{fast.last.hex()}")
+    return len(cases) * rounds
+
+
+def _bench(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    from pymavlink.dialects.v10 import ardupilotmega as v10
+    from pymavlink.dialects.v20 import ardupilotmega as v20
+
+    print(f"CRC backend: {'fastcrc' if _mcrf4xx is not None else 'pure Python table'}")
+    for label, dialect in (("MAVLink 1", v10), ("MAVLink 2", v20)):
+        print(f"\n{label}: {_check(dialect)} frames byte-identical to pymavlink")
+
+        ref = _Sink(dialect)
+        fast = _Sink(dialect)
+        velocity = position_target_encoder(fast)
+        rc = rc_override_encoder(fast)
+        heartbeat = heartbeat_encoder(fast)
+        n = 20000
+        rows = [
+            ("SET_POSITION_TARGET_LOCAL_NED",
+             lambda: ref.mav.send(dialect.MAVLink_set_position_target_local_ned_message(
+                 10, 1, 1, mavutil.mavlink.MAV_FRAME_LOCAL_NED, TYPE_MASK_VELOCITY,
+                 0, 0, 0, 1.5, -0.5, 0.2, 0, 0, 0, 0, 0)),
+             lambda: velocity.send(10, 0, 0, 0, 1.5, -0.5, 0.2, 0, 0, 0, 0, 0)),
+            ("RC_CHANNELS_OVERRIDE",
+             lambda: ref.mav.rc_channels_override_send(1, 1, 1500, 1450, 1600, 1500, 0, 0, 0, 0),
+             lambda: rc.send(1500, 1450, 1600, 1500, 0, 0, 0, 0)),
+            ("HEARTBEAT",
+             lambda: ref.mav.heartbeat_send(mavutil.mavlink.MAV_TYPE_GCS,
+                                            mavutil.mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0),
+             heartbeat.send),
+        ]
+        print(f"{'message':<32} {'pymavlink us':>13} {'fast us':>9} {'speedup':>8}")
+        for name, slow, quick in rows:
+            t_slow = _bench(slow, n)
+            t_fast = _bench(quick, n)
+            print(f"{name:<32} {t_slow:>13.2f} {t_fast:>9.2f} {t_slow / t_fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Vectorized formation planner for swarm setpoints
+Holds the fleet's positions, slot offsets and targets as NumPy arrays and
+computes, for every vehicle at once, where its slot is and the velocity that
+takes it there. One step is a handful of array operations whatever the fleet
+size, so hundreds of vehicles fit in a 20 Hz control tick.
+
+Shapes (slot 0 is the formation reference, x forward and y right before
+rotation):
+  line   abreast, centred on the reference
+  wedge  leader at the front, followers alternating left/right behind it
+  ring   evenly spaced on a circle around the reference
+  grid   rows of ceil(sqrt(N)) centred on the reference
+
+place() rotates the slots by the formation heading and translates them to
+its centre; step() turns position errors into velocity setpoints with a
+proportional gain plus the formation's own velocity as feed-forward, capped
+at WPNAV_SPEED horizontally and WPNAV_SPEED_UP/DN vertically (read from
+config/ardupilot/airsim.parm). The result goes straight to
+Swarm.send_velocities(), or the slots to Swarm.send_positions().
+
+Positions are LOCAL_POSITION_NED, so all vehicles must share one local
+origin (true for fake_vehicle.py fleets).
+
+Usage:
+  python3 fake_vehicle.py --count 20 --speedup 5 &
+  python3 formation.py --count 20 --shape wedge --takeoff 10 --speed 1 --turn-rate 5
+  python3 formation.py --bench
+"""
+
+import argparse
+import asyncio
+import math
+import time
+
+import numpy as np
+
+import waits
+from swarm import BASE_PORT, PORT_STEP, SETPOINT_RATE, Swarm
+from vehicle_state import LOCAL_POSITION
+
+SHAPES = ("line", "wedge", "ring", "grid")
+
+# Distance between neighbouring slots (m)
+SPACING = 5.0
+# Position error to velocity (1/s)
+POSITION_GAIN = 0.8
+
+# ArduCopter defaults for the speed limits (cm/s) when the .parm file is missing
+WPNAV_DEFAULTS = {"WPNAV_SPEED": 500, "WPNAV_SPEED_UP": 250, "WPNAV_SPEED_DN": 150}
+
+# Velocity setpoints are rounded to this many decimals (cm/s) so a settled
+# fleet repeats identical setpoints and SetpointStream coalesces them
+VELOCITY_DECIMALS = 2
+
+TAKEOFF_TIMEOUT = 60
+
+BENCH_SIZES = (10, 100, 500, 1000)
+
+
+def speed_limits(path=waits.PARAM_FILE):
+    """(horizontal, up, down) speed limits in m/s from the vehicle parameter file."""
+    try:
+        params = waits.load_param_file(path)
+    except OSError:
+        params = {}
+    return tuple(params.get(name, default) / 100.0 for name, default in WPNAV_DEFAULTS.items())
+
+
+def slot_offsets(shape, count, spacing=SPACING):
+    """(count, 3) body-frame offsets (forward, right, down) of the slots of a shape."""
+    i = np.arange(count, dtype=float)
+    offsets = np.zeros((count, 3))
+    if shape == "line":
+        offsets[:, 1] = (i - (count - 1) / 2.0) * spacing
+    elif shape == "wedge":
+        rank = np.ceil(i / 2.0)
+        side = np.where(i % 2 == 1, -1.0, 1.0)
+        offsets[:, 0] = -rank * spacing
+        offsets[:, 1] = side * rank * spacing
+    elif shape == "ring":
+        # Circumference of count * spacing, but never tighter than spacing
+        radius = max(count * spacing / (2 * math.pi), spacing) if count > 1 else 0.0
+        angle = 2 * math.pi * i / max(count, 1)
+        offsets[:, 0] = radius * np.cos(angle)
+        offsets[:, 1] = radius * np.sin(angle)
+    elif shape == "grid":
+        columns = math.ceil(math.sqrt(count))
+        rows = math.ceil(count / columns) if count else 0
+        offsets[:, 0] = -((i // columns) - (rows - 1) / 2.0) * spacing
+        offsets[:, 1] = ((i % columns) - (columns - 1) / 2.0) * spacing
+    else:
+        raise ValueError(f"unknown shape {shape!r} (expected one of {', '.join(SHAPES)})")
+    return offsets
+
+
+def limit_velocities(velocity, limits):
+    """Cap (N, 3) NED velocities in place at (horizontal, up, down) m/s, rounded."""
+    max_speed, max_up, max_down = limits
+    horizontal = np.hypot(velocity[:, 0], velocity[:, 1])
+    scale = max_speed / np.maximum(horizontal, max_speed)
+    velocity[:, :2] *= scale[:, None]
+    # NED: negative z is up
+    np.clip(velocity[:, 2], -max_up, max_down, out=velocity[:, 2])
+    return np.round(velocity, VELOCITY_DECIMALS, out=velocity)
+
+
+def fleet_positions(vehicles, extrapolate=True, out=None):
+    """(N, 3) NED positions from the vehicles' VehicleState.
+
+    With extrapolate, each position is moved on by its velocity times the age
+    of the last LOCAL_POSITION_NED, which matters at low telemetry rates.
+    """
+    count = len(vehicles)
+    out = np.empty((count, 3)) if out is None else out
+    out.reshape(-1)[:] = np.fromiter(
+        (c for v in vehicles for c in (v.state.x, v.state.y, v.state.z)), float, 3 * count)
+    if extrapolate and count:
+        ages = np.fromiter((v.state.age(LOCAL_POSITION) for v in vehicles), float, count)
+        np.minimum(ages, 1.0, out=ages)   # never more than 1 s ahead of stale telemetry
+        velocity = np.fromiter((c for v in vehicles for c in (v.state.vx, v.state.vy, v.state.vz)),
+                               float, 3 * count).reshape(count, 3)
+        out += velocity * ages[:, None]
+    return out
+
+
+class Formation:
+    """Slots, targets and velocity commands for a fleet of N vehicles."""
+
+    def __init__(self, count, shape="line", spacing=SPACING, gain=POSITION_GAIN, limits=None):
+        self.count = count
+        self.gain = gain
+        self.max_speed, self.max_up, self.max_down = limits or speed_limits()
+        self.center = np.zeros(3)
+        self.heading = 0.0
+        self.velocity = np.zeros(3)      # formation velocity, fed forward to every slot
+        self.targets = np.zeros((count, 3))
+        self.set_shape(shape, spacing)
+
+    def set_shape(self, shape, spacing=None):
+        self.shape = shape
+        self.spacing = self.spacing if spacing is None else spacing
+        self.offsets = slot_offsets(shape, self.count, self.spacing)
+        self._update_targets()
+
+    def place(self, center, heading=None, velocity=None):
+        """Move the formation: centre (n, e, d), heading (deg), optional velocity (m/s NED)."""
+        self.center = np.asarray(center, dtype=float)
+        if heading is not None:
+            self.heading = heading
+        if velocity is not None:
+            self.velocity = np.asarray(velocity, dtype=float)
+        self._update_targets()
+        return self.targets
+
+    def _update_targets(self):
+        # Body frame (forward, right) -> NED, rotated by the heading
+        c, s = math.cos(math.radians(self.heading)), math.sin(math.radians(self.heading))
+        rotation = np.array([[c, s, 0.0], [-s, c, 0.0], [0.0, 0.0, 1.0]])
+        np.add(self.offsets @ rotation, self.center, out=self.targets)
+
+    def step(self, positions):
+        """(N, 3) velocity setpoints toward the slots, within the WPNAV speed limits."""
+        velocity = (self.targets - positions) * self.gain
+        velocity += self.velocity
+        return limit_velocities(velocity, (self.max_speed, self.max_up, self.max_down))
+
+    def errors(self, positions):
+        """Distance of each vehicle from its slot (m)."""
+        return np.linalg.norm(self.targets - positions, axis=1)
+
+
+# ----------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------
+
+def bench_step(count, rounds=2000):
+    """Mean microseconds for place() + step() on a fleet of count vehicles."""
+    formation = Formation(count, "wedge", limits=(1.4, 1.4, 1.4))
+    positions = np.random.default_rng(0).normal(0, 20, (count, 3))
+    start = time.perf_counter()
+    for i in range(rounds):
+        formation.place((i * 0.01, 0.0, -10.0), heading=i * 0.1, velocity=(0.5, 0.0, 0.0))
+        formation.step(positions)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def run_bench():
+    period_us = 1e6 / SETPOINT_RATE
+    print(f"{'vehicles':>8} {'us/step':>9} {'% of a ' + str(SETPOINT_RATE) + ' Hz tick':>18}")
+    for count in BENCH_SIZES:
+        us = bench_step(count)
+        print(f"{count:>8} {us:>9.1f} {100 * us / period_us:>17.2f}%")
+
+
+# ----------------------------------------------------------------------
+# Flying a formation
+# ----------------------------------------------------------------------
+
+async def wait_altitude(swarm, altitude, timeout=TAKEOFF_TIMEOUT):
+    """Wait until every vehicle is within 10% of altitude."""
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        heights = np.fromiter((v.state.altitude for v in swarm.vehicles), float, len(swarm))
+        if np.all(heights >= altitude * 0.9):
+            return True
+        await asyncio.sleep(0.5)
+    return False
+
+
+async def fly(args):
+    swarm = Swarm.from_ports(args.count, args.base_port, args.port_step, verbose=args.verbose)
+    print(f"Connecting to {len(swarm)} vehicles...")
+    missing = await swarm.connect(timeout=args.timeout)
+    if missing:
+        print(f"No heartbeat from: {', '.join(missing)}")
+    if not len(swarm):
+        print("No vehicles connected. Exiting.")
+        return
+    try:
+        await swarm.apply_profile(verify=False)
+        if args.takeoff:
+            print(f"GUIDED + arm + takeoff to {args.takeoff}m...")
+            await swarm.set_mode("GUIDED")
+            await swarm.arm()
+            await swarm.takeoff(args.takeoff)
+            if not await wait_altitude(swarm, args.takeoff):
+                print("✗ Not every vehicle reached the takeoff altitude")
+
+        formation = Formation(len(swarm), args.shape, args.spacing)
+        altitude = args.takeoff or args.alt
+        heading = math.radians(args.heading)
+        direction = np.array([math.cos(heading), math.sin(heading), 0.0])
+        positions = np.empty((len(swarm), 3))
+        print(f"{args.shape} formation of {len(swarm)}, {args.spacing} m apart, "
+              f"limits {formation.max_speed:.1f} m/s horizontal")
+
+        def velocities(swarm, t):
+            # The formation moves along its initial heading and turns at turn_rate
+            formation.place(direction * args.speed * t + (0.0, 0.0, -altitude),
+                            args.heading + args.turn_rate * t, direction * args.speed)
+            return formation.step(fleet_positions(swarm.vehicles, out=positions)).tolist()
+
+        task = await swarm.stream_velocities(velocities, args.duration, args.rate)
+        # Against the last tick's targets, before the fleet coasts on
+        errors = formation.errors(positions)
+        print(f"✓ {task.runs} ticks at {args.rate} Hz; slot error mean {errors.mean():.2f} m, "
+              f"max {errors.max():.2f} m")
+        if args.rtl:
+            print("Returning fleet to launch...")
+            await swarm.set_mode("RTL")
+    finally:
+        swarm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fly a fleet in formation (vectorized planner)")
+    parser.add_argument("--count", type=int, default=4)
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--port-step", type=int, default=PORT_STEP)
+    parser.add_argument("--timeout", type=float, default=30, help="heartbeat timeout (s)")
+    parser.add_argument("--shape", choices=SHAPES, default="line")
+    parser.add_argument("--spacing", type=float, default=SPACING)
+    parser.add_argument("--takeoff", type=float, help="GUIDED, arm and take off to this altitude first")
+    parser.add_argument("--alt", type=float, default=10, help="formation altitude when not taking off")
+    parser.add_argument("--heading", type=float, default=0, help="formation heading (deg)")
+    parser.add_argument("--speed", type=float, default=0, help="formation ground speed (m/s)")
+    parser.add_argument("--turn-rate", type=float, default=0, help="formation turn rate (deg/s)")
+    parser.add_argument("--rate", type=float, default=SETPOINT_RATE, help="setpoint rate (Hz)")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--rtl", action="store_true", help="RTL at the end")
+    parser.add_argument("--bench", action="store_true", help="time the planner step and exit")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_bench()
+        return
+    try:
+        asyncio.run(fly(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Batched geodetic conversion around the AirSim OriginGeopoint
+LocalFrame converts whole arrays of positions between geodetic coordinates
+(lat, lon in degrees, altitude in metres) and NED metres from the origin in
+config/airsim/settings.json (Gasibu, -6.9003, 107.6186, 768 m). Everything
+that depends on the origin, the ECEF position, the ECEF -> NED rotation and
+the tangent-plane scale factors, is computed once per frame; a conversion
+is then a few array operations on an (N, 3) array, with no loop per point.
+
+Two modes:
+  exact  WGS84 through ECEF, with the closed-form (Heikkinen) inverse.
+         Round trip error is far below 1 mm at any range; this is the
+         geometry AirSim itself uses for its GPS.
+  fast   local tangent plane: scaled lat/lon offsets with the WGS84 radii of
+         curvature at the origin, altitude straight down. 2-4x faster.
+         It ignores the earth's curvature, so the error grows with the
+         square of the distance: about 2 cm at 500 m, 8 cm at 1 km, 2 m at
+         5 km (mostly vertical). Fine for a swarm over one field.
+
+Altitudes are taken as AMSL, as in GLOBAL_POSITION_INT and the AirSim
+origin; the geoid separation is ignored.
+
+Usage:
+  python3 geodesy.py                       # origin, scale factors, accuracy table
+  python3 geodesy.py --bench               # points per second, both modes
+  python3 geodesy.py --ned 100 50 -10      # one NED point -> lat, lon, alt
+  python3 geodesy.py --lla -6.9 107.62 780 # one geodetic point -> NED
+"""
+
+import argparse
+import functools
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "config", "airsim", "settings.json")
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+WGS84_E2 = WGS84_F * (2 - WGS84_F)              # first eccentricity squared
+WGS84_EP2 = WGS84_E2 / (1 - WGS84_E2)           # second eccentricity squared
+
+# Ranges (m) of the accuracy table, and point counts of the benchmark
+CHECK_RANGES = (100, 500, 1000, 5000, 20000)
+BENCH_SIZES = (1000, 10000, 100000)
+
+
+def load_origin(path=SETTINGS_FILE):
+    """(lat, lon, alt) of the AirSim OriginGeopoint."""
+    with open(path) as f:
+        origin = json.load(f)["OriginGeopoint"]
+    return origin["Latitude"], origin["Longitude"], origin["Altitude"]
+
+
+def lla_to_ecef(lla):
+    """(..., 3) lat, lon (deg), alt (m) -> (..., 3) ECEF (m)."""
+    lla = np.asarray(lla, dtype=float)
+    lat, lon = np.radians(lla[..., 0]), np.radians(lla[..., 1])
+    sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat ** 2)
+    out = np.empty(lla.shape)
+    out[..., 0] = (n + lla[..., 2]) * cos_lat * np.cos(lon)
+    out[..., 1] = (n + lla[..., 2]) * cos_lat * np.sin(lon)
+    out[..., 2] = (n * (1 - WGS84_E2) + lla[..., 2]) * sin_lat
+    return out
+
+
+def ecef_to_lla(ecef):
+    """(..., 3) ECEF (m) -> (..., 3) lat, lon (deg), alt (m); closed form, no iteration."""
+    ecef = np.asarray(ecef, dtype=float)
+    x, y, z = ecef[..., 0], ecef[..., 1], ecef[..., 2]
+    a2, b2 = WGS84_A ** 2, WGS84_B ** 2
+    p2 = x * x + y * y
+    p = np.sqrt(p2)
+    f = 54 * b2 * z * z
+    g = p2 + (1 - WGS84_E2) * z * z - WGS84_E2 * (a2 - b2)
+    c = WGS84_E2 ** 2 * f * p2 / g ** 3
+    s = np.cbrt(1 + c + np.sqrt(c * c + 2 * c))
+    k = f / (3 * (s + 1 / s + 1) ** 2 * g * g)
+    q = np.sqrt(1 + 2 * WGS84_E2 ** 2 * k)
+    r0 = (-k * WGS84_E2 * p / (1 + q)
+          + np.sqrt(np.maximum(a2 / 2 * (1 + 1 / q) - k * (1 - WGS84_E2) * z * z / (q * (1 + q))
+                               - k * p2 / 2, 0.0)))
+    t = (p - WGS84_E2 * r0) ** 2
+    u = np.sqrt(t + z * z)
+    v = np.sqrt(t + (1 - WGS84_E2) * z * z)
+    z0 = b2 * z / (WGS84_A * v)
+    out = np.empty(ecef.shape)
+    out[..., 0] = np.degrees(np.arctan2(z + WGS84_EP2 * z0, p))
+    out[..., 1] = np.degrees(np.arctan2(y, x))
+    out[..., 2] = u * (1 - b2 / (WGS84_A * v))
+    return out
+
+
+class LocalFrame:
+    """NED frame at a geodetic origin, with everything per-origin precomputed."""
+
+    def __init__(self, origin=None):
+        self.origin = tuple(float(c) for c in (origin or load_origin()))
+        lat0, lon0, alt0 = self.origin
+        self.origin_ecef = lla_to_ecef(self.origin)
+        sin_lat, cos_lat = math.sin(math.radians(lat0)), math.cos(math.radians(lat0))
+        sin_lon, cos_lon = math.sin(math.radians(lon0)), math.cos(math.radians(lon0))
+        # Rows are the north, east and down unit vectors in ECEF
+        self.rotation = np.array([
+            [-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat],
+            [-sin_lon, cos_lon, 0.0],
+            [-cos_lat * cos_lon, -cos_lat * sin_lon, -sin_lat],
+        ])
+        # Radii of curvature at the origin: meridian and prime vertical
+        w = 1 - WGS84_E2 * sin_lat ** 2
+        meridian = WGS84_A * (1 - WGS84_E2) / w ** 1.5
+        prime_vertical = WGS84_A / math.sqrt(w)
+        # Metres per degree for the tangent-plane mode
+        self.north_scale = math.radians(1) * (meridian + alt0)
+        self.east_scale = math.radians(1) * (prime_vertical + alt0) * cos_lat
+
+    def lla_to_ned(self, lla, fast=False):
+        """(..., 3) lat, lon (deg), alt (m) -> (..., 3) NED (m) from the origin."""
+        lla = np.asarray(lla, dtype=float)
+        if not fast:
+            return (lla_to_ecef(lla) - self.origin_ecef) @ self.rotation.T
+        lat0, lon0, alt0 = self.origin
+        out = np.empty(lla.shape)
+        out[..., 0] = (lla[..., 0] - lat0) * self.north_scale
+        # Wrapped, so the frame works across the antimeridian
+        out[..., 1] = ((lla[..., 1] - lon0 + 180.0) % 360.0 - 180.0) * self.east_scale
+        out[..., 2] = alt0 - lla[..., 2]
+        return out
+
+    def ned_to_lla(self, ned, fast=False):
+        """(..., 3) NED (m) from the origin -> (..., 3) lat, lon (deg), alt (m)."""
+        ned = np.asarray(ned, dtype=float)
+        if not fast:
+            return ecef_to_lla(ned @ self.rotation + self.origin_ecef)
+        lat0, lon0, alt0 = self.origin
+        out = np.empty(ned.shape)
+        out[..., 0] = lat0 + ned[..., 0] / self.north_scale
+        out[..., 1] = (lon0 + ned[..., 1] / self.east_scale + 180.0) % 360.0 - 180.0
+        out[..., 2] = alt0 - ned[..., 2]
+        return out
+
+    def global_position_to_ned(self, lat_e7, lon_e7, alt_mm, fast=False):
+        """NED from GLOBAL_POSITION_INT fields (arrays of degE7 and mm AMSL)."""
+        lla = np.column_stack((np.asarray(lat_e7) * 1e-7, np.asarray(lon_e7) * 1e-7,
+                               np.asarray(alt_mm) * 1e-3))
+        return self.lla_to_ned(lla, fast)
+
+
+@functools.lru_cache(maxsize=16)
+def local_frame(origin=None):
+    """Shared LocalFrame per origin tuple (the AirSim origin if None)."""
+    return LocalFrame(origin)
+
+
+def fleet_lla(vehicles, out=None):
+    """(N, 3) lat, lon, alt AMSL from the vehicles' last GLOBAL_POSITION_INT."""
+    count = len(vehicles)
+    out = np.empty((count, 3)) if out is None else out
+    out.reshape(-1)[:] = np.fromiter(
+        (c for v in vehicles for c in (v.state.lat, v.state.lon, v.state.alt_msl)), float, 3 * count)
+    return out
+
+
+# ----------------------------------------------------------------------
+# Accuracy and benchmark
+# ----------------------------------------------------------------------
+
+def ring_points(distance, count=360, height=100.0):
+    """NED points on a circle of the given radius, at 0..height above the origin."""
+    bearing = np.linspace(0, 2 * math.pi, count, endpoint=False)
+    up = np.linspace(0, height, count)
+    return np.column_stack((distance * np.cos(bearing), distance * np.sin(bearing), -up))
+
+
+def check_accuracy(frame):
+    """{range: (exact round trip m, fast horizontal m, fast vertical m)} worst cases."""
+    result = {}
+    for distance in CHECK_RANGES:
+        ned = ring_points(distance)
+        lla = frame.ned_to_lla(ned)
+        round_trip = np.abs(frame.lla_to_ned(lla) - ned).max()
+        # The tangent plane against the exact conversion of the same points
+        error = frame.lla_to_ned(lla, fast=True) - ned
+        result[distance] = (round_trip, np.hypot(error[:, 0], error[:, 1]).max(),
+                            np.abs(error[:, 2]).max())
+    return result
+
+
+def bench(frame, count, rounds=20):
+    """Points per second for {(direction, mode)}."""
+    ned = np.random.default_rng(0).uniform(-2000, 2000, (count, 3))
+    lla = frame.ned_to_lla(ned)
+    rates = {}
+    for direction, fn, data in (("lla->ned", frame.lla_to_ned, lla), ("ned->lla", frame.ned_to_lla, ned)):
+        for mode, fast in (("exact", False), ("fast", True)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                fn(data, fast)
+            rates[(direction, mode)] = count * rounds / (time.perf_counter() - start)
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geodetic <-> NED conversion around the AirSim origin")
+    parser.add_argument("--settings", default=SETTINGS_FILE)
+    parser.add_argument("--fast", action="store_true", help="tangent-plane mode for --ned/--lla")
+    parser.add_argument("--ned", nargs=3, type=float, metavar=("N", "E", "D"))
+    parser.add_argument("--lla", nargs=3, type=float, metavar=("LAT", "LON", "ALT"))
+    parser.add_argument("--bench", action="store_true", help="time both modes and exit")
+    args = parser.parse_args()
+
+    frame = LocalFrame(load_origin(args.settings))
+    if args.ned:
+        lat, lon, alt = frame.ned_to_lla(args.ned, args.fast)
+        print(f"lat {lat:.7f}  lon {lon:.7f}  alt {alt:.2f} m")
+        return
+    if args.lla:
+        north, east, down = frame.lla_to_ned(args.lla, args.fast)
+        print(f"N {north:.3f}  E {east:.3f}  D {down:.3f} m")
+        return
+    if args.bench:
+        print(f"{'points':>8} {'direction':<9} {'exact pts/s':>12} {'fast pts/s':>12}")
+        for count in BENCH_SIZES:
+            rates = bench(frame, count)
+            for direction in ("lla->ned", "ned->lla"):
+                print(f"{count:>8} {direction:<9} {rates[(direction, 'exact')]:>12,.0f} "
+                      f"{rates[(direction, 'fast')]:>12,.0f}")
+        return
+
+    lat0, lon0, alt0 = frame.origin
+    print(f"Origin {lat0}, {lon0}, {alt0} m  ({args.settings})")
+    print(f"Tangent plane: {frame.north_scale:.3f} m/deg north, {frame.east_scale:.3f} m/deg east")
+    print(f"{'range m':>8} {'exact round trip':>17} {'fast horiz':>11} {'fast vert':>10}")
+    for distance, (round_trip, horizontal, vertical) in check_accuracy(frame).items():
+        print(f"{distance:>8} {round_trip * 1000:>14.3f} mm {horizontal:>9.3f} m {vertical:>8.3f} m")
+
+
+if __name__ == "__main__":
+    main()
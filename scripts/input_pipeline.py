@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Keyboard input pipeline for the manual control scripts
+The pynput listener thread no longer touches control state: its callbacks
+put (key, pressed, time) events on a thread-safe queue. The control loop
+sleeps on that queue (wait() is the RateScheduler's sleep), so an event wakes
+it at once, the axes are re-evaluated and the new setpoint is sent straight
+away instead of on the next tick. The periodic tick still runs, for ramps
+and the SetpointStream keepalive.
+
+Keys drive axes with values in [-1, 1]:
+  spring  deflected while a key is held, back to 0 on release (sticks)
+  hold    nudged on press, then moves at `rate` per second while held, and
+          stays where it was left (throttle)
+Spring axes approach their target at `ramp` per second (0 = at once); the
+expo curve (1 - expo) * x + expo * x**3 softens the centre. Both are applied
+in the send path, each time a setpoint is computed.
+
+The latency from the listener callback to the frame leaving the socket is
+kept in a histogram (report(), summary()).
+
+Usage:
+  pipeline = InputPipeline({"roll": Axis("a", "d", ramp=4, expo=0.3)}, send)
+  scheduler = RateScheduler(sleep=pipeline.wait)
+  keyboard.Listener(on_press=pipeline.on_press, on_release=pipeline.on_release)
+"""
+
+import queue
+import time
+
+from metrics import Histogram
+
+# Keys that stop the pynput listener
+STOP_KEYS = ("esc",)
+
+
+def key_name(key):
+    """pynput key -> 'w', 'space', 'up', ... (lowercase characters)."""
+    char = getattr(key, "char", None)
+    if char:
+        return char.lower()
+    return getattr(key, "name", None) or str(key)
+
+
+def expo_curve(x, expo):
+    return (1.0 - expo) * x + expo * x * x * x
+
+
+class Axis:
+    """One control axis driven by a negative and a positive key."""
+
+    def __init__(self, negative, positive, ramp=0.0, expo=0.0, rate=None, nudge=0.0,
+                 value=0.0):
+        self.negative = negative
+        self.positive = positive
+        self.ramp = ramp
+        self.expo = expo
+        self.rate = rate        # None: spring axis
+        self.nudge = nudge
+        self.value = value
+
+    def direction(self, held):
+        return (self.positive in held) - (self.negative in held)
+
+    def pressed(self, key):
+        """Apply the press nudge of a hold axis."""
+        if self.rate is not None and key in (self.negative, self.positive):
+            step = self.nudge if key == self.positive else -self.nudge
+            self.value = max(-1.0, min(1.0, self.value + step))
+
+    def step(self, held, dt):
+        direction = self.direction(held)
+        if self.rate is not None:
+            self.value = max(-1.0, min(1.0, self.value + direction * self.rate * dt))
+        elif self.ramp > 0:
+            delta = direction - self.value
+            limit = self.ramp * dt
+            self.value += max(-limit, min(limit, delta))
+        else:
+            self.value = float(direction)
+        return self.value
+
+    def centre(self):
+        if self.rate is None:
+            self.value = 0.0
+
+    @property
+    def output(self):
+        return expo_curve(self.value, self.expo)
+
+
+class InputPipeline:
+    """Key events from the listener thread, applied and sent on the control thread.
+
+    send(outputs) receives {axis name: output} and returns True when a frame
+    went out; actions maps a key to a callable run on its press.
+    """
+
+    def __init__(self, axes, send, actions=None, stop_keys=STOP_KEYS, clock=time.monotonic):
+        self.axes = axes
+        self.send = send
+        self.actions = actions or {}
+        self.stop_keys = stop_keys
+        self.clock = clock
+        self.events = queue.SimpleQueue()
+        self.held = set()
+        self.last_step = None
+        self.latency = Histogram()
+        self.events_handled = 0
+        self.immediate_sends = 0
+
+    # ------------------------------------------------------------------
+    # Listener thread
+    # ------------------------------------------------------------------
+
+    def on_press(self, key):
+        name = key_name(key)
+        self.events.put((name, True, self.clock()))
+        if name in self.stop_keys:
+            return False
+
+    def on_release(self, key):
+        self.events.put((key_name(key), False, self.clock()))
+
+    # ------------------------------------------------------------------
+    # Control thread
+    # ------------------------------------------------------------------
+
+    def wait(self, timeout):
+        """Sleep up to timeout, returning early to apply and send key events."""
+        try:
+            event = self.events.get(timeout=max(timeout, 0.0))
+        except queue.Empty:
+            return
+        # Bring ramps up to now with the keys held before these events
+        self.step()
+        stamps = []
+        while event is not None:
+            name, pressed, stamp = event
+            if self._apply(name, pressed):
+                stamps.append(stamp)
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                event = None
+        if stamps and self.send(self.outputs()):
+            now = self.clock()
+            self.immediate_sends += 1
+            for stamp in stamps:
+                self.latency.add(now - stamp)
+
+    def _apply(self, name, pressed):
+        """Update held keys; True if the event can change a setpoint."""
+        self.events_handled += 1
+        if not pressed:
+            if name not in self.held:
+                return False
+            self.held.discard(name)
+            return True
+        if name in self.held:
+            return False   # keyboard auto-repeat
+        self.held.add(name)
+        for axis in self.axes.values():
+            axis.pressed(name)
+        action = self.actions.get(name)
+        if action is not None:
+            action()
+        return True
+
+    def step(self):
+        now = self.clock()
+        dt = now - self.last_step if self.last_step is not None else 0.0
+        self.last_step = now
+        for axis in self.axes.values():
+            axis.step(self.held, dt)
+
+    def outputs(self):
+        return {name: axis.output for name, axis in self.axes.items()}
+
+    def tick(self):
+        """Periodic update: advance ramps and offer the setpoint (keepalive included)."""
+        self.step()
+        return self.send(self.outputs())
+
+    def centre(self):
+        """Release every key and centre the spring axes."""
+        self.held.clear()
+        for axis in self.axes.values():
+            axis.centre()
+
+    # ------------------------------------------------------------------
+    # Reports
+    # ------------------------------------------------------------------
+
+    def report(self):
+        return {
+            "events": self.events_handled,
+            "immediate_sends": self.immediate_sends,
+            "key_to_wire_ms": self.latency.snapshot(1000),
+        }
+
+    def summary(self):
+        lat = self.latency.snapshot(1000)
+        if not lat["count"]:
+            return f"input: {self.events_handled} key events, no setpoint changes"
+        return (f"input: {self.events_handled} key events, {self.immediate_sends} immediate sends, "
+                f"key-to-wire p50 {lat['p50']:.2f} ms / p99 {lat['p99']:.2f} ms / "
+                f"max {lat['max']:.2f} ms")
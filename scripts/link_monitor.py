@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Link health monitor
+Watches one MAVLink connection through pymavlink's parse callback, so it
+sees every frame whether the connection is read with recv_match() or by a
+mav_link.MavLink reader, and costs a few dictionary operations per received
+message. Sent traffic is read from pymavlink's own counters and commands are
+timed through a wrapper on command_long_send/command_int_send, so no send
+callback is installed and fast_encode.py keeps its fast path. pymavlink
+swaps in a new MAVLink object on the first MAVLink 2 frame (copying only the
+callbacks); the monitor notices on the next received message and moves its
+wrappers and counter bases over:
+
+  monitor = LinkMonitor(vehicle, name="v0")   # vehicle = mavutil connection
+  ...
+  print(monitor.snapshot())
+
+Per connection it tracks heartbeat interval, packet loss from MAVLink
+sequence gaps (a repeated or late frame counts as reordered, not lost), TIMESYNC round-trip time (a ping goes out once a second),
+COMMAND_LONG/COMMAND_INT to COMMAND_ACK latency for every command sent,
+decode errors and byte rates. Timings are rolling histograms over the last
+minute; snapshots are plain dicts (JSON) or Prometheus text exposition.
+
+Usage:
+  python3 link_monitor.py --check                 # offline self-test
+  python3 link_monitor.py --count 4 --duration 60
+  python3 link_monitor.py --connections udp:127.0.0.1:14551 --prom /tmp/mavlink.prom
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from pymavlink import mavutil
+
+from metrics import RollingHistogram
+
+# Rolling window for the timing histograms (s) and its number of slots
+WINDOW = 60.0
+SLOTS = 6
+
+# TIMESYNC ping period (s); 0 disables pinging
+TIMESYNC_INTERVAL = 1.0
+
+# Commands without an ACK after this long (s) count as unanswered
+COMMAND_TIMEOUT = 5.0
+
+# Histogram bounds in seconds: 1 ms .. 10 s (RTTs, latencies, heartbeats)
+BOUNDS = tuple(10 ** (e / 8) * 1e-3 for e in range(33))
+
+# A sequence number at most this far behind the last one (mod 256) is a
+# duplicate or reordered frame rather than a gap of lost ones
+REORDER_WINDOW = 128
+
+# Wrapped command senders -> position of `command` after the two target fields
+COMMAND_SENDS = {"command_long_send": 0, "command_int_send": 1}
+
+
+class LinkMonitor:
+    """Health counters and rolling timing histograms for one connection."""
+
+    def __init__(self, conn, name=None, timesync_interval=TIMESYNC_INTERVAL, window=WINDOW):
+        self.conn = conn
+        self.name = name or getattr(conn, "address", "link")
+        self.timesync_interval = timesync_interval
+        self.started = time.monotonic()
+
+        self.heartbeat_interval = RollingHistogram(window, SLOTS, BOUNDS)
+        self.timesync_rtt = RollingHistogram(window, SLOTS, BOUNDS)
+        self.command_latency = RollingHistogram(window, SLOTS, BOUNDS)
+
+        self.messages_received = 0
+        self.bytes_received = 0
+        self.packets_lost = 0
+        self.packets_reordered = 0
+        self.decode_errors = 0
+        self.commands_sent = 0
+        self.commands_acked = 0
+        self.commands_unanswered = 0
+        self.last_heartbeat = None
+
+        self._last_seq = {}          # (sysid, compid) -> last sequence number
+        self._last_heartbeat = {}    # sysid -> monotonic time
+        self._pending = {}           # (sysid, command) -> send time
+        self._next_ping = 0.0
+        self._ping_ns = None
+        self._previous = (self.started, 0, 0, 0, 0, 0)
+
+        mav = conn.mav
+        self._chained = (mav.callback, mav.callback_args, mav.callback_kwargs)
+        mav.set_callback(self._on_receive)
+        self._sent_before = (0, 0)   # sent through MAVLink objects since replaced
+        self._adopt(mav, (mav.total_packets_sent, mav.total_bytes_sent))
+
+    def _adopt(self, mav, base):
+        """Wrap mav's command senders and count its sends from base on.
+
+        Only the (rare) command sends are wrapped; the setpoint path is untouched.
+        """
+        self._mav = mav
+        self._sent_base = base
+        self._wrapped = {name: mav.__dict__.get(name) for name in COMMAND_SENDS}
+        for name, index in COMMAND_SENDS.items():
+            setattr(mav, name, self._command_sender(getattr(mav, name), index))
+
+    def _follow(self):
+        """Move over to the connection's current MAVLink object if it was replaced."""
+        mav = self.conn.mav
+        old = self._mav
+        if mav is old:
+            return
+        packets, nbytes = self._sent_before
+        self._sent_before = (packets + old.total_packets_sent - self._sent_base[0],
+                             nbytes + old.total_bytes_sent - self._sent_base[1])
+        # pymavlink's replacement starts its counters at zero
+        self._adopt(mav, (0, 0))
+
+    def detach(self):
+        """Restore whatever callbacks were installed before the monitor."""
+        self._follow()
+        mav = self.conn.mav
+        mav.callback, mav.callback_args, mav.callback_kwargs = self._chained
+        for name, previous in self._wrapped.items():
+            if previous is None:
+                mav.__dict__.pop(name, None)
+            else:
+                setattr(mav, name, previous)
+
+    @property
+    def messages_sent(self):
+        self._follow()
+        return self._sent_before[0] + self._mav.total_packets_sent - self._sent_base[0]
+
+    @property
+    def bytes_sent(self):
+        self._follow()
+        return self._sent_before[1] + self._mav.total_bytes_sent - self._sent_base[1]
+
+    # ------------------------------------------------------------------
+    # Callbacks (run inside pymavlink's parser and command sends)
+    # ------------------------------------------------------------------
+
+    def _on_receive(self, msg, *args, **kwargs):
+        if self.conn.mav is not self._mav:
+            self._follow()
+        mtype = msg.get_type()
+        if mtype == 'BAD_DATA':
+            self.decode_errors += 1
+        else:
+            self.observe(msg, mtype)
+        callback, cargs, ckwargs = self._chained
+        if callback is not None:
+            callback(msg, *cargs, **ckwargs)
+
+    def _command_sender(self, send, index):
+        def command_send(target_system, target_component, *args, **kwargs):
+            command = args[index] if len(args) > index else kwargs["command"]
+            self.commands_sent += 1
+            self._pending[(target_system, command)] = time.monotonic()
+            return send(target_system, target_component, *args, **kwargs)
+        return command_send
+
+    def observe(self, msg, mtype=None):
+        """Account for one received message."""
+        mtype = mtype or msg.get_type()
+        now = time.monotonic()
+        self.messages_received += 1
+        self.bytes_received += len(msg.get_msgbuf())
+
+        header = msg.get_header()
+        source = (header.srcSystem, header.srcComponent)
+        last = self._last_seq.get(source)
+        step = (header.seq - last) & 0xFF if last is not None else 1
+        if step == 0 or step > REORDER_WINDOW:
+            # Repeated or late frame: the newest sequence number stays
+            self.packets_reordered += 1
+        else:
+            self.packets_lost += step - 1
+            self._last_seq[source] = header.seq
+
+        if mtype == 'HEARTBEAT':
+            if msg.type != mavutil.mavlink.MAV_TYPE_GCS:
+                previous = self._last_heartbeat.get(header.srcSystem)
+                if previous is not None:
+                    self.heartbeat_interval.add(now - previous)
+                self._last_heartbeat[header.srcSystem] = now
+                self.last_heartbeat = now
+        elif mtype == 'COMMAND_ACK':
+            sent = self._pending.pop((header.srcSystem, msg.command), None)
+            if sent is None:
+                sent = self._pending.pop((0, msg.command), None)
+            if sent is not None:
+                self.commands_acked += 1
+                self.command_latency.add(now - sent)
+        elif mtype == 'TIMESYNC':
+            if msg.tc1 != 0 and msg.ts1 == self._ping_ns:
+                self.timesync_rtt.add((time.monotonic_ns() - msg.ts1) / 1e9)
+                self._ping_ns = None
+
+        if self.timesync_interval and now >= self._next_ping:
+            self._next_ping = now + self.timesync_interval
+            self.ping()
+
+    def ping(self):
+        """Send a TIMESYNC request; the reply's ts1 echoes ours."""
+        self._ping_ns = time.monotonic_ns()
+        self.conn.mav.timesync_send(0, self._ping_ns)
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    @property
+    def loss_pct(self):
+        expected = self.messages_received + self.packets_lost
+        return 100.0 * self.packets_lost / expected if expected else 0.0
+
+    def _expire_commands(self, now):
+        for key, sent in list(self._pending.items()):
+            if now - sent > COMMAND_TIMEOUT:
+                del self._pending[key]
+                self.commands_unanswered += 1
+
+    def snapshot(self):
+        """Totals, rates since the previous snapshot and timing summaries (ms)."""
+        now = time.monotonic()
+        self._expire_commands(now)
+        then, received, lost, nbytes_in, nbytes_out, errors = self._previous
+        elapsed = max(now - then, 1e-6)
+        self._previous = (now, self.messages_received, self.packets_lost,
+                          self.bytes_received, self.bytes_sent, self.decode_errors)
+        new_received = self.messages_received - received
+        new_lost = self.packets_lost - lost
+        return {
+            "name": self.name,
+            "uptime_s": now - self.started,
+            "messages_received": self.messages_received,
+            "messages_sent": self.messages_sent,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "packets_lost": self.packets_lost,
+            "packets_reordered": self.packets_reordered,
+            "decode_errors": self.decode_errors,
+            "commands_sent": self.commands_sent,
+            "commands_acked": self.commands_acked,
+            "commands_unanswered": self.commands_unanswered,
+            "loss_pct": self.loss_pct,
+            "recent_loss_pct": (100.0 * new_lost / (new_received + new_lost)
+                                if new_received + new_lost else 0.0),
+            "msgs_per_s": new_received / elapsed,
+            "rx_bytes_per_s": (self.bytes_received - nbytes_in) / elapsed,
+            "tx_bytes_per_s": (self.bytes_sent - nbytes_out) / elapsed,
+            "decode_errors_per_s": (self.decode_errors - errors) / elapsed,
+            "heartbeat_age_ms": (now - self.last_heartbeat) * 1000 if self.last_heartbeat else None,
+            "heartbeat_interval_ms": self.heartbeat_interval.snapshot(1000),
+            "timesync_rtt_ms": self.timesync_rtt.snapshot(1000),
+            "command_latency_ms": self.command_latency.snapshot(1000),
+        }
+
+    def summary(self, s=None):
+        """One status line (from a fresh snapshot unless one is given)."""
+        s = s or self.snapshot()
+        rtt = s["timesync_rtt_ms"]
+        ack = s["command_latency_ms"]
+        hb = s["heartbeat_interval_ms"]
+        return (f"[{self.name}] {s['msgs_per_s']:.0f} msg/s  "
+                f"rx {s['rx_bytes_per_s'] / 1000:.1f} kB/s  tx {s['tx_bytes_per_s'] / 1000:.1f} kB/s  "
+                f"loss {s['loss_pct']:.1f}%  bad {s['decode_errors']}  "
+                f"hb {hb.get('p50', float('nan')):.0f} ms  "
+                f"rtt p50/p99 {rtt.get('p50', float('nan')):.1f}/{rtt.get('p99', float('nan')):.1f} ms  "
+                f"ack p50 {ack.get('p50', float('nan')):.1f} ms "
+                f"({s['commands_acked']}/{s['commands_sent']})")
+
+
+# ----------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------
+
+COUNTERS = {
+    "messages_received": "MAVLink messages decoded",
+    "messages_sent": "MAVLink messages sent",
+    "bytes_received": "Bytes in decoded messages",
+    "bytes_sent": "Bytes sent",
+    "packets_lost": "Messages missing from sequence numbers",
+    "packets_reordered": "Messages repeated or arriving after a later sequence number",
+    "decode_errors": "Frames that failed to decode",
+    "commands_sent": "COMMAND_LONG/COMMAND_INT sent",
+    "commands_acked": "Commands answered by COMMAND_ACK",
+    "commands_unanswered": f"Commands without COMMAND_ACK after {COMMAND_TIMEOUT:g}s",
+}
+
+SUMMARIES = {
+    "heartbeat_interval": "Interval between vehicle heartbeats",
+    "timesync_rtt": "TIMESYNC round-trip time",
+    "command_latency": "Command to COMMAND_ACK latency",
+}
+
+
+def prometheus_text(monitors):
+    """Prometheus text exposition for a list of monitors."""
+    lines = []
+    for key, help_text in COUNTERS.items():
+        name = f"mavlink_{key}_total"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{link="{m.name}"}} {getattr(m, key)}' for m in monitors]
+    for key, help_text in SUMMARIES.items():
+        name = f"mavlink_{key}_seconds"
+        lines += [f"# HELP {name} {help_text} (last {WINDOW:g}s)", f"# TYPE {name} summary"]
+        for m in monitors:
+            h = getattr(m, key).merged()
+            for q in (0.5, 0.9, 0.99):
+                lines.append(f'{name}{{link="{m.name}",quantile="{q}"}} {h.percentile(q * 100):.6f}')
+            lines.append(f'{name}_sum{{link="{m.name}"}} {h.total:.6f}')
+            lines.append(f'{name}_count{{link="{m.name}"}} {h.count}')
+    return "\n".join(lines) + "\n"
+
+
+def write_snapshot(path, monitors, snapshots=None):
+    """Write JSON (or Prometheus text for *.prom) atomically, for scrapers."""
+    if path.endswith(".prom"):
+        text = prometheus_text(monitors)
+    else:
+        snapshots = snapshots or [m.snapshot() for m in monitors]
+        text = json.dumps({"time": time.time(), "links": snapshots}, indent=1)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+# ----------------------------------------------------------------------
+# Self-test
+# ----------------------------------------------------------------------
+
+def _check():
+    """Offline checks: sequence accounting, and commands counted across pymavlink's v1 -> v2 swap."""
+    import socket
+    from pymavlink.dialects.v20 import ardupilotmega as v20
+    from fast_encode import _Sink
+
+    vehicle = v20.MAVLink(None, srcSystem=1, srcComponent=1)
+
+    # A repeated frame and a late one are reordering; 2 -> 5 loses two frames
+    sink = _Sink(v20)
+    monitor = LinkMonitor(sink, "sequence", timesync_interval=0)
+    for seq in (0, 1, 2, 2, 5, 4, 6):
+        vehicle.seq = seq
+        sink.mav.parse_buffer(vehicle.heartbeat_encode(2, 3, 0, 0, 0).pack(vehicle))
+    if (monitor.packets_lost, monitor.packets_reordered) != (2, 2):
+        raise AssertionError(f"sequence: {monitor.packets_lost} lost, "
+                             f"{monitor.packets_reordered} reordered (expected 2, 2)")
+    print("✓ repeated and late frames count as reordered, gaps as lost")
+
+    # Monitor built before the heartbeat, as SwarmVehicle does
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    conn = mavutil.mavlink_connection(f"udpin:127.0.0.1:{port}", source_system=255)
+    peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        first = conn.mav
+        monitor = LinkMonitor(conn, "swap", timesync_interval=0)
+        peer.sendto(vehicle.heartbeat_encode(2, 3, 0, 0, 0).pack(vehicle), ("127.0.0.1", port))
+        if not conn.wait_heartbeat(timeout=2):
+            raise AssertionError("no heartbeat over loopback")
+        swapped = conn.mav is not first
+        conn.mav.command_long_send(1, 1, mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                                   0, 1, 0, 0, 0, 0, 0, 0)
+        sent = len(peer.recv(512))
+        peer.sendto(vehicle.command_ack_encode(mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                                               0).pack(vehicle), ("127.0.0.1", port))
+        conn.recv_match(type="COMMAND_ACK", blocking=True, timeout=2)
+        counts = (monitor.commands_sent, monitor.commands_acked,
+                  monitor.messages_sent, monitor.bytes_sent)
+        if counts != (1, 1, 1, sent):
+            raise AssertionError(f"commands sent/acked, messages/bytes sent {counts}, "
+                                 f"expected (1, 1, 1, {sent})")
+        print(f"✓ monitor built before the heartbeat counts commands "
+              f"({'across' if swapped else 'without'} the MAVLink 2 switch)")
+    finally:
+        peer.close()
+        conn.close()
+
+
+# ----------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------
+
+async def run(args):
+    from swarm import Swarm
+    if args.connections:
+        swarm = Swarm(args.connections.split(","))
+    else:
+        swarm = Swarm.from_ports(args.count, args.base_port, args.port_step)
+    print(f"Connecting to {len(swarm)} vehicles...")
+    missing = await swarm.connect(timeout=args.timeout)
+    if missing:
+        print(f"No heartbeat from: {', '.join(missing)}")
+    monitors = [v.monitor for v in swarm.vehicles]
+    print(f"✓ Monitoring {len(monitors)} links")
+
+    end = time.monotonic() + args.duration
+    try:
+        while time.monotonic() < end:
+            await asyncio.sleep(args.interval)
+            snapshots = [m.snapshot() for m in monitors]
+            for path in (args.json, args.prom):
+                if path:
+                    write_snapshot(path, monitors, snapshots)
+            print()
+            for m, s in zip(monitors, snapshots):
+                print(m.summary(s))
+    finally:
+        swarm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor MAVLink link health")
+    parser.add_argument("--connections", help="comma-separated connection strings")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--base-port", type=int, default=14550)
+    parser.add_argument("--port-step", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30, help="heartbeat timeout (s)")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--interval", type=float, default=5, help="report interval (s)")
+    parser.add_argument("--json", metavar="PATH", help="write a JSON snapshot every interval")
+    parser.add_argument("--prom", metavar="PATH", help="write Prometheus text every interval")
+    parser.add_argument("--check", action="store_true", help="run the offline self-test and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        _check()
+        return
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Asyncio MAVLink link for AirSim + ArduPilot SITL
+One reader owns the socket: every incoming message is decoded once and handed
+to subscribers, per-type queues and pending waits, so no helper ever throws
+away telemetry it did not ask for.
+
+The blocking helpers from control_drone.py are available here as awaitable
+methods, which lets a single event loop drive many vehicles.
+"""
+
+import asyncio
+import time
+from collections import deque
+from pymavlink import mavutil
+
+import control_drone
+from command_dispatcher import RETRIES, CommandDispatcher
+from control_drone import CONNECTION_STRING
+
+# Per-type queues keep at most this many messages; the oldest is dropped
+QUEUE_SIZE = 100
+
+# Poll period for connections that do not expose a file descriptor
+POLL_INTERVAL = 0.005
+
+# Number of command round-trip samples kept per link
+RTT_SAMPLES = 100
+
+
+class MavLink:
+    """One MAVLink connection serviced by the running asyncio event loop."""
+
+    def __init__(self, connection_string=CONNECTION_STRING, name=None, sysid=None,
+                 verbose=True, connection=None, **kwargs):
+        self.connection_string = connection_string
+        self.sysid = sysid
+        self.name = name or connection_string
+        self.verbose = verbose
+        # An already-open mavutil-style connection (e.g. a replay) may be passed in
+        self.conn = connection or mavutil.mavlink_connection(connection_string, **kwargs)
+
+        self._subscribers = {}  # message type ('*' for all) -> [callback]
+        self._queues = {}       # message type -> asyncio.Queue
+        self._waiters = {}      # message type -> [(condition, future)]
+        self._loop = None
+        self._poll_task = None
+
+        self.messages_received = 0
+        self.bad_data = 0
+        self.last_message_time = None
+        self.command_rtts = deque(maxlen=RTT_SAMPLES)
+        # Outstanding commands, matched to their COMMAND_ACK by this reader
+        self.commands = CommandDispatcher(self.conn, hook=False)
+        self.subscribe(self.commands.on_ack, 'COMMAND_ACK')
+
+    @property
+    def mav(self):
+        # Looked up each time: mavutil swaps in a MAVLink 2 encoder on the first v2 frame
+        return self.conn.mav
+
+    @property
+    def target_system(self):
+        return self.conn.target_system
+
+    @property
+    def target_component(self):
+        return self.conn.target_component
+
+    def log(self, text):
+        if self.verbose:
+            print(f"[{self.name}] {text}")
+
+    # ------------------------------------------------------------------
+    # Reader
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Attach the reader to the running event loop."""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        if self.conn.fd is not None:
+            self._loop.add_reader(self.conn.fd, self._on_readable)
+        else:
+            self._poll_task = self._loop.create_task(self._poll())
+
+    def close(self):
+        """Detach the reader and close the connection."""
+        if self._loop is not None:
+            if self._poll_task is not None:
+                self._poll_task.cancel()
+                self._poll_task = None
+            elif self.conn.fd is not None:
+                self._loop.remove_reader(self.conn.fd)
+            self._loop = None
+        for waiters in self._waiters.values():
+            for _, future in waiters:
+                if not future.done():
+                    future.cancel()
+        self._waiters.clear()
+        self.conn.close()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def _on_readable(self):
+        recv_msg = self.conn.recv_msg
+        while True:
+            try:
+                msg = recv_msg()
+            except OSError as e:
+                self.log(f"Read error: {e}")
+                return
+            if msg is None:
+                return
+            self._dispatch(msg)
+
+    async def _poll(self):
+        while True:
+            self._on_readable()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def _dispatch(self, msg):
+        mtype = msg.get_type()
+        if mtype == 'BAD_DATA':
+            self.bad_data += 1
+            return
+        self.messages_received += 1
+        self.last_message_time = time.monotonic()
+
+        for callback in self._subscribers.get(mtype, ()):
+            callback(msg)
+        for callback in self._subscribers.get('*', ()):
+            callback(msg)
+
+        queue = self._queues.get(mtype)
+        if queue is not None:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(msg)
+
+        waiters = self._waiters.get(mtype)
+        if waiters:
+            for entry in list(waiters):
+                condition, future = entry
+                if future.done():
+                    waiters.remove(entry)
+                elif condition is None or condition(msg):
+                    future.set_result(msg)
+                    waiters.remove(entry)
+
+    # ------------------------------------------------------------------
+    # Consumers
+    # ------------------------------------------------------------------
+
+    def subscribe(self, callback, types=None):
+        """Call callback(msg) for every message of the given types (all if None)."""
+        for mtype in _as_types(types):
+            self._subscribers.setdefault(mtype, []).append(callback)
+
+    def unsubscribe(self, callback, types=None):
+        for mtype in _as_types(types):
+            callbacks = self._subscribers.get(mtype)
+            if callbacks and callback in callbacks:
+                callbacks.remove(callback)
+
+    def queue(self, mtype, maxsize=QUEUE_SIZE):
+        """Return the queue receiving every message of the given type."""
+        queue = self._queues.get(mtype)
+        if queue is None:
+            queue = self._queues[mtype] = asyncio.Queue(maxsize)
+        return queue
+
+    def expect(self, types, condition=None):
+        """Register a wait for the next matching message and return its future.
+
+        Registering before sending a request guarantees the reply cannot be
+        missed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        for mtype in _as_types(types):
+            self._waiters.setdefault(mtype, []).append((condition, future))
+        return future
+
+    async def recv_match(self, type, condition=None, timeout=None):
+        """Await the next message of type matching condition(msg), or None on timeout."""
+        return await self.wait_future(self.expect(type, condition), timeout)
+
+    async def wait_future(self, future, timeout=None):
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    # ------------------------------------------------------------------
+    # Vehicle helpers (awaitable versions of control_drone.py)
+    # ------------------------------------------------------------------
+
+    async def wait_heartbeat(self, timeout=None):
+        """Wait for a vehicle heartbeat so the target system IDs are known."""
+        self.start()
+        self.log("Waiting for heartbeat...")
+        msg = await self.recv_match('HEARTBEAT', self._is_target_heartbeat, timeout)
+        if msg:
+            if self.sysid is not None:
+                self.conn.target_system = self.sysid
+            self.log(f"Heartbeat from system {self.target_system}, component {self.target_component}")
+        return msg
+
+    def _is_target_heartbeat(self, msg):
+        if self.sysid is not None and msg.get_srcSystem() != self.sysid:
+            return False
+        return self.conn.probably_vehicle_heartbeat(msg)
+
+    async def command_long(self, command, *params, timeout=3, retries=RETRIES):
+        """Send COMMAND_LONG and return the matching COMMAND_ACK (or None).
+
+        timeout covers every attempt; unanswered sends are retried with the
+        confirmation field incremented.
+        """
+        pending = await self.commands.command_async(command, *params,
+                                                    timeout=timeout / (retries + 1),
+                                                    retries=retries)
+        if pending.ack is not None:
+            self.command_rtts.append(pending.rtt)
+        return pending.ack
+
+    async def _command_accepted(self, command, *params, timeout=3):
+        ack = await self.command_long(command, *params, timeout=timeout)
+        return bool(ack and ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED)
+
+    async def arm_vehicle(self):
+        """Arm the vehicle."""
+        self.log("Arming vehicle...")
+        if await self._command_accepted(mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM, 1):
+            self.log("Vehicle armed!")
+            return True
+        self.log("Failed to arm vehicle")
+        return False
+
+    async def disarm_vehicle(self):
+        """Disarm the vehicle."""
+        self.log("Disarming vehicle...")
+        if await self._command_accepted(mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM, 0):
+            self.log("Vehicle disarmed!")
+            return True
+        self.log("Failed to disarm vehicle")
+        return False
+
+    async def set_mode(self, mode):
+        """Set the flight mode."""
+        self.log(f"Setting mode to {mode}...")
+        mapping = self.conn.mode_mapping() or {}
+        if mode not in mapping:
+            self.log(f"Unknown mode: {mode}")
+            self.log(f"Available modes: {list(mapping.keys())}")
+            return False
+        if await self._command_accepted(mavutil.mavlink.MAV_CMD_DO_SET_MODE,
+                                        mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,
+                                        mapping[mode]):
+            self.log(f"Mode set to {mode}")
+            return True
+        self.log(f"Failed to set mode to {mode}")
+        return False
+
+    async def takeoff(self, altitude):
+        """Command the vehicle to take off to specified altitude (meters)."""
+        self.log(f"Taking off to {altitude} meters...")
+        if await self._command_accepted(mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
+                                        0, 0, 0, 0, 0, 0, altitude):
+            self.log("Takeoff command accepted")
+            return True
+        self.log("Takeoff command failed")
+        return False
+
+    def goto_position_ned(self, north, east, down):
+        """Move to a local NED position (fire-and-forget)."""
+        control_drone.goto_position_ned(self.conn, north, east, down)
+
+    def send_velocity_ned(self, vx, vy, vz):
+        """Send a local NED velocity setpoint (fire-and-forget)."""
+        control_drone.send_velocity_ned(self.conn, vx, vy, vz)
+
+    async def get_altitude(self):
+        """Get current altitude from the next VFR_HUD."""
+        msg = await self.recv_match('VFR_HUD', timeout=1)
+        if msg:
+            return msg.alt
+        return None
+
+    async def check_gps_lock(self, timeout=30):
+        """Wait for GPS 3D lock."""
+        self.log("Waiting for GPS lock...")
+        start_time = time.monotonic()
+        while time.monotonic() - start_time < timeout:
+            remaining = timeout - (time.monotonic() - start_time)
+            msg = await self.recv_match('GPS_RAW_INT', lambda m: m.fix_type >= 3,
+                                        timeout=min(5, remaining))
+            if msg:
+                self.log(f"GPS lock acquired! Fix type: {msg.fix_type}, "
+                         f"Satellites: {msg.satellites_visible}")
+                return True
+            self.log(f"  Waiting for GPS... ({int(time.monotonic() - start_time)}s)")
+        self.log("GPS lock timeout!")
+        return False
+
+    async def check_ekf_status(self):
+        """Check if EKF is healthy."""
+        self.log("Checking EKF status...")
+        msg = await self.recv_match('EKF_STATUS_REPORT', timeout=5)
+        if msg:
+            self.log(f"EKF status - flags: {msg.flags}")
+            return True
+        self.log("No EKF status received")
+        return True  # Continue anyway for simulation
+
+
+def _as_types(types):
+    if types is None:
+        return ('*',)
+    if isinstance(types, str):
+        return (types,)
+    return types
+
+
+async def main():
+    """Connect, run the readiness checks and report link statistics."""
+    async with MavLink(CONNECTION_STRING) as link:
+        await link.wait_heartbeat()
+        if not await link.check_gps_lock():
+            link.log("WARNING: No GPS lock, but continuing for simulation...")
+        await link.check_ekf_status()
+        alt = await link.get_altitude()
+        if alt is not None:
+            link.log(f"Current altitude: {alt:.1f}m")
+        link.log(f"Messages received: {link.messages_received}, bad data: {link.bad_data}")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+In-process MAVLink router
+A lean replacement for MAVProxy's --out fan-out: reads one or more vehicle
+links (SITL's TCP port, or UDP) and forwards raw frames to local UDP clients
+(QGroundControl, the control scripts) and back.
+
+Only frame headers are parsed: magic, length, system/component ID and
+message ID, plus the target_system/target_component bytes of messages that
+have them (offsets taken from the pymavlink dialect). Payloads are never
+decoded or checked. Datagrams are read into one preallocated buffer and
+forwarded as memoryview slices; consecutive frames with the same
+destinations go out in one sendto().
+
+Routing follows the MAVLink routing rules: a message with a target system
+goes only to the endpoints where that system (and component) has been seen,
+broadcasts go everywhere except back to their source, and clients do not
+hear each other. Clients attach exactly as they do to MAVProxy outputs: the
+router sends to --out host:port and answers to whatever replies from there.
+
+Per-route packet and byte rates and drop counts are printed every
+--stats-interval seconds.
+
+Usage:
+  python3 mav_router.py                                     # tcp:127.0.0.1:5760 -> 14550, 14551
+  python3 mav_router.py --master udpin:127.0.0.1:14540 --out 127.0.0.1:14550
+  python3 fake_vehicle.py --base-port 14540 & python3 mav_router.py --master udpin:127.0.0.1:14540
+"""
+
+import argparse
+import asyncio
+import errno
+import re
+import socket
+import struct
+import time
+
+from pymavlink.dialects.v20 import ardupilotmega as mavlink2
+
+MASTERS = ["tcp:127.0.0.1:5760"]
+OUTPUTS = ["127.0.0.1:14550", "127.0.0.1:14551"]
+
+# Receive buffer per endpoint (a TCP stream may leave one partial frame in it)
+BUFFER_SIZE = 65536
+# Seconds between reconnect attempts of a TCP link
+RECONNECT_INTERVAL = 1.0
+STATS_INTERVAL = 5.0
+
+MAGIC_V1 = 0xFE
+MAGIC_V2 = 0xFD
+SIGNED = 0x01
+SIGNATURE_LEN = 13
+
+
+def _target_offsets():
+    """{msgid: (target_system offset, target_component offset or None)} in the payload."""
+    offsets = {}
+    for msgid, cls in mavlink2.mavlink_map.items():
+        fields = cls.ordered_fieldnames
+        if "target_system" not in fields:
+            continue
+        tokens = re.findall(r"(\d*)([a-zA-Z])", cls.unpacker.format[1:])
+        position, ofs = 0, {}
+        for name, (count, code) in zip(fields, tokens):
+            ofs[name] = position
+            position += struct.calcsize("<" + count + code)
+        offsets[msgid] = (ofs["target_system"], ofs.get("target_component"))
+    return offsets
+
+
+TARGET_OFFSETS = _target_offsets()
+
+
+class Endpoint:
+    """One socket of the router: a vehicle link or a local client."""
+
+    def __init__(self, name, kind, sock=None, peer=None, learn_peer=False):
+        self.name = name
+        self.kind = kind            # "link" or "client"
+        self.sock = sock
+        self.peer = peer            # UDP destination (None for TCP)
+        self.learn_peer = learn_peer
+        self.stream = sock is not None and sock.type == socket.SOCK_STREAM
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.fill = 0               # bytes held in buffer (TCP partial frames)
+        self.systems = set()        # (sysid, compid) seen from this endpoint
+        self.sysids = set()
+        self.rx_packets = 0
+        self.rx_bytes = 0
+        self.bad_bytes = 0
+
+    def saw(self, sysid, compid):
+        self.systems.add((sysid, compid))
+        self.sysids.add(sysid)
+
+    def reaches(self, sysid, compid):
+        if sysid not in self.sysids:
+            return False
+        return compid == 0 or (sysid, compid) in self.systems or (sysid, 0) in self.systems
+
+    def send(self, data):
+        """Send one slice; False if the socket could not take it."""
+        if self.sock is None:
+            return False
+        try:
+            if self.stream:
+                sent = self.sock.send(data)
+                return sent == len(data)
+            if self.peer is None:
+                return False
+            self.sock.sendto(data, self.peer)
+            return True
+        except (BlockingIOError, InterruptedError):
+            return False
+        except OSError as e:
+            if e.errno in (errno.ENOBUFS, errno.ECONNREFUSED):
+                return False
+            raise
+
+
+class Router:
+    """Header-only MAVLink forwarding between links and clients."""
+
+    def __init__(self):
+        self.endpoints = []
+        self.routes = {}            # (source name, destination name) -> [packets, bytes, drops]
+        self.unroutable = 0
+        self._loop = None
+
+    @property
+    def links(self):
+        return [e for e in self.endpoints if e.kind == "link"]
+
+    @property
+    def clients(self):
+        return [e for e in self.endpoints if e.kind == "client"]
+
+    # ------------------------------------------------------------------
+    # Endpoints
+    # ------------------------------------------------------------------
+
+    def add_link(self, spec):
+        """tcp:host:port, udpin:host:port (bind) or udpout:host:port."""
+        kind, _, address = spec.partition(":")
+        host, _, port = address.rpartition(":")
+        port = int(port)
+        if kind == "tcp":
+            endpoint = Endpoint(spec, "link", peer=(host, port))
+            endpoint.stream = True
+        elif kind == "udpin":
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((host, port))
+            endpoint = Endpoint(spec, "link", sock, learn_peer=True)
+        elif kind in ("udpout", "udp"):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            endpoint = Endpoint(spec, "link", sock, peer=(host, port))
+        else:
+            raise ValueError(f"unsupported link {spec!r} (tcp:, udpin: or udpout:)")
+        self.endpoints.append(endpoint)
+        return endpoint
+
+    def add_client(self, address):
+        """A MAVProxy-style --out: send to host:port from our own socket."""
+        host, _, port = address.rpartition(":")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("0.0.0.0", 0))
+        endpoint = Endpoint(address, "client", sock, peer=(host or "127.0.0.1", int(port)))
+        self.endpoints.append(endpoint)
+        return endpoint
+
+    def _watch(self, endpoint):
+        endpoint.sock.setblocking(False)
+        self._loop.add_reader(endpoint.sock.fileno(), self._on_readable, endpoint)
+
+    async def _connect(self, endpoint):
+        """Keep a TCP link connected (SITL may start after the router)."""
+        while True:
+            if endpoint.sock is None:
+                try:
+                    sock = socket.create_connection(endpoint.peer, timeout=2)
+                except OSError:
+                    await asyncio.sleep(RECONNECT_INTERVAL)
+                    continue
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                endpoint.sock, endpoint.fill = sock, 0
+                self._watch(endpoint)
+                print(f"✓ Connected to {endpoint.name}")
+            await asyncio.sleep(RECONNECT_INTERVAL)
+
+    def _drop_stream(self, endpoint):
+        self._loop.remove_reader(endpoint.sock.fileno())
+        endpoint.sock.close()
+        endpoint.sock = None
+        print(f"✗ Lost {endpoint.name}, reconnecting...")
+
+    # ------------------------------------------------------------------
+    # Forwarding
+    # ------------------------------------------------------------------
+
+    def _on_readable(self, endpoint):
+        sock = endpoint.sock
+        while sock is not None:
+            try:
+                if endpoint.stream:
+                    n = sock.recv_into(endpoint.view[endpoint.fill:])
+                    if n == 0:
+                        self._drop_stream(endpoint)
+                        return
+                    end = endpoint.fill + n
+                else:
+                    n, addr = sock.recvfrom_into(endpoint.buffer)
+                    if endpoint.learn_peer or endpoint.kind == "client":
+                        endpoint.peer = addr
+                    end = n
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionError:
+                if endpoint.stream:
+                    self._drop_stream(endpoint)
+                return
+            endpoint.rx_bytes += n
+            used = self._route(endpoint, endpoint.view, end)
+            if endpoint.stream:
+                # Keep the partial frame at the front of the buffer
+                rest = end - used
+                if rest:
+                    endpoint.buffer[:rest] = endpoint.buffer[used:end]
+                endpoint.fill = rest if rest < BUFFER_SIZE else 0
+
+    def _destinations(self, source, target_system, target_component):
+        if target_system:
+            found = tuple(e for e in self.endpoints
+                          if e is not source and e.reaches(target_system, target_component))
+            if found:
+                return found
+        # Broadcast (or a target not seen yet): links talk to everyone, clients to links
+        if source.kind == "link":
+            return tuple(e for e in self.endpoints if e is not source)
+        return tuple(self.links)
+
+    def _route(self, source, view, end):
+        """Forward every complete frame in view[:end]; returns the bytes consumed."""
+        buffer = source.buffer
+        i = 0
+        run_start, run_dests = 0, None
+        while i < end:
+            magic = view[i]
+            if magic == MAGIC_V2:
+                if end - i < 10:
+                    break
+                length = view[i + 1]
+                size = 12 + length + (SIGNATURE_LEN if view[i + 2] & SIGNED else 0)
+                sysid, compid = view[i + 5], view[i + 6]
+                msgid = view[i + 7] | view[i + 8] << 8 | view[i + 9] << 16
+                payload = i + 10
+            elif magic == MAGIC_V1:
+                if end - i < 6:
+                    break
+                length = view[i + 1]
+                size = 8 + length
+                sysid, compid, msgid = view[i + 3], view[i + 4], view[i + 5]
+                payload = i + 6
+            else:
+                # Resynchronise on the next start byte
+                next_v2, next_v1 = buffer.find(b"\xfd", i, end), buffer.find(b"\xfe", i, end)
+                found = min(x for x in (next_v2, next_v1, end) if x >= 0)
+                source.bad_bytes += found - i
+                if run_dests is not None:
+                    self._send(source, view[run_start:i], run_dests)
+                    run_dests = None
+                i = run_start = found
+                continue
+            if i + size > end:
+                break
+
+            if (sysid, compid) not in source.systems:
+                source.saw(sysid, compid)
+            target_system = target_component = 0
+            offsets = TARGET_OFFSETS.get(msgid)
+            if offsets is not None:
+                if offsets[0] < length:
+                    target_system = view[payload + offsets[0]]
+                if offsets[1] is not None and offsets[1] < length:
+                    target_component = view[payload + offsets[1]]
+            dests = self._destinations(source, target_system, target_component)
+            source.rx_packets += 1
+            for dest in dests:
+                route = self.routes.get((source.name, dest.name))
+                if route is None:
+                    route = self.routes[(source.name, dest.name)] = [0, 0, 0]
+                route[0] += 1
+                route[1] += size
+            if not dests:
+                self.unroutable += 1
+
+            if dests != run_dests:
+                if run_dests is not None:
+                    self._send(source, view[run_start:i], run_dests)
+                run_start, run_dests = i, dests
+            i += size
+        if run_dests is not None and i > run_start:
+            self._send(source, view[run_start:i], run_dests)
+        return i
+
+    def _send(self, source, data, dests):
+        for dest in dests:
+            if not dest.send(data):
+                self.routes[(source.name, dest.name)][2] += 1
+
+    # ------------------------------------------------------------------
+    # Running and reports
+    # ------------------------------------------------------------------
+
+    async def run(self, duration=None, stats_interval=STATS_INTERVAL):
+        self._loop = asyncio.get_running_loop()
+        tasks = []
+        for endpoint in self.endpoints:
+            if endpoint.stream:
+                tasks.append(asyncio.ensure_future(self._connect(endpoint)))
+            else:
+                self._watch(endpoint)
+        start = time.monotonic()
+        previous = self.snapshot()
+        try:
+            while duration is None or time.monotonic() - start < duration:
+                wait = stats_interval if duration is None else \
+                    min(stats_interval, max(duration - (time.monotonic() - start), 0.01))
+                await asyncio.sleep(wait)
+                current = self.snapshot()
+                self.print_stats(previous, current)
+                previous = current
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.close()
+
+    def close(self):
+        for endpoint in self.endpoints:
+            if endpoint.sock is not None:
+                if self._loop is not None:
+                    self._loop.remove_reader(endpoint.sock.fileno())
+                endpoint.sock.close()
+                endpoint.sock = None
+
+    def snapshot(self):
+        return {"time": time.monotonic(),
+                "routes": {key: list(value) for key, value in self.routes.items()}}
+
+    def report(self, previous, current):
+        """Per-route packets/s, bytes/s and drops between two snapshots."""
+        elapsed = max(current["time"] - previous["time"], 1e-9)
+        rows = []
+        for (source, dest), (packets, size, drops) in sorted(current["routes"].items()):
+            before = previous["routes"].get((source, dest), [0, 0, 0])
+            rows.append({"source": source, "destination": dest,
+                         "packets_per_s": (packets - before[0]) / elapsed,
+                         "bytes_per_s": (size - before[1]) / elapsed,
+                         "drops": drops - before[2], "packets": packets, "total_drops": drops})
+        return rows
+
+    def print_stats(self, previous, current):
+        print(f"\n{'route':<56} {'pkt/s':>8} {'KB/s':>8} {'drops':>6}")
+        for r in self.report(previous, current):
+            route = f"{r['source']} -> {r['destination']}"
+            print(f"{route:<56} {r['packets_per_s']:>8.1f} {r['bytes_per_s'] / 1024:>8.1f} "
+                  f"{r['drops']:>6}")
+        bad = sum(e.bad_bytes for e in self.endpoints)
+        systems = sorted({s for e in self.links for s in e.sysids})
+        print(f"systems: {systems}  unroutable: {self.unroutable}  bad bytes: {bad}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forward MAVLink between vehicle links and local clients")
+    parser.add_argument("--master", action="append",
+                        help="vehicle link: tcp:host:port, udpin:host:port or udpout:host:port "
+                             "(repeatable, default tcp:127.0.0.1:5760)")
+    parser.add_argument("--out", action="append",
+                        help="client host:port to send to (repeatable, default 14550 and 14551)")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL)
+    parser.add_argument("--duration", type=float, help="seconds to run (default: until Ctrl+C)")
+    args = parser.parse_args()
+
+    router = Router()
+    for spec in args.master or MASTERS:
+        router.add_link(spec)
+    for address in args.out or OUTPUTS:
+        router.add_client(address)
+    print(f"Routing {', '.join(e.name for e in router.links)} <-> "
+          f"{', '.join(e.name for e in router.clients)}")
+    try:
+        asyncio.run(router.run(args.duration, args.stats_interval))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
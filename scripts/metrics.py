@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Lightweight metrics for the control scripts
+Fixed-bucket histograms cheap enough to update from a control loop, with
+percentile estimates and plain-dict snapshots for reports, plus a rolling
+variant that only covers the last minute or so.
+"""
+
+import bisect
+import math
+import time
+
+# Default bucket upper bounds in seconds: 10 us .. ~10 s, 4 buckets per decade
+DEFAULT_BOUNDS = tuple(10 ** (e / 4) * 1e-5 for e in range(25))
+
+
+class Histogram:
+    """Counts samples into fixed buckets; percentiles are bucket-interpolated."""
+
+    __slots__ = ("bounds", "counts", "count", "total", "min", "max")
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Approximate q-th percentile (0-100)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.bounds[i - 1] if i > 0 else min(self.min, self.bounds[0])
+                hi = self.bounds[i] if i < len(self.bounds) else self.max
+                lo, hi = max(lo, self.min), min(hi, self.max)
+                return lo + (hi - lo) * ((rank - seen) / n)
+            seen += n
+        return self.max
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def snapshot(self, scale=1.0):
+        """Summary dict; scale converts units (e.g. 1000 for seconds -> ms)."""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.mean * scale,
+            "min": self.min * scale,
+            "p50": self.percentile(50) * scale,
+            "p90": self.percentile(90) * scale,
+            "p99": self.percentile(99) * scale,
+            "max": self.max * scale,
+        }
+
+
+class RollingHistogram:
+    """Histogram over the last `window` seconds, kept as rotating sub-histograms.
+
+    Adding a sample costs one Histogram.add plus a clock check; old samples
+    age out a slot (window / slots seconds) at a time.
+    """
+
+    def __init__(self, window=60.0, slots=6, bounds=DEFAULT_BOUNDS, clock=time.monotonic):
+        self.slot_length = window / slots
+        self.slots = [Histogram(bounds) for _ in range(slots)]
+        self.clock = clock
+        self._slot_start = clock()
+        self._current = 0
+
+    def _rotate(self, now):
+        while now - self._slot_start >= self.slot_length:
+            self._current = (self._current + 1) % len(self.slots)
+            self.slots[self._current].reset()
+            self._slot_start += self.slot_length
+            if now - self._slot_start >= self.slot_length * len(self.slots):
+                # Idle for a whole window: everything has aged out
+                for h in self.slots:
+                    h.reset()
+                self._slot_start = now
+
+    def add(self, value):
+        now = self.clock()
+        if now - self._slot_start >= self.slot_length:
+            self._rotate(now)
+        self.slots[self._current].add(value)
+
+    def merged(self):
+        """One Histogram holding every sample still inside the window."""
+        self._rotate(self.clock())
+        total = Histogram(self.slots[0].bounds)
+        for h in self.slots:
+            total.merge(h)
+        return total
+
+    def snapshot(self, scale=1.0):
+        return self.merged().snapshot(scale)
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Declarative missions flown in AUTO mode
+A mission file (JSON, or YAML when PyYAML is installed) lists takeoff,
+waypoint, loiter, land and RTL steps, with positions given as NED metres
+from the AirSim OriginGeopoint or as lat/lon. It is compiled to a list of
+MISSION_ITEM_INT and uploaded with the MAVLink mission protocol: the vehicle
+requests each item by sequence number, and when a request or an item is
+lost only that item is sent again, never the whole mission. Uploads to a
+fleet run concurrently on one event loop.
+
+The vehicle then flies the mission in AUTO on its own; the script only
+watches MISSION_CURRENT and MISSION_ITEM_REACHED, so a dropped link or a
+stopped script does not stop the flight.
+
+Mission file:
+  {"speed": 5,
+   "items": [
+     {"type": "takeoff", "alt": 10},
+     {"type": "waypoint", "ned": [20, 0, -10]},
+     {"type": "waypoint", "lat": -6.8998, "lon": 107.6188, "alt": 15, "hold": 2},
+     {"type": "loiter", "time": 5},
+     {"type": "rtl"}]}
+
+Usage:
+  python3 mission.py ../config/missions/square.json --upload-only
+  python3 mission.py ../config/missions/square.json --count 10   # upload and fly a fleet
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from pymavlink import mavutil
+
+from geodesy import load_origin, local_frame
+from swarm import BASE_PORT, PORT_STEP, Swarm
+from vehicle_state import EKF_HEALTHY_FLAGS
+
+# Item request timeout (s) and how often an unanswered step is repeated
+ITEM_TIMEOUT = 1.0
+RETRIES = 5
+
+# Telemetry needed while a mission runs (see stream_profiles.py)
+STREAM_PROFILE = "auto"
+
+READY_TIMEOUT = 60
+MISSION_TIMEOUT = 600
+
+MISSION_TYPE = mavutil.mavlink.MAV_MISSION_TYPE_MISSION
+FRAME = mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT
+
+NAV_COMMANDS = {
+    "takeoff": mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
+    "waypoint": mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
+    "loiter": mavutil.mavlink.MAV_CMD_NAV_LOITER_TIME,
+    "land": mavutil.mavlink.MAV_CMD_NAV_LAND,
+    "rtl": mavutil.mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH,
+    "speed": mavutil.mavlink.MAV_CMD_DO_CHANGE_SPEED,
+}
+COMMAND_NAMES = {command: name for name, command in NAV_COMMANDS.items()}
+
+
+# ----------------------------------------------------------------------
+# Mission files
+# ----------------------------------------------------------------------
+
+def ned_to_global(origin, north, east):
+    """(lat, lon) of a NED offset from origin (WGS84, see geodesy.py)."""
+    lat, lon, _ = local_frame(tuple(origin)).ned_to_lla((north, east, 0.0))
+    return float(lat), float(lon)
+
+
+def load_mission(path):
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("YAML missions need PyYAML: pip install pyyaml")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _position(step, origin):
+    """(lat, lon, relative alt) of a step; (0, 0, 0) fields mean 'where the vehicle is'."""
+    if "ned" in step:
+        north, east, down = step["ned"]
+        lat, lon = ned_to_global(origin, north, east)
+        return lat, lon, -down
+    if "lat" in step or "lon" in step:
+        return step["lat"], step["lon"], step.get("alt", 0)
+    return 0, 0, step.get("alt", 0)
+
+
+def compile_mission(mission, origin=None):
+    """Mission dict -> [(command, param1..4, lat, lon, alt)], home first as ArduPilot expects."""
+    origin = origin or load_origin()
+    home = (mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, 0, 0, 0, 0, origin[0], origin[1], 0)
+    items = [home]
+    if mission.get("speed"):
+        items.append((NAV_COMMANDS["speed"], 1, mission["speed"], -1, 0, 0, 0, 0))
+    for i, step in enumerate(mission["items"]):
+        kind = step.get("type")
+        if kind not in NAV_COMMANDS:
+            raise ValueError(f"item {i}: unknown type {kind!r} "
+                             f"(expected one of {', '.join(NAV_COMMANDS)})")
+        command = NAV_COMMANDS[kind]
+        if kind == "takeoff":
+            items.append((command, 0, 0, 0, 0, 0, 0, step["alt"]))
+        elif kind == "waypoint":
+            if not any(k in step for k in ("ned", "lat", "lon")):
+                raise ValueError(f"item {i}: waypoint needs 'ned' or 'lat'/'lon'")
+            items.append((command, step.get("hold", 0), step.get("radius", 0), 0, 0,
+                          *_position(step, origin)))
+        elif kind == "loiter":
+            items.append((command, step["time"], 0, 0, 0, *_position(step, origin)))
+        elif kind == "land":
+            items.append((command, 0, 0, 0, 0, *_position(step, origin)))
+        elif kind == "rtl":
+            items.append((command, 0, 0, 0, 0, 0, 0, 0))
+        else:
+            items.append((command, 1, step["speed"], -1, 0, 0, 0, 0))
+    return items
+
+
+def mission_messages(mav, items, target_system, target_component):
+    """MISSION_ITEM_INT messages for one vehicle, built once and resent as requested."""
+    return [mav.mission_item_int_encode(target_system, target_component, seq,
+                                        mavutil.mavlink.MAV_FRAME_GLOBAL if seq == 0 else FRAME,
+                                        command, 0, 1, p1, p2, p3, p4,
+                                        int(round(lat * 1e7)), int(round(lon * 1e7)), alt,
+                                        MISSION_TYPE)
+            for seq, (command, p1, p2, p3, p4, lat, lon, alt) in enumerate(items)]
+
+
+# ----------------------------------------------------------------------
+# Upload (mission protocol)
+# ----------------------------------------------------------------------
+
+async def upload_mission(link, items, timeout=ITEM_TIMEOUT, retries=RETRIES):
+    """Upload compiled items to one vehicle; returns a report dict.
+
+    The vehicle drives the transfer with MISSION_REQUEST_INT. If nothing
+    arrives within timeout, the last thing sent (MISSION_COUNT or the last
+    requested item) is sent again; items the vehicle re-requests are served
+    from the prebuilt messages.
+    """
+    messages = mission_messages(link.mav, items, link.target_system, link.target_component)
+    replies = asyncio.Queue()
+
+    def on_reply(msg):
+        if msg.get_srcSystem() == link.target_system and msg.mission_type == MISSION_TYPE:
+            replies.put_nowait(msg)
+
+    types = ('MISSION_REQUEST_INT', 'MISSION_REQUEST', 'MISSION_ACK')
+    link.subscribe(on_reply, types)
+    report = {"name": link.name, "items": len(messages), "sent": 0, "resent": 0,
+              "result": None, "ok": False}
+    served = set()
+    last = None   # seq of the last item sent (None: MISSION_COUNT)
+
+    def send_last():
+        if last is None:
+            link.mav.mission_count_send(link.target_system, link.target_component,
+                                        len(messages), MISSION_TYPE)
+        else:
+            link.mav.send(messages[last])
+        report["sent"] += 1
+
+    start = time.monotonic()
+    try:
+        send_last()
+        misses = 0
+        while True:
+            try:
+                msg = await asyncio.wait_for(replies.get(), timeout)
+            except asyncio.TimeoutError:
+                misses += 1
+                if misses > retries:
+                    report["result"] = "timeout"
+                    break
+                send_last()
+                report["resent"] += 1
+                continue
+            misses = 0
+            if msg.get_type() == 'MISSION_ACK':
+                report["result"] = mavutil.mavlink.enums['MAV_MISSION_RESULT'][msg.type].name
+                report["ok"] = msg.type == mavutil.mavlink.MAV_MISSION_ACCEPTED
+                break
+            if msg.seq >= len(messages):
+                continue
+            if msg.seq in served:
+                report["resent"] += 1
+            served.add(msg.seq)
+            last = msg.seq
+            send_last()
+    finally:
+        link.unsubscribe(on_reply, types)
+    report["elapsed"] = time.monotonic() - start
+    return report
+
+
+# ----------------------------------------------------------------------
+# Flying (AUTO) and progress
+# ----------------------------------------------------------------------
+
+class MissionProgress:
+    """MISSION_CURRENT / MISSION_ITEM_REACHED / arming state of one vehicle."""
+
+    def __init__(self, link, items):
+        self.link = link
+        self.items = items
+        self.current = None
+        self.reached = []       # (seq, seconds since start)
+        self.armed = False
+        self.was_armed = False
+        self.complete = False
+        self.started = time.monotonic()
+        self.changed = asyncio.Event()
+        link.subscribe(self.update, ('MISSION_CURRENT', 'MISSION_ITEM_REACHED', 'HEARTBEAT'))
+
+    def detach(self):
+        self.link.unsubscribe(self.update, ('MISSION_CURRENT', 'MISSION_ITEM_REACHED', 'HEARTBEAT'))
+
+    def describe(self, seq):
+        if 0 < seq < len(self.items):
+            return COMMAND_NAMES.get(self.items[seq][0], str(self.items[seq][0]))
+        return "home"
+
+    def update(self, msg):
+        if msg.get_srcSystem() != self.link.target_system:
+            return
+        mtype = msg.get_type()
+        if mtype == 'MISSION_CURRENT':
+            if msg.seq != self.current:
+                self.current = msg.seq
+                self.link.log(f"item {msg.seq} ({self.describe(msg.seq)}) current")
+            self.complete = msg.mission_state == mavutil.mavlink.MISSION_STATE_COMPLETE
+        elif mtype == 'MISSION_ITEM_REACHED':
+            if not any(seq == msg.seq for seq, _ in self.reached):
+                self.reached.append((msg.seq, time.monotonic() - self.started))
+                self.link.log(f"item {msg.seq} ({self.describe(msg.seq)}) reached")
+            self.complete = msg.seq == len(self.items) - 1 or self.complete
+        elif mtype == 'HEARTBEAT' and self.link.conn.probably_vehicle_heartbeat(msg):
+            self.armed = bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
+            self.was_armed |= self.armed
+        self.changed.set()
+
+    @property
+    def finished(self):
+        """Last item reached, or landed and disarmed after flying."""
+        return self.complete or (self.was_armed and not self.armed)
+
+
+async def wait_ready(link, timeout=READY_TIMEOUT):
+    """Wait for an EKF_STATUS_REPORT with a usable position estimate."""
+    msg = await link.recv_match(
+        'EKF_STATUS_REPORT',
+        lambda m: (m.flags & EKF_HEALTHY_FLAGS) == EKF_HEALTHY_FLAGS, timeout)
+    return msg is not None
+
+
+async def start_mission(link):
+    """GUIDED, arm, AUTO and MISSION_START from the ground (AUTO alone when airborne)."""
+    for step in (lambda: link.set_mode("GUIDED"), link.arm_vehicle,
+                 lambda: link.set_mode("AUTO")):
+        if not await step():
+            return False
+    ack = await link.command_long(mavutil.mavlink.MAV_CMD_MISSION_START, 0, 0)
+    return bool(ack and ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED)
+
+
+async def fly_mission(link, items, timeout=MISSION_TIMEOUT):
+    """Start the uploaded mission and follow it until it finishes; returns a report."""
+    progress = MissionProgress(link, items)
+    report = {"name": link.name, "started": False, "finished": False, "reached": progress.reached}
+    try:
+        if not await wait_ready(link):
+            link.log("EKF not ready")
+            return report
+        report["started"] = await start_mission(link)
+        if not report["started"]:
+            return report
+        report["finished"] = await follow_mission(progress, timeout)
+        report["elapsed"] = time.monotonic() - progress.started
+        return report
+    finally:
+        progress.detach()
+
+
+async def follow_mission(progress, timeout=MISSION_TIMEOUT):
+    """Wait for a started mission to finish; False if timeout came first."""
+    end = time.monotonic() + timeout
+    while not progress.finished and time.monotonic() < end:
+        progress.changed.clear()
+        try:
+            await asyncio.wait_for(progress.changed.wait(), end - time.monotonic())
+        except asyncio.TimeoutError:
+            break
+    return progress.finished
+
+
+# ----------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------
+
+def print_upload(results):
+    print(f"\n{'vehicle':<8} {'result':<22} {'items':>5} {'sent':>5} {'resent':>6} {'time':>7}")
+    for name, r in results.items():
+        if isinstance(r, Exception):
+            print(f"✗ {name:<6} {r}")
+            continue
+        print(f"{'✓' if r['ok'] else '✗'} {name:<6} {r['result'] or '-':<22} {r['items']:>5} "
+              f"{r['sent']:>5} {r['resent']:>6} {r['elapsed']:>6.2f}s")
+
+
+def print_flight(results, items):
+    for name, r in results.items():
+        if isinstance(r, Exception):
+            print(f"✗ {name}: {r}")
+            continue
+        ok = r["finished"]
+        steps = ", ".join(f"{seq}@{t:.0f}s" for seq, t in r["reached"])
+        state = "finished" if ok else ("started" if r["started"] else "not started")
+        print(f"{'✓' if ok else '✗'} {name}: {state}, reached {steps or 'nothing'}"
+              f" of {len(items) - 1} items")
+
+
+async def run(args):
+    mission = load_mission(args.mission)
+    items = compile_mission(mission)
+    print(f"Mission {args.mission}: {len(mission['items'])} steps -> {len(items)} items")
+
+    if args.connections:
+        swarm = Swarm(args.connections.split(","), verbose=args.verbose)
+    else:
+        swarm = Swarm.from_ports(args.count, args.base_port, args.port_step, verbose=args.verbose)
+    print(f"Connecting to {len(swarm)} vehicles...")
+    missing = await swarm.connect(timeout=args.timeout)
+    if missing:
+        print(f"No heartbeat from: {', '.join(missing)}")
+    if not len(swarm):
+        print("No vehicles connected. Exiting.")
+        return
+
+    try:
+        start = time.monotonic()
+        uploads = await swarm.each(lambda link: upload_mission(link, items))
+        print_upload(uploads)
+        ok = [name for name, r in uploads.items() if not isinstance(r, Exception) and r["ok"]]
+        print(f"{'✓' if len(ok) == len(uploads) else '✗'} uploaded to {len(ok)}/{len(uploads)} "
+              f"vehicles in {time.monotonic() - start:.2f}s")
+        if args.upload_only or not ok:
+            return
+
+        await swarm.apply_profile(STREAM_PROFILE, ok, verify=False)
+        print(f"\nFlying in AUTO ({len(ok)} vehicles)...")
+        flights = await swarm.each(lambda link: fly_mission(link, items, args.mission_timeout), ok)
+        print_flight(flights, items)
+    finally:
+        swarm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload a mission file and fly it in AUTO")
+    parser.add_argument("mission", help="mission file (.json, or .yaml with PyYAML)")
+    parser.add_argument("--connections", help="comma-separated connection strings")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--port-step", type=int, default=PORT_STEP)
+    parser.add_argument("--timeout", type=float, default=30, help="heartbeat timeout (s)")
+    parser.add_argument("--mission-timeout", type=float, default=MISSION_TIMEOUT,
+                        help="wall seconds allowed for the flight")
+    parser.add_argument("--upload-only", action="store_true", help="upload without flying")
+    parser.add_argument("--verbose", action="store_true", help="print per-vehicle progress")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo mission runner
+Flies a mission file many times with randomised conditions instead of one
+manual run: wind speed, direction and gusts, takeoff altitude, waypoint
+offsets, hold times and the delay before the start. Every run gets a fresh
+vehicle (fake_vehicle.py by default, or SITL through --vehicle-cmd) and its
+own flight process; --workers of them run side by side, worker k owning the
+ports base-port + k * port-step, so runs never share a link.
+
+Each run is a subprocess with a wall-clock budget (--run-timeout): a run
+that hangs is killed with its vehicle, recorded as a timeout, and the worker
+moves on. Results are appended one JSON line per run as soon as a run ends,
+so an interrupted batch resumes where it stopped when started again with the
+same settings; the samples are drawn from (seed, run number) and come out
+the same the second time.
+
+Wind goes through ArduPilot SITL's SIM_WIND_SPD / SIM_WIND_DIR /
+SIM_WIND_TURB parameters, which fake_vehicle.py models too. Phase timings
+come from phase_profiler.py, and the summary uses its percentile tables.
+
+Usage:
+  python3 monte_carlo.py batch ../config/missions/square.json --runs 200 --workers 8
+  python3 monte_carlo.py batch ../config/missions/square.json --runs 400    # resumes, adds 200
+  python3 monte_carlo.py table monte_carlo/square-seed1.jsonl
+  python3 monte_carlo.py batch mission.json --speedup 1 --run-timeout 600 \\
+      --vehicle-cmd "sim_vehicle.py -v ArduCopter -I{instance} --no-mavproxy" \\
+      --connection "tcp:127.0.0.1:{tcp_port}"
+"""
+
+import argparse
+import asyncio
+import copy
+import csv
+import json
+import os
+import random
+import shlex
+import signal
+import sys
+import time
+from collections import Counter, deque
+
+from mav_link import MavLink
+from mission import (STREAM_PROFILE, MissionProgress, compile_mission, follow_mission,
+                     load_mission, start_mission, upload_mission, wait_ready)
+from param_sync import set_params
+from phase_profiler import Profiler, aggregate, print_aggregate
+from stream_profiles import apply_profile_async
+
+SCRIPT = os.path.abspath(__file__)
+FAKE_VEHICLE = os.path.join(os.path.dirname(SCRIPT), "fake_vehicle.py")
+
+RESULTS_DIR = "monte_carlo"
+
+# Worker k uses BASE_PORT + k * PORT_STEP (and SITL instance k)
+BASE_PORT = 19550
+PORT_STEP = 10
+WORKERS = 4
+
+# Simulated seconds per wall second for the fake vehicle ({speedup})
+SPEEDUP = 10
+# Wall seconds a run may take before it is killed, and the grace given to
+# SIGTERM before SIGKILL
+RUN_TIMEOUT = 120
+CONNECT_TIMEOUT = 30
+KILL_GRACE = 3
+# Part of the run timeout kept back from the flight, so a slow flight ends as
+# "incomplete" with its report instead of being killed
+FLIGHT_MARGIN = 10
+
+VEHICLE_CMD = (f"{shlex.quote(sys.executable)} {shlex.quote(FAKE_VEHICLE)} "
+               "--base-port {port} --speedup {speedup} --status-interval 10")
+CONNECTION = "udp:127.0.0.1:{port}"
+
+# Default spread of the random conditions
+WIND = 8.0          # m/s, uniform 0..WIND from any direction
+TURBULENCE = 2.0    # m/s
+ALT_JITTER = 3.0    # m, added to takeoff altitudes
+OFFSET = 3.0        # m, north/east added to NED positions
+HOLD_JITTER = 2.0   # s, added to waypoint holds and loiter times
+START_DELAY = 5.0   # simulated s before the mission starts
+
+MIN_TAKEOFF_ALT = 2.0
+# Width of the wind bins in the summary (m/s)
+WIND_BIN = 2.0
+
+RESULT_PREFIX = "RESULT "
+
+
+# ----------------------------------------------------------------------
+# Sampling
+# ----------------------------------------------------------------------
+
+def sample_run(run, seed, spread, steps):
+    """Random conditions of one run; the same (seed, run) always gives the same sample."""
+    rng = random.Random(f"{seed}:{run}")
+    return {
+        "run": run,
+        "wind_speed": round(rng.uniform(0, spread["wind"]), 2),
+        "wind_dir": round(rng.uniform(0, 360), 1),
+        "wind_turb": round(rng.uniform(0, spread["turbulence"]), 2),
+        "alt_offset": round(rng.uniform(-spread["alt_jitter"], spread["alt_jitter"]), 2),
+        "start_delay": round(rng.uniform(0, spread["start_delay"]), 2),
+        "offsets": [[round(rng.uniform(-spread["offset"], spread["offset"]), 2) for _ in "ne"]
+                    for _ in range(steps)],
+        "hold_extra": [round(rng.uniform(0, spread["hold_jitter"]), 2) for _ in range(steps)],
+    }
+
+
+def perturb(mission, sample):
+    """Copy of the mission with the sample's altitude, offsets and hold times applied."""
+    mission = copy.deepcopy(mission)
+    for step, (dn, de), extra in zip(mission["items"], sample["offsets"], sample["hold_extra"]):
+        kind = step.get("type")
+        if kind == "takeoff":
+            step["alt"] = max(MIN_TAKEOFF_ALT, step["alt"] + sample["alt_offset"])
+        if "ned" in step:
+            north, east, down = step["ned"]
+            step["ned"] = [north + dn, east + de, down]
+        if kind == "loiter":
+            step["time"] = step["time"] + extra
+        elif kind == "waypoint" and step.get("hold"):
+            step["hold"] = step["hold"] + extra
+    return mission
+
+
+def wind_params(sample):
+    return {"SIM_WIND_SPD": sample["wind_speed"], "SIM_WIND_DIR": sample["wind_dir"],
+            "SIM_WIND_TURB": sample["wind_turb"]}
+
+
+# ----------------------------------------------------------------------
+# One run (child process)
+# ----------------------------------------------------------------------
+
+async def fly_run(connection, mission, sample, speedup=1.0, timeout=RUN_TIMEOUT,
+                  connect_timeout=CONNECT_TIMEOUT):
+    """Fly one perturbed mission; returns the outcome with its phase report."""
+    items = compile_mission(perturb(mission, sample))
+    profiler = Profiler("monte_carlo")
+    result = {"status": "no_heartbeat", "reached": 0, "upload_resent": None}
+    link = MavLink(connection, name=f"run{sample['run']}", verbose=False)
+    link.start()
+    link.subscribe(profiler.observe)
+
+    def on_reached(msg):
+        name = f"reached_{msg.seq}"
+        if msg.get_srcSystem() == link.target_system and name not in profiler.marks:
+            profiler.mark(name)
+
+    link.subscribe(on_reached, 'MISSION_ITEM_REACHED')
+    progress = None
+    try:
+        with profiler.phase("connect") as entry:
+            entry["ok"] = bool(await link.wait_heartbeat(connect_timeout))
+        if not entry["ok"]:
+            return result
+
+        with profiler.phase("wind") as entry:
+            _, failed = await set_params(link, wind_params(sample), {})
+            entry["ok"] = not failed
+        if failed:
+            result["status"] = "wind_rejected"
+            return result
+
+        with profiler.phase("upload") as entry:
+            upload = await upload_mission(link, items)
+            entry["ok"] = upload["ok"]
+        result["upload_resent"] = upload["resent"]
+        if not upload["ok"]:
+            result["status"] = "upload_failed"
+            return result
+
+        with profiler.phase("ready") as entry:
+            await apply_profile_async(link, STREAM_PROFILE, verify=False)
+            entry["ok"] = await wait_ready(link)
+        if not entry["ok"]:
+            result["status"] = "not_ready"
+            return result
+
+        with profiler.phase("start_delay"):
+            await asyncio.sleep(sample["start_delay"] / speedup)
+
+        progress = MissionProgress(link, items)
+        with profiler.phase("start") as entry:
+            entry["ok"] = await start_mission(link)
+        if not entry["ok"]:
+            result["status"] = "start_failed"
+            return result
+        profiler.mark("started")
+
+        with profiler.phase("flight") as entry:
+            entry["ok"] = await follow_mission(progress, timeout)
+        result["status"] = "ok" if entry["ok"] else "incomplete"
+        return result
+    finally:
+        if progress is not None:
+            result["reached"] = len(progress.reached)
+            progress.detach()
+        link.close()
+        result.update(profiler.report())
+
+
+def cmd_run(args):
+    """Child side of a batch: fly one run and print its result as JSON."""
+    sample = json.loads(args.sample)
+    result = asyncio.run(fly_run(args.connection, load_mission(args.mission), sample,
+                                 args.speedup, args.timeout, args.connect_timeout))
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+# ----------------------------------------------------------------------
+# Batch (parent process)
+# ----------------------------------------------------------------------
+
+def load_results(path):
+    """{run: record} from a results file; a torn last line is ignored."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record["run"]] = record
+    return records
+
+
+async def spawn(command, capture=False):
+    pipe = asyncio.subprocess.PIPE if capture else asyncio.subprocess.DEVNULL
+    # Own process group, so a stuck run is killed with everything it started
+    return await asyncio.create_subprocess_exec(*command, stdout=pipe, stderr=pipe,
+                                                start_new_session=True)
+
+
+async def stop(proc):
+    """SIGTERM the process group, SIGKILL it if it is still there after KILL_GRACE."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        if proc.returncode is not None:
+            return
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(proc.wait(), KILL_GRACE)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_one(args, slot, sample):
+    """Start a vehicle and a flight process for one sample; returns the run record."""
+    fields = {"port": args.base_port + slot * args.port_step, "instance": slot,
+              "tcp_port": 5760 + 10 * slot, "speedup": args.speedup}
+    connection = args.connection.format(**fields)
+    record = {"run": sample["run"], "worker": slot, "batch": args.batch, "sample": sample}
+    start = time.monotonic()
+    vehicle = await spawn(shlex.split(args.vehicle_cmd.format(**fields)))
+    child = await spawn([sys.executable, SCRIPT, "run", args.mission,
+                         "--connection", connection, "--sample", json.dumps(sample),
+                         "--speedup", str(args.speedup),
+                         "--timeout", str(max(args.run_timeout - FLIGHT_MARGIN, 1)),
+                         "--connect-timeout", str(args.connect_timeout)], capture=True)
+    try:
+        stdout, stderr = await asyncio.wait_for(child.communicate(), args.run_timeout)
+    except asyncio.TimeoutError:
+        record["status"] = "timeout"
+        return record
+    finally:
+        await stop(child)
+        await stop(vehicle)
+        record["elapsed"] = time.monotonic() - start
+    for line in stdout.decode(errors="replace").splitlines():
+        if line.startswith(RESULT_PREFIX):
+            record.update(json.loads(line[len(RESULT_PREFIX):]))
+            break
+    else:
+        record["status"] = "error"
+        record["error"] = stderr.decode(errors="replace").strip().splitlines()[-3:]
+    return record
+
+
+async def worker(args, slot, pending, out, records):
+    while pending:
+        sample = pending.popleft()
+        record = await run_one(args, slot, sample)
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        records[record["run"]] = record
+        ok = record["status"] == "ok"
+        print(f"{'✓' if ok else '✗'} run {record['run']:>4} [w{slot}] {record['status']:<13} "
+              f"{record['elapsed']:6.1f}s  wind {sample['wind_speed']:4.1f} m/s "
+              f"({len(records)}/{args.runs})")
+
+
+async def run_batch(args, records, pending):
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    # SIGTERM cancels the workers like Ctrl+C, so their vehicles are stopped too
+    task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    with open(args.results, "a") as out:
+        workers = [asyncio.ensure_future(worker(args, slot, pending, out, records))
+                   for slot in range(min(args.workers, len(pending)))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException as e:
+            # A cancelled gather has cancelled every worker already
+            if not isinstance(e, asyncio.CancelledError):
+                for task in workers:
+                    task.cancel()
+            # Let each worker stop its processes before the loop goes away
+            await asyncio.wait(workers)
+            raise
+
+
+def cmd_batch(args):
+    mission = load_mission(args.mission)
+    steps = len(mission["items"])
+    spread = {"wind": args.wind, "turbulence": args.turbulence, "alt_jitter": args.alt_jitter,
+              "offset": args.offset, "hold_jitter": args.hold_jitter,
+              "start_delay": args.start_delay}
+    args.batch = {"mission": os.path.basename(args.mission), "seed": args.seed, "spread": spread}
+    stem = os.path.splitext(os.path.basename(args.mission))[0]
+    args.results = args.results or os.path.join(RESULTS_DIR, f"{stem}-seed{args.seed}.jsonl")
+
+    records = load_results(args.results)
+    other = [r for r in records.values() if r.get("batch") != args.batch]
+    if other:
+        raise SystemExit(f"{args.results} holds runs with other settings; "
+                         f"pick another --results or --seed")
+    redo = {"timeout", "error"} if args.retry else set()
+    for run in [run for run, r in records.items() if r["status"] in redo]:
+        del records[run]
+    pending = deque(sample_run(run, args.seed, spread, steps)
+                    for run in range(args.runs) if run not in records)
+    print(f"Batch {args.mission}: {args.runs} runs, {len(records)} already done, "
+          f"{len(pending)} to go on {min(args.workers, len(pending))} workers -> {args.results}")
+
+    if pending:
+        start = time.monotonic()
+        try:
+            asyncio.run(run_batch(args, records, pending))
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            print("\nInterrupted; run the same command again to resume")
+            return
+        print(f"\n✓ {len(records)} runs recorded in {time.monotonic() - start:.0f}s")
+    print_summary(list(records.values()))
+    print(f"Results table: {write_table(list(records.values()), args.results)}")
+
+
+# ----------------------------------------------------------------------
+# Results
+# ----------------------------------------------------------------------
+
+def write_table(records, path):
+    """Flatten records into one CSV row per run next to the JSON results."""
+    phases = []
+    for r in records:
+        for p in r.get("phases", ()):
+            if p["name"] not in phases:
+                phases.append(p["name"])
+    columns = (["run", "status", "worker", "elapsed", "wind_speed", "wind_dir", "wind_turb",
+                "alt_offset", "start_delay", "reached", "upload_resent"] +
+               [f"{name}_s" for name in phases])
+    table = os.path.splitext(path)[0] + ".csv"
+    with open(table, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for r in sorted(records, key=lambda r: r["run"]):
+            sample = r["sample"]
+            timings = {p["name"]: p.get("wall_s") for p in r.get("phases", ())}
+            writer.writerow([r["run"], r["status"], r.get("worker"), round(r["elapsed"], 2),
+                             sample["wind_speed"], sample["wind_dir"], sample["wind_turb"],
+                             sample["alt_offset"], sample["start_delay"], r.get("reached"),
+                             r.get("upload_resent")] +
+                            [round(timings[n], 3) if timings.get(n) is not None else ""
+                             for n in phases])
+    return table
+
+
+def print_summary(records):
+    if not records:
+        print("No runs recorded")
+        return
+    statuses = Counter(r["status"] for r in records)
+    ok = statuses.get("ok", 0)
+    print(f"\n{ok}/{len(records)} runs finished ({100.0 * ok / len(records):.0f}%): "
+          + ", ".join(f"{status} {n}" for status, n in statuses.most_common()))
+
+    bins = Counter()
+    passed = Counter()
+    for r in records:
+        low = int(r["sample"]["wind_speed"] // WIND_BIN * WIND_BIN)
+        bins[low] += 1
+        passed[low] += r["status"] == "ok"
+    print(f"\n{'wind m/s':<10} {'runs':>5} {'ok':>5}")
+    for low in sorted(bins):
+        print(f"{low:>3}-{low + WIND_BIN:<5.0f} {bins[low]:>6} {100.0 * passed[low] / bins[low]:>4.0f}%")
+
+    # Phase percentiles per outcome (killed runs have no phase report)
+    reports = [r for r in records if "phases" in r]
+    if reports:
+        print_aggregate(aggregate(reports, by="status"))
+
+
+def cmd_table(args):
+    records = list(load_results(args.results).values())
+    print_summary(records)
+    if records:
+        print(f"Results table: {write_table(records, args.results)}")
+
+
+# ----------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Fly a mission many times under random conditions")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batch = sub.add_parser("batch", help="run (or resume) a batch of runs")
+    batch.add_argument("mission", help="mission file (see mission.py)")
+    batch.add_argument("--runs", type=int, default=100)
+    batch.add_argument("--workers", type=int, default=WORKERS)
+    batch.add_argument("--seed", type=int, default=1)
+    batch.add_argument("--results", help=f"results file (default {RESULTS_DIR}/<mission>-seed<N>.jsonl)")
+    batch.add_argument("--retry", action="store_true", help="run timed-out and crashed runs again")
+    batch.add_argument("--base-port", type=int, default=BASE_PORT)
+    batch.add_argument("--port-step", type=int, default=PORT_STEP)
+    batch.add_argument("--speedup", type=float, default=SPEEDUP)
+    batch.add_argument("--run-timeout", type=float, default=RUN_TIMEOUT, help="wall seconds per run")
+    batch.add_argument("--connect-timeout", type=float, default=CONNECT_TIMEOUT)
+    batch.add_argument("--vehicle-cmd", default=VEHICLE_CMD,
+                       help="vehicle command; {port} {instance} {tcp_port} {speedup} are filled in "
+                            "(default: fake_vehicle.py)")
+    batch.add_argument("--connection", default=CONNECTION,
+                       help="connection string template for the flight process")
+    batch.add_argument("--wind", type=float, default=WIND, help="max wind speed (m/s)")
+    batch.add_argument("--turbulence", type=float, default=TURBULENCE, help="max gusts (m/s)")
+    batch.add_argument("--alt-jitter", type=float, default=ALT_JITTER, help="takeoff altitude +/- (m)")
+    batch.add_argument("--offset", type=float, default=OFFSET, help="waypoint north/east +/- (m)")
+    batch.add_argument("--hold-jitter", type=float, default=HOLD_JITTER,
+                       help="extra hold/loiter time up to (s)")
+    batch.add_argument("--start-delay", type=float, default=START_DELAY,
+                       help="start delay up to (simulated s)")
+    batch.set_defaults(func=cmd_batch)
+
+    run = sub.add_parser("run", help="fly a single sample (used by batch workers)")
+    run.add_argument("mission")
+    run.add_argument("--connection", default=CONNECTION.format(port=BASE_PORT))
+    run.add_argument("--sample", required=True, help="sample as JSON")
+    run.add_argument("--speedup", type=float, default=1.0)
+    run.add_argument("--timeout", type=float, default=RUN_TIMEOUT)
+    run.add_argument("--connect-timeout", type=float, default=CONNECT_TIMEOUT)
+    run.set_defaults(func=cmd_run)
+
+    table = sub.add_parser("table", help="summary and CSV table of a results file")
+    table.add_argument("results")
+    table.set_defaults(func=cmd_table)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
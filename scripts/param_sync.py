@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Parameter sync for ArduPilot vehicles
+Diffs a .parm file (config/ardupilot/airsim.parm by default) against each
+vehicle and sends only the PARAM_SETs that change something. Reads and sets
+are pipelined: up to --window requests are in flight at once, each matched
+to its PARAM_VALUE reply by name and retried on timeout.
+
+The full parameter table is cached on disk per vehicle and firmware
+(param_cache/sys<id>-<firmware>-<uid>.json). The first connect downloads it
+with PARAM_REQUEST_LIST; later connects skip the download and re-read only
+the parameters in the file, which is what decides the diff.
+
+Usage:
+  python3 param_sync.py                                  # one vehicle on 14550
+  python3 param_sync.py --count 50 --set ARMING_CHECK=0  # whole swarm, extra override
+  python3 param_sync.py --dry-run                        # show the diff only
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import struct
+import time
+from collections import deque
+
+from pymavlink import mavutil
+
+import waits
+from swarm import BASE_PORT, PORT_STEP, Swarm
+
+CACHE_DIR = "param_cache"
+
+# Requests in flight per vehicle, reply timeout (s) and resends per request
+WINDOW = 16
+REQUEST_TIMEOUT = 1.0
+RETRIES = 3
+
+# A full download is finished when nothing new arrived for LIST_IDLE seconds
+LIST_IDLE = 1.0
+LIST_TIMEOUT = 60.0
+
+
+def _float32(value):
+    """Values travel as float32; compare what the vehicle can actually hold."""
+    return struct.unpack('<f', struct.pack('<f', value))[0]
+
+
+def same_value(a, b):
+    a, b = _float32(a), _float32(b)
+    return math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-7)
+
+
+def firmware_string(version):
+    """AUTOPILOT_VERSION.flight_sw_version as 'major.minor.patch'."""
+    return f"{version >> 24 & 0xFF}.{version >> 16 & 0xFF}.{version >> 8 & 0xFF}"
+
+
+# ----------------------------------------------------------------------
+# On-disk cache
+# ----------------------------------------------------------------------
+
+def cache_path(sysid, firmware, uid, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"sys{sysid}-{firmware}-{uid:x}.json")
+
+
+def load_cache(path):
+    """{name: [value, type]} and the parameter count, or (None, None)."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return data["params"], data["count"]
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+
+def save_cache(path, table, count, identity):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = dict(identity, count=count, saved=time.time(), params=table)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# ----------------------------------------------------------------------
+# Protocol
+# ----------------------------------------------------------------------
+
+async def vehicle_identity(link, timeout=2.0):
+    """Firmware version and board UID from AUTOPILOT_VERSION."""
+    reply = link.expect('AUTOPILOT_VERSION', lambda m: m.get_srcSystem() == link.target_system)
+    link.mav.command_long_send(link.target_system, link.target_component,
+                               mavutil.mavlink.MAV_CMD_REQUEST_MESSAGE, 0,
+                               mavutil.mavlink.MAVLINK_MSG_ID_AUTOPILOT_VERSION, 0, 0, 0, 0, 0, 0)
+    msg = await link.wait_future(reply, timeout)
+    if msg is None:
+        return {"sysid": link.target_system, "firmware": "unknown", "uid": 0}
+    return {"sysid": link.target_system, "firmware": firmware_string(msg.flight_sw_version),
+            "uid": msg.uid}
+
+
+async def pipeline(link, keys, send, key_of, window=WINDOW, timeout=REQUEST_TIMEOUT,
+                   retries=RETRIES):
+    """Call send(key) for every key with at most window unanswered at a time.
+
+    A PARAM_VALUE answers the request whose key equals key_of(msg); requests
+    without an answer after timeout are resent up to retries times. Returns
+    ({key: PARAM_VALUE}, [keys never answered]).
+    """
+    todo = deque(keys)
+    inflight = {}  # key -> (deadline, attempts)
+    replies = {}
+    failed = []
+    arrived = asyncio.Event()
+
+    def on_param(msg):
+        if msg.get_srcSystem() != link.target_system:
+            return
+        key = key_of(msg)
+        if key in inflight:
+            del inflight[key]
+            replies[key] = msg
+            arrived.set()
+
+    link.subscribe(on_param, 'PARAM_VALUE')
+    try:
+        while todo or inflight:
+            now = time.monotonic()
+            for key, (deadline, attempts) in list(inflight.items()):
+                if now >= deadline:
+                    if attempts > retries:
+                        del inflight[key]
+                        failed.append(key)
+                    else:
+                        send(key)
+                        inflight[key] = (now + timeout, attempts + 1)
+            while todo and len(inflight) < window:
+                key = todo.popleft()
+                send(key)
+                inflight[key] = (now + timeout, 1)
+            if not inflight:
+                break
+            arrived.clear()
+            wait = min(deadline for deadline, _ in inflight.values()) - time.monotonic()
+            try:
+                await asyncio.wait_for(arrived.wait(), max(wait, 0.001))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        link.unsubscribe(on_param, 'PARAM_VALUE')
+    return replies, failed
+
+
+async def fetch_all(link, window=WINDOW):
+    """Download the whole table: {name: [value, type]} and the vehicle's count."""
+    table = {}
+    by_index = {}
+    state = {"count": None, "last": time.monotonic()}
+
+    def on_param(msg):
+        if msg.get_srcSystem() != link.target_system:
+            return
+        table[msg.param_id] = [msg.param_value, msg.param_type]
+        by_index[msg.param_index] = msg.param_id
+        state["count"] = msg.param_count
+        state["last"] = time.monotonic()
+
+    link.subscribe(on_param, 'PARAM_VALUE')
+    try:
+        link.mav.param_request_list_send(link.target_system, link.target_component)
+        start = time.monotonic()
+        while time.monotonic() - start < LIST_TIMEOUT:
+            await asyncio.sleep(0.05)
+            if state["count"] is not None and len(by_index) >= state["count"]:
+                break
+            if time.monotonic() - state["last"] > LIST_IDLE:
+                break
+    finally:
+        link.unsubscribe(on_param, 'PARAM_VALUE')
+
+    count = state["count"]
+    if count is not None and len(by_index) < count:
+        # Fill the gaps left by lost frames with indexed reads
+        missing = [i for i in range(count) if i not in by_index]
+        replies, _ = await pipeline(
+            link, missing,
+            lambda i: link.mav.param_request_read_send(link.target_system, link.target_component,
+                                                       b"", i),
+            lambda m: m.param_index, window)
+        for msg in replies.values():
+            table[msg.param_id] = [msg.param_value, msg.param_type]
+    return table, count
+
+
+async def read_params(link, names, window=WINDOW):
+    """Read named parameters; returns ({name: [value, type]}, [unanswered names])."""
+    replies, failed = await pipeline(
+        link, names,
+        lambda name: link.mav.param_request_read_send(link.target_system, link.target_component,
+                                                      name.encode(), -1),
+        lambda m: m.param_id, window)
+    return {name: [m.param_value, m.param_type] for name, m in replies.items()}, failed
+
+
+async def set_params(link, changes, table, window=WINDOW):
+    """PARAM_SET every {name: value}; returns ({name: value echoed}, [unanswered])."""
+    def send(name):
+        param_type = table.get(name, [0, mavutil.mavlink.MAV_PARAM_TYPE_REAL32])[1]
+        link.mav.param_set_send(link.target_system, link.target_component, name.encode(),
+                                changes[name], param_type)
+
+    replies, failed = await pipeline(link, list(changes), send, lambda m: m.param_id, window)
+    return {name: m.param_value for name, m in replies.items()}, failed
+
+
+async def sync_params(link, wanted, cache_dir=CACHE_DIR, refresh=False, verify=True,
+                      dry_run=False, window=WINDOW):
+    """Bring one vehicle in line with {name: value}; returns a report dict."""
+    start = time.monotonic()
+    identity = await vehicle_identity(link)
+    path = cache_path(identity["sysid"], identity["firmware"], identity["uid"], cache_dir)
+    table, count = (None, None) if refresh else load_cache(path)
+    report = {"name": link.name, "sysid": identity["sysid"], "firmware": identity["firmware"],
+              "cached": table is not None, "downloaded": 0, "read": 0,
+              "unknown": [], "changed": {}, "rejected": [], "failed": []}
+
+    if table is None:
+        table, count = await fetch_all(link, window)
+        report["downloaded"] = len(table)
+    elif verify:
+        current, failed = await read_params(link, [n for n in wanted if n in table], window)
+        table.update(current)
+        report["read"] = len(current)
+        report["failed"] += failed
+
+    report["unknown"] = sorted(n for n in wanted if n not in table)
+    changes = {n: v for n, v in wanted.items() if n in table and not same_value(table[n][0], v)}
+    report["changed"] = {n: (table[n][0], v) for n, v in changes.items()}
+
+    if changes and not dry_run:
+        echoed, failed = await set_params(link, changes, table, window)
+        report["failed"] += failed
+        for name, value in echoed.items():
+            table[name][0] = value
+            if not same_value(value, changes[name]):
+                report["rejected"].append(name)
+
+    if table and not report["failed"]:
+        save_cache(path, table, count or len(table), identity)
+    report["elapsed"] = time.monotonic() - start
+    return report
+
+
+def print_report(r):
+    source = "cache" if r["cached"] else f"downloaded {r['downloaded']}"
+    print(f"[{r['name']}] sys {r['sysid']} fw {r['firmware']}: table from {source}, "
+          f"{r['read']} re-read, {len(r['changed'])} to change, {r['elapsed']:.2f}s")
+    for name, (old, new) in sorted(r["changed"].items()):
+        flag = " (rejected)" if name in r["rejected"] else ""
+        print(f"    {name:<18} {old:g} -> {new:g}{flag}")
+    if r["unknown"]:
+        print(f"    not on vehicle: {', '.join(r['unknown'])}")
+    if r["failed"]:
+        print(f"    no reply: {', '.join(map(str, r['failed']))}")
+
+
+async def run(args):
+    wanted = waits.load_param_file(args.parm)
+    for item in args.set or ():
+        name, _, value = item.partition("=")
+        wanted[name.strip()] = float(value)
+
+    if args.connections:
+        swarm = Swarm(args.connections.split(","))
+    else:
+        swarm = Swarm.from_ports(args.count, args.base_port, args.port_step)
+    print(f"Connecting to {len(swarm)} vehicles...")
+    missing = await swarm.connect(timeout=args.timeout)
+    if missing:
+        print(f"No heartbeat from: {', '.join(missing)}")
+    print(f"Syncing {len(wanted)} parameters from {args.parm}"
+          + (" (dry run)" if args.dry_run else ""))
+
+    start = time.monotonic()
+    try:
+        results = await swarm.each(lambda link: sync_params(
+            link, wanted, args.cache_dir, args.refresh, not args.no_verify, args.dry_run,
+            args.window))
+    finally:
+        swarm.close()
+    errors = 0
+    for name, r in results.items():
+        if isinstance(r, Exception):
+            print(f"[{name}] failed: {r}")
+            errors += 1
+        else:
+            print_report(r)
+            errors += bool(r["failed"] or r["rejected"])
+    print(f"\n{'✓' if not errors else '✗'} {len(results)} vehicles in "
+          f"{time.monotonic() - start:.2f}s, {errors} with problems")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync a .parm file to one or more vehicles")
+    parser.add_argument("--parm", default=waits.PARAM_FILE, help="parameter file")
+    parser.add_argument("--set", action="append", metavar="NAME=VALUE",
+                        help="extra parameter to apply (repeatable)")
+    parser.add_argument("--connections", help="comma-separated connection strings")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--port-step", type=int, default=PORT_STEP)
+    parser.add_argument("--timeout", type=float, default=30, help="heartbeat timeout (s)")
+    parser.add_argument("--window", type=int, default=WINDOW,
+                        help="parameter requests in flight per vehicle")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--refresh", action="store_true", help="ignore the cache and download")
+    parser.add_argument("--no-verify", action="store_true",
+                        help="trust cached values instead of re-reading the file's parameters")
+    parser.add_argument("--dry-run", action="store_true", help="report the diff without setting")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Mission-phase profiler
+Splits a script run into named phases (heartbeat, GPS lock, EKF check, mode
+change, arming, takeoff, transit, ...) and records for each one the wall
+time, the simulated time (from the vehicle's time_boot_ms) and how many
+messages were read off the link versus actually handed to the script; the
+rest were discarded by a type filter in recv_match().
+
+Profiling is off unless PHASE_PROFILE names a report directory, so the
+hooks cost one attribute check in normal runs:
+
+  with phase_profiler.phase("gps_lock"): ...
+  @phase_profiler.profiled("arm")
+  phase_profiler.mark("airborne")   # milestone, time since the run started
+
+Each profiled run writes <dir>/<script>-<time>.json at exit. The run and
+aggregate commands repeat a script and turn many reports into percentile
+tables, e.g. to compare startup-to-airborne time across configurations.
+
+Usage:
+  PHASE_PROFILE=profiles python3 control_drone.py
+  python3 phase_profiler.py run control_drone.py --runs 5 --label speedup20
+  python3 phase_profiler.py aggregate profiles/*.json --by label
+"""
+
+import argparse
+import atexit
+import functools
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Environment variables that switch profiling on and tag the run
+PROFILE_ENV = "PHASE_PROFILE"
+LABEL_ENV = "PHASE_LABEL"
+
+DEFAULT_DIR = "profiles"
+
+PERCENTILES = (50, 90, 99)
+
+
+class Profiler:
+    """Phase timings and message counts for one run."""
+
+    def __init__(self, script, label=None, directory=DEFAULT_DIR):
+        self.script = script
+        self.label = label
+        self.directory = directory
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.phases = []
+        self.marks = {}
+        self.messages_read = 0
+        self.messages_used = 0
+        self.time_boot_ms = None
+        self._boot_at_start = None
+        self._depth = 0
+        self._conns = []
+
+    # ------------------------------------------------------------------
+    # Instrumentation
+    # ------------------------------------------------------------------
+
+    def watch(self, conn):
+        """Count messages read from (and used off) a mavutil connection."""
+        if conn in self._conns:
+            return conn
+        self._conns.append(conn)
+        mav = conn.mav
+        chained = (mav.callback, mav.callback_args, mav.callback_kwargs)
+
+        def on_receive(msg, *args, **kwargs):
+            self.observe(msg)
+            callback, cargs, ckwargs = chained
+            if callback is not None:
+                callback(msg, *cargs, **ckwargs)
+
+        mav.set_callback(on_receive)
+
+        # recv_match() reads through recv_msg(); count only what reaches the caller
+        recv_match, recv_msg = conn.recv_match, conn.recv_msg
+        inside = [False]
+
+        def counted_match(*args, **kwargs):
+            outer = not inside[0]
+            inside[0] = True
+            try:
+                msg = recv_match(*args, **kwargs)
+            finally:
+                if outer:
+                    inside[0] = False
+            if msg is not None and outer:
+                self.messages_used += 1
+            return msg
+
+        def counted_msg():
+            msg = recv_msg()
+            if msg is not None and not inside[0]:
+                self.messages_used += 1
+            return msg
+
+        conn.recv_match = counted_match
+        conn.recv_msg = counted_msg
+        return conn
+
+    def observe(self, msg):
+        """Count a received message and follow the vehicle clock (time_boot_ms)."""
+        self.messages_read += 1
+        boot_ms = getattr(msg, "time_boot_ms", None)
+        if boot_ms:
+            self.time_boot_ms = boot_ms
+            if self._boot_at_start is None:
+                self._boot_at_start = boot_ms
+
+    def _counters(self):
+        return time.monotonic(), self.time_boot_ms, self.messages_read, self.messages_used
+
+    @contextmanager
+    def phase(self, name):
+        entry = {"name": name, "depth": self._depth, "ok": True}
+        self.phases.append(entry)
+        self._depth += 1
+        before = self._counters()
+        try:
+            yield entry
+        except BaseException:
+            entry["ok"] = False
+            raise
+        finally:
+            self._depth -= 1
+            after = self._counters()
+            entry["wall_s"] = after[0] - before[0]
+            entry["sim_s"] = ((after[1] - before[1]) / 1000.0
+                              if before[1] is not None and after[1] is not None else None)
+            entry["read"] = after[2] - before[2]
+            entry["used"] = after[3] - before[3]
+            entry["discarded"] = entry["read"] - entry["used"]
+
+    def mark(self, name):
+        """Record a milestone (wall and sim seconds since the run started)."""
+        sim = None
+        if self._boot_at_start is not None:
+            sim = (self.time_boot_ms - self._boot_at_start) / 1000.0
+        self.marks[name] = {"wall_s": time.monotonic() - self.started, "sim_s": sim}
+
+    # ------------------------------------------------------------------
+    # Reports
+    # ------------------------------------------------------------------
+
+    def report(self):
+        return {
+            "script": self.script,
+            "label": self.label,
+            "started": self.started_at,
+            "wall_s": time.monotonic() - self.started,
+            "messages_read": self.messages_read,
+            "messages_used": self.messages_used,
+            "phases": self.phases,
+            "marks": self.marks,
+        }
+
+    def write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        path = os.path.join(self.directory, f"{self.script}-{stamp}-{os.getpid()}.json")
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=1)
+        return path
+
+    def print_table(self):
+        print(f"\n{'phase':<32} {'wall s':>8} {'sim s':>8} {'read':>7} {'discarded':>9}")
+        for p in self.phases:
+            if "wall_s" not in p:
+                continue
+            sim = p["sim_s"]
+            name = "  " * p["depth"] + p["name"] + ("" if p["ok"] else " (!)")
+            print(f"{name:<32} {p['wall_s']:>8.2f} "
+                  f"{sim if sim is not None else float('nan'):>8.2f} "
+                  f"{p['read']:>7} {p['discarded']:>9}")
+        for name, m in self.marks.items():
+            print(f"* {name}: {m['wall_s']:.2f}s wall"
+                  + (f", {m['sim_s']:.2f}s sim" if m["sim_s"] is not None else ""))
+
+
+# ----------------------------------------------------------------------
+# Module-level hooks (no-ops unless a profiler is active)
+# ----------------------------------------------------------------------
+
+_active = None
+
+
+def enable(script, directory=DEFAULT_DIR, label=None):
+    """Start profiling this process; the report is written at exit."""
+    global _active
+    _active = Profiler(script, label, directory)
+
+    def finish():
+        _active.print_table()
+        print(f"Phase profile written to {_active.write()}")
+
+    atexit.register(finish)
+    return _active
+
+
+def enable_from_env(script):
+    """enable() if PHASE_PROFILE is set (its value is the report directory)."""
+    directory = os.environ.get(PROFILE_ENV)
+    if directory:
+        return enable(script, directory, os.environ.get(LABEL_ENV))
+    return None
+
+
+def watch(conn):
+    if _active is not None:
+        _active.watch(conn)
+    return conn
+
+
+@contextmanager
+def phase(name):
+    if _active is None:
+        yield None
+        return
+    with _active.phase(name) as entry:
+        yield entry
+
+
+def profiled(name=None):
+    """Decorator: run the function as a phase.
+
+    name defaults to the function's; a callable name is called with the
+    function's arguments (e.g. to put the mode in a set_mode phase).
+    """
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _active.phase(label(*args, **kwargs) if callable(label) else label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def mark(name):
+    if _active is not None:
+        _active.mark(name)
+
+
+# ----------------------------------------------------------------------
+# Aggregation
+# ----------------------------------------------------------------------
+
+def percentile(values, q):
+    """Linear-interpolated q-th percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100.0
+    lo = int(rank)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (rank - lo)
+
+
+def aggregate(reports, by="script"):
+    """{group: {phase or '*mark': {metric: [values]}}} over many reports."""
+    groups = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+    for r in reports:
+        group = r.get(by) or "-"
+        rows = groups[group]
+        rows["(total)"]["wall_s"].append(r["wall_s"])
+        for p in r["phases"]:
+            if "wall_s" not in p:
+                continue
+            row = rows["  " * p["depth"] + p["name"]]
+            for key in ("wall_s", "sim_s", "discarded"):
+                if p.get(key) is not None:
+                    row[key].append(p[key])
+        for name, m in r["marks"].items():
+            for key in ("wall_s", "sim_s"):
+                if m.get(key) is not None:
+                    rows[f"* {name}"][key].append(m[key])
+    return groups
+
+
+def print_aggregate(groups):
+    header = " ".join(f"{f'wall p{q}':>9}" for q in PERCENTILES)
+    for group, rows in groups.items():
+        print(f"\n== {group} ==")
+        print(f"{'phase':<32} {'n':>3} {header} {'sim p50':>8} {'disc p50':>8}")
+        for name, metrics in rows.items():
+            wall = metrics.get("wall_s") or [float("nan")]
+            sim = metrics.get("sim_s")
+            disc = metrics.get("discarded")
+            cells = " ".join(f"{percentile(wall, q):>9.2f}" for q in PERCENTILES)
+            print(f"{name:<32} {len(wall):>3} {cells} "
+                  f"{percentile(sim, 50) if sim else float('nan'):>8.2f} "
+                  f"{percentile(disc, 50) if disc else float('nan'):>8.0f}")
+
+
+def load_reports(paths):
+    reports = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path) as f:
+                reports.append(json.load(f))
+    return reports
+
+
+# ----------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------
+
+def cmd_run(args):
+    """Run a script several times with profiling on, then aggregate."""
+    env = dict(os.environ, **{PROFILE_ENV: args.dir})
+    if args.label:
+        env[LABEL_ENV] = args.label
+    before = set(glob.glob(os.path.join(args.dir, "*.json")))
+    for i in range(args.runs):
+        print(f"--- run {i + 1}/{args.runs}: {args.script}")
+        result = subprocess.run([sys.executable, args.script], env=env,
+                                stdout=None if args.verbose else subprocess.DEVNULL)
+        if result.returncode:
+            print(f"✗ exit code {result.returncode}")
+    new = sorted(set(glob.glob(os.path.join(args.dir, "*.json"))) - before)
+    print(f"✓ {len(new)} reports in {args.dir}")
+    if new:
+        print_aggregate(aggregate(load_reports(new), "label" if args.label else "script"))
+
+
+def cmd_aggregate(args):
+    print_aggregate(aggregate(load_reports(args.reports), args.by))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile and compare mission phases")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run a script N times with profiling on")
+    run.add_argument("script")
+    run.add_argument("--runs", type=int, default=3)
+    run.add_argument("--label", help="tag for these runs (e.g. the configuration)")
+    run.add_argument("--dir", default=DEFAULT_DIR, help="report directory")
+    run.add_argument("--verbose", action="store_true", help="show the script's output")
+    run.set_defaults(func=cmd_run)
+
+    agg = sub.add_parser("aggregate", help="percentile tables over saved reports")
+    agg.add_argument("reports", nargs="+", help="report files or glob patterns")
+    agg.add_argument("--by", default="script", choices=("script", "label"))
+    agg.set_defaults(func=cmd_aggregate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
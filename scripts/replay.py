@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+MAVLink replay engine
+Plays a recorded flight back through a mavutil-compatible connection, so the
+control scripts run offline against real telemetry without AirSim or SITL:
+
+  vehicle = open_replay("flight.tlog", speed=100)
+  control_drone.check_gps_lock(vehicle)
+
+Sources are telemetry logs (.tlog, as written by MAVProxy and QGroundControl)
+and telemetry_recorder.py log directories. Both are streamed from disk one
+message at a time; recorder columns are read in chunks and merged by time.
+
+speed=1 keeps the original inter-message timing, speed=100 compresses it and
+speed=0 delivers messages as fast as they can be read. recv_match() timeouts
+are measured on the log's clock, so a helper that waits 3 s for a message
+gives up after 3 s of recorded flight at any speed. replay_clock() points a
+module's time.time()/time.sleep() at the same clock for loops that time
+themselves.
+
+Commands sent by a script are encoded normally and kept in .sent; the replay
+never answers them, so a COMMAND_ACK only arrives if the log contains one.
+
+Usage:
+  python3 replay.py flight.tlog --speed 100
+  python3 replay.py telemetry_logs/20260101-120000 --speed 0 --check
+"""
+
+import argparse
+import heapq
+import os
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from operator import itemgetter
+
+from pymavlink import mavutil
+from pymavlink.dialects.v20 import ardupilotmega as mavlink2
+
+# Rows read from each recorder column per disk access
+CHUNK_ROWS = 1024
+
+# In as-fast-as-possible mode recv_msg() yields (returns None) after this many
+# messages, so an asyncio reader polling the replay does not starve the loop
+BURST = 256
+
+# Outgoing frames kept for inspection
+SENT_FRAMES = 1000
+
+# System ID used by ground stations; their own traffic in a tlog is skipped
+GCS_SYSID = 255
+
+
+# ----------------------------------------------------------------------
+# Sources: iterators of (log time, message)
+# ----------------------------------------------------------------------
+
+def tlog_messages(path):
+    """Read a .tlog incrementally through pymavlink's log reader."""
+    log = mavutil.mavlogfile(path)
+    try:
+        while True:
+            msg = log.recv_msg()
+            if msg is None:
+                return
+            if msg.get_type() == 'BAD_DATA' or msg.get_srcSystem() == GCS_SYSID:
+                continue
+            del msg._posted
+            yield msg._timestamp, msg
+    finally:
+        log.close()
+
+
+def _message_factory(mtype):
+    """Message class and constructor defaults for a recorded type."""
+    cls = getattr(mavlink2, f"MAVLink_{mtype.lower()}_message")
+    defaults = {}
+    for name, ftype, length in zip(cls.fieldnames, cls.fieldtypes, cls.array_lengths):
+        if ftype == "char":
+            defaults[name] = ""
+        elif length:
+            defaults[name] = [0] * length
+        else:
+            defaults[name] = 0
+    return cls, defaults
+
+
+def _table_messages(table, chunk):
+    cls, defaults = _message_factory(table.type)
+    fields = [name for name in table.fields if name in defaults]
+    for start in range(0, len(table), chunk):
+        stop = min(start + chunk, len(table))
+        columns = [table.time[start:stop].tolist(), table.sysid[start:stop].tolist()]
+        columns += [table[name][start:stop].tolist() for name in fields]
+        for row in zip(*columns):
+            kwargs = dict(defaults)
+            kwargs.update(zip(fields, row[2:]))
+            msg = cls(**kwargs)
+            msg._header = mavlink2.MAVLink_header(cls.id, srcSystem=row[1], srcComponent=1)
+            yield row[0], msg
+
+
+def recorder_messages(directory, chunk=CHUNK_ROWS):
+    """Merge the per-type columns of a telemetry_recorder log by receive time."""
+    from telemetry_recorder import TelemetryLog
+    log = TelemetryLog(directory)
+    streams = [_table_messages(log[mtype], chunk) for mtype in log.types()
+               if hasattr(mavlink2, f"MAVLink_{mtype.lower()}_message")]
+    seqs = {}
+    for t, msg in heapq.merge(*streams, key=itemgetter(0)):
+        sysid = msg._header.srcSystem
+        if sysid == GCS_SYSID:
+            continue
+        # Number the merged stream so link-loss accounting sees no gaps
+        seq = seqs.get(sysid, -1) + 1 & 0xFF
+        seqs[sysid] = seq
+        msg._header.seq = seq
+        yield t, msg
+
+
+def open_source(path):
+    if os.path.isdir(path):
+        return recorder_messages(path)
+    return tlog_messages(path)
+
+
+# ----------------------------------------------------------------------
+# Connection
+# ----------------------------------------------------------------------
+
+class ReplayConnection(mavutil.mavfile):
+    """A recorded flight behind the mavutil connection interface."""
+
+    def __init__(self, path, speed=1.0, source_system=255, source_component=0):
+        self.path = path
+        self.speed = speed
+        self.sent = deque(maxlen=SENT_FRAMES)
+        self.bytes_sent = 0
+        self.messages_replayed = 0
+        self.eof = False
+        self.log_time = None
+        self._source = open_source(path)
+        self._next = None
+        self._origin = None  # (log time, monotonic time) of the first message
+        self._burst = 0
+        mavutil.mavfile.__init__(self, None, path, source_system=source_system,
+                                 source_component=source_component)
+
+    # ------------------------------------------------------------------
+    # Replay clock
+    # ------------------------------------------------------------------
+
+    def clock(self):
+        """Current time on the log's clock (Unix seconds when recorded)."""
+        if self._origin is None:
+            self._peek()
+            if self._origin is None:
+                return self.log_time or 0.0
+        if not self.speed:
+            return self.log_time
+        t0, w0 = self._origin
+        return t0 + (time.monotonic() - w0) * self.speed
+
+    def advance(self, seconds):
+        """Let log time pass without reading, like sleeping on a live link."""
+        if seconds <= 0:
+            return
+        if self.speed:
+            time.sleep(seconds / self.speed)
+        else:
+            self.log_time = self.clock() + seconds
+
+    def _due_in(self, t):
+        """Wall seconds until a message logged at t is due."""
+        if not self.speed:
+            return 0.0
+        t0, w0 = self._origin
+        return w0 + (t - t0) / self.speed - time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def _peek(self):
+        if self._next is None and not self.eof:
+            self._next = next(self._source, None)
+            if self._next is None:
+                self.eof = True
+            elif self._origin is None:
+                self._origin = (self._next[0], time.monotonic())
+                self.log_time = self._next[0]
+        return self._next
+
+    def _deliver(self):
+        t, msg = self._next
+        self._next = None
+        if self.first_byte:
+            buf = msg.get_msgbuf()
+            self.auto_mavlink_version(buf[:1] if buf else b"\xfd")
+        self.log_time = max(self.log_time, t)
+        self._timestamp = t
+        self.post_message(msg)
+        # Parse callbacks (link_monitor, command_dispatcher) see replayed messages too
+        mav = self.mav
+        if mav.callback is not None:
+            mav.callback(msg, *mav.callback_args, **mav.callback_kwargs)
+        self.messages_replayed += 1
+        return msg
+
+    def recv_msg(self):
+        """Next message if it is due, otherwise None (non-blocking, like UDP)."""
+        head = self._peek()
+        if head is None or self._due_in(head[0]) > 0:
+            return None
+        if not self.speed:
+            self._burst += 1
+            if self._burst >= BURST:
+                self._burst = 0
+                return None
+        return self._deliver()
+
+    def recv_match(self, condition=None, type=None, blocking=False, timeout=None):
+        """mavfile.recv_match with the timeout measured on the log clock."""
+        if type is not None and not isinstance(type, (list, set, tuple)):
+            type = [type]
+        deadline = self.clock() + timeout if blocking and timeout is not None else None
+        while True:
+            head = self._peek()
+            if head is None or (deadline is not None and head[0] > deadline):
+                # Nothing arrives before the deadline: let the wait run out
+                if deadline is not None:
+                    self.advance(deadline - self.clock())
+                return None
+            wait = self._due_in(head[0])
+            if wait > 0:
+                if not blocking:
+                    return None
+                time.sleep(wait)
+            msg = self._deliver()
+            if type is not None and msg.get_type() not in type:
+                continue
+            state = self.sysid_state.get(msg.get_srcSystem())
+            if state is None or not mavutil.evaluate_condition(condition, state.messages):
+                continue
+            return msg
+
+    def select(self, timeout):
+        head = self._peek()
+        if head is None:
+            return False
+        wait = self._due_in(head[0])
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+        return wait <= timeout
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def write(self, buf):
+        self.sent.append(bytes(buf))
+        self.bytes_sent += len(buf)
+
+    def sent_messages(self):
+        """Decode what the script sent, oldest first."""
+        parser = mavlink2.MAVLink(None)
+        parser.robust_parsing = True
+        messages = []
+        for buf in self.sent:
+            messages.extend(m for m in parser.parse_buffer(buf) or () if m.get_type() != 'BAD_DATA')
+        return messages
+
+    def close(self):
+        self._source.close()
+
+
+def open_replay(path, speed=1.0, **kwargs):
+    """Counterpart of mavutil.mavlink_connection() for recorded flights."""
+    return ReplayConnection(path, speed, **kwargs)
+
+
+class ReplayClock:
+    """Stand-in for the time module that follows a replay's clock."""
+
+    def __init__(self, replay):
+        self.replay = replay
+
+    def time(self):
+        return self.replay.clock()
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.replay.advance(seconds)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@contextmanager
+def replay_clock(replay, *modules):
+    """Point each module's `time` at the replay clock while the block runs."""
+    saved = [(module, module.time) for module in modules]
+    clock = ReplayClock(replay)
+    for module, _ in saved:
+        module.time = clock
+    try:
+        yield clock
+    finally:
+        for module, original in saved:
+            module.time = original
+
+
+# ----------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------
+
+def cmd_play(replay):
+    counts = Counter()
+    while True:
+        msg = replay.recv_match(blocking=True)
+        if msg is None:
+            break
+        counts[msg.get_type()] += 1
+    for mtype, n in counts.most_common():
+        print(f"  {mtype:<24} {n:>8}")
+
+
+def cmd_check(replay):
+    """Run the pre-flight checks from control_drone.py against the log."""
+    import control_drone
+    import waits
+    with replay_clock(replay, control_drone, waits):
+        if not replay.wait_heartbeat(timeout=30):
+            print("No heartbeat in log")
+            return
+        print(f"Heartbeat from system {replay.target_system} "
+              f"({replay.flightmode}, {'armed' if replay.motors_armed() else 'disarmed'})")
+        gps = control_drone.check_gps_lock(replay)
+        ekf = control_drone.check_ekf_status(replay)
+    print(f"GPS lock: {gps}, EKF: {ekf}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded flight")
+    parser.add_argument("source", help=".tlog file or telemetry_recorder log directory")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="playback speed (1 = original timing, 0 = as fast as possible)")
+    parser.add_argument("--check", action="store_true",
+                        help="run control_drone's GPS/EKF checks against the log")
+    args = parser.parse_args()
+
+    replay = open_replay(args.source, args.speed)
+    print(f"Replaying {args.source} at {'max' if not args.speed else f'{args.speed:g}x'} speed")
+    start = time.monotonic()
+    first = replay.clock()
+    try:
+        if args.check:
+            cmd_check(replay)
+        else:
+            cmd_play(replay)
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+    finally:
+        replay.close()
+    elapsed = time.monotonic() - start
+    span = (replay.log_time or first) - first
+    print(f"✓ {replay.messages_replayed} messages, {span:.1f}s of flight in {elapsed:.2f}s "
+          f"({replay.messages_replayed / max(elapsed, 1e-6):.0f} msg/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,13 @@ set -euo pipefail
 # Usage:
 #   ./scripts/run-simulation.sh
 #   ./scripts/run-simulation.sh --no-display
+#   ./scripts/run-simulation.sh --router
 
 ###############################################################################
 # Argument parsing
 ###############################################################################
 NO_DISPLAY=0
+USE_ROUTER=0
 
 while [[ ${1:-} == --* ]]; do
   case "$1" in
@@ -17,10 +19,15 @@ while [[ ${1:-} == --* ]]; do
       NO_DISPLAY=1
       shift
       ;;
+    --router)
+      USE_ROUTER=1
+      shift
+      ;;
     --help)
       cat <<HELP
 Usage: $0 [options]
   --no-display   Run AirSim in NoDisplay mode (no graphics)
+  --router       Fan out with scripts/mav_router.py instead of MAVProxy
   --help         Show this help
 
 Environment variables:
@@ -150,15 +157,26 @@ PIXI_BIN_DIR="${PROJECT_ROOT}/.pixi/envs/simulation/bin"
 export PATH="${PIXI_BIN_DIR}:${PATH}"
 export MAVPROXY_CMD="${PIXI_BIN_DIR}/mavproxy.py"
 
+# Outputs: MAVProxy's --out, or the in-process router on SITL's TCP port
+if [[ ${USE_ROUTER} -eq 1 ]]; then
+  echo "[run-simulation] Starting MAVLink router (tcp:127.0.0.1:5760 -> 14550, 14551)..."
+  "${PIXI_BIN_DIR}/python3" "${SCRIPT_DIR}/mav_router.py" \
+    --master tcp:127.0.0.1:5760 \
+    --out 127.0.0.1:14550 \
+    --out 127.0.0.1:14551 \
+    --stats-interval 30 &
+  PIDS+=($!)
+  OUTPUT_ARGS="--no-mavproxy"
+else
+  OUTPUT_ARGS="--console --map --out=127.0.0.1:14550 --out=127.0.0.1:14551"
+fi
+
 # Run sim_vehicle.py with proper arguments using Pixi's python
 "${PIXI_BIN_DIR}/python3" "${SIM_VEHICLE}" \
   -v ArduCopter \
   --model airsim-copter \
   --sim-address=127.0.0.1 \
-  --console \
-  --map \
-  --out=127.0.0.1:14550 \
-  --out=127.0.0.1:14551 \
+  ${OUTPUT_ARGS} \
   ${PARAM_ARG}
 
 # If we reach here, sim_vehicle.py has exited
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Fixed-rate control loop scheduler
+Runs callbacks against monotonic deadlines instead of "work; sleep(0.1)", so
+the loop rate no longer drifts with the cost of sending and printing.
+Each task records its actual period and its start jitter (lateness against
+the deadline) in histograms and counts overruns.
+
+Overrun policy per task:
+  skip     - drop the missed ticks and realign to the next deadline
+  catchup  - run missed ticks back to back (at most MAX_CATCHUP of them)
+"""
+
+import asyncio
+import time
+
+from metrics import Histogram
+
+MIN_RATE = 0.1
+MAX_RATE = 1000.0
+MAX_CATCHUP = 5
+
+
+class ScheduledTask:
+    """One periodic callback and its timing statistics."""
+
+    def __init__(self, callback, rate, name=None, policy="skip"):
+        if not MIN_RATE <= rate <= MAX_RATE:
+            raise ValueError(f"rate must be between {MIN_RATE} and {MAX_RATE} Hz")
+        if policy not in ("skip", "catchup"):
+            raise ValueError(f"unknown overrun policy: {policy}")
+        self.callback = callback
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.name = name or getattr(callback, "__name__", "task")
+        self.policy = policy
+
+        self.deadline = None
+        self.last_start = None
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.period_hist = Histogram()
+        self.jitter_hist = Histogram()
+        self.cost_hist = Histogram()
+
+    def run(self, now, clock):
+        """Run one tick that was due at self.deadline, then schedule the next."""
+        self.jitter_hist.add(now - self.deadline)
+        if self.last_start is not None:
+            self.period_hist.add(now - self.last_start)
+        self.last_start = now
+        self.callback()
+        end = clock()
+        self.cost_hist.add(end - now)
+        self.runs += 1
+
+        self.deadline += self.period
+        if end > self.deadline:
+            self.overruns += 1
+            missed = int((end - self.deadline) / self.period)
+            if self.policy == "skip" or missed >= MAX_CATCHUP:
+                self.skipped += missed + 1
+                self.deadline += (missed + 1) * self.period
+
+    def report(self):
+        return {
+            "name": self.name,
+            "rate_hz": self.rate,
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "period_ms": self.period_hist.snapshot(1000),
+            "jitter_ms": self.jitter_hist.snapshot(1000),
+            "cost_ms": self.cost_hist.snapshot(1000),
+        }
+
+
+class RateScheduler:
+    """Runs several fixed-rate tasks on one thread (or one asyncio task)."""
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.tasks = []
+        self.running = False
+
+    def add_task(self, callback, rate, name=None, policy="skip"):
+        task = ScheduledTask(callback, rate, name, policy)
+        self.tasks.append(task)
+        if self.running:
+            task.deadline = self.clock()
+        return task
+
+    def stop(self):
+        self.running = False
+
+    def _start(self):
+        self.running = True
+        now = self.clock()
+        for task in self.tasks:
+            task.deadline = now
+
+    def _step(self):
+        """Run every due task; return the delay until the next deadline."""
+        now = self.clock()
+        for task in self.tasks:
+            if task.deadline <= now and self.running:
+                task.run(now, self.clock)
+                now = self.clock()
+        return min(task.deadline for task in self.tasks) - self.clock()
+
+    def run(self, duration=None):
+        """Block running tasks until stop() is called or duration elapses."""
+        self._start()
+        end = None if duration is None else self.clock() + duration
+        while self.running and self.tasks:
+            delay = self._step()
+            if end is not None and self.clock() >= end:
+                break
+            if delay > 0:
+                self.sleep(delay)
+        self.running = False
+
+    async def run_async(self, duration=None):
+        """Same as run(), yielding to the event loop between ticks."""
+        self._start()
+        end = None if duration is None else self.clock() + duration
+        while self.running and self.tasks:
+            delay = self._step()
+            if end is not None and self.clock() >= end:
+                break
+            await asyncio.sleep(max(delay, 0))
+        self.running = False
+
+    def report(self):
+        return [task.report() for task in self.tasks]
+
+    def print_report(self):
+        print(f"{'task':<12} {'Hz':>6} {'runs':>7} {'overrun':>7} "
+              f"{'period p50/p99 ms':>18} {'jitter p50/p99 ms':>18}")
+        for task in self.tasks:
+            r = task.report()
+            period, jitter = r["period_ms"], r["jitter_ms"]
+            print(f"{task.name:<12} {task.rate:>6.1f} {task.runs:>7} {task.overruns:>7} "
+                  f"{period.get('p50', 0):>8.2f}/{period.get('p99', 0):<9.2f} "
+                  f"{jitter.get('p50', 0):>8.2f}/{jitter.get('p99', 0):<9.2f}")
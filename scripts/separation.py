@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Spatial index for inter-drone separation and deconfliction
+A uniform grid over the fleet's positions answers "every pair closer than r"
+in one batch query, so the separation check per control tick grows with the
+number of vehicles rather than the number of pairs. Deconflictor uses those
+pairs to adjust velocity setpoints before they are sent.
+
+The grid is rebuilt from LOCAL_POSITION_NED every tick: cells of size r are
+packed into one int64 key per vehicle and sorted once. For each vehicle, its
+own cell and the 13 neighbouring cells "ahead" of it are found with a binary
+search, so every pair is checked exactly once. One argsort is cheaper in
+NumPy than updating buckets per vehicle, even when few vehicles change cell.
+
+Deconfliction, per pair closer than --radius:
+  - the closing speed along the line between the two is cancelled, shared
+    equally, and a separation speed is added, both weighted from 0 at the
+    radius to 1 at --minimum
+  - the cancelled closing speed becomes a sideways step to each vehicle's
+    right, so pairs meeting head-on pass each other instead of stalling
+  - the result is capped at the WPNAV speed limits like formation.py
+Vehicles at the same point (a fleet stacked on one home) are split along
+directions spread by pair index.
+
+AirSim collisions are on (EnableCollisions in config/airsim/settings.json),
+and each vehicle's local position is relative to its own spawn point; the
+X/Y/Z spawn offsets of the Vehicles in settings.json are added to put the
+fleet in one frame.
+
+Usage:
+  python3 separation.py --bench
+  python3 fake_vehicle.py --count 12 --speedup 1 &
+  python3 separation.py --count 12 --takeoff 10 --duration 60
+  python3 separation.py --count 12 --takeoff 10 --duration 60 --no-deconflict
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+
+import numpy as np
+
+from formation import Formation, fleet_positions, limit_velocities, speed_limits, wait_altitude
+from geodesy import SETTINGS_FILE
+from swarm import BASE_PORT, PORT_STEP, SETPOINT_RATE, Swarm
+
+# Pairs closer than this are deconflicted (m)
+SEPARATION_RADIUS = 6.0
+# Full avoidance inside this distance (m)
+MIN_SEPARATION = 3.0
+# Speed at which a pair inside MIN_SEPARATION is pushed apart (m/s)
+SEPARATION_SPEED = 2.0
+# Part of the closing speed turned into a sideways step to the right, which
+# breaks the deadlock of vehicles meeting head-on
+PASS_RIGHT = 1.0
+
+# Grid key packing: 21 bits per axis, cell indices within +/- 2**20
+KEY_BITS = 21
+KEY_BIAS = 1 << (KEY_BITS - 1)
+
+BENCH_SIZES = (10, 100, 500, 1000, 2000)
+# Fleet density in the benchmark: vehicles per 1000 m^2 of a 20 m thick layer
+BENCH_DENSITY = 5.0
+# Largest fleet the O(N^2) reference is timed on
+BRUTE_FORCE_MAX = 2000
+
+
+def _pack(cells):
+    return ((cells[..., 0] + KEY_BIAS) << (2 * KEY_BITS)) | \
+           ((cells[..., 1] + KEY_BIAS) << KEY_BITS) | (cells[..., 2] + KEY_BIAS)
+
+
+# Key offsets of a vehicle's own cell and the 13 neighbours "ahead" of it;
+# with the 13 behind left out, every pair of cells is visited once. Packed
+# fields do not carry into each other, so a cell offset is a key offset.
+HALF_NEIGHBOUR_KEYS = np.array([
+    _pack(np.array(offset)) - _pack(np.zeros(3, dtype=np.int64))
+    for offset in [(0, 0, 0)] + [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                                 for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0)]
+])
+
+
+class SpatialGrid:
+    """Uniform grid over (N, 3) positions for batch neighbour queries."""
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.positions = np.zeros((0, 3))
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.order = np.zeros(0, dtype=np.intp)
+        self.sorted_keys = self.keys
+
+    def build(self, positions):
+        self.positions = positions
+        self.keys = _pack(np.floor(positions / self.cell).astype(np.int64))
+        self.order = np.argsort(self.keys, kind="stable")
+        self.sorted_keys = self.keys[self.order]
+        return self
+
+    def pairs(self, radius=None):
+        """(i, j, distance) arrays of every pair closer than radius, i < j.
+
+        radius defaults to the cell size and must not exceed it.
+        """
+        radius = self.cell if radius is None else radius
+        if radius > self.cell:
+            raise ValueError(f"radius {radius} exceeds the grid cell {self.cell}")
+        # One search for all 14 cells of every vehicle: row = vehicle, column = cell
+        wanted = (self.keys[:, None] + HALF_NEIGHBOUR_KEYS).ravel()
+        lo = np.searchsorted(self.sorted_keys, wanted, "left")
+        counts = np.searchsorted(self.sorted_keys, wanted, "right") - lo
+        total = int(counts.sum())
+        # Expand each run of candidates: i repeated, j along the run
+        ends = np.cumsum(counts)
+        run = np.arange(total) + np.repeat(lo - (ends - counts), counts)
+        query = np.repeat(np.arange(len(wanted)), counts)
+        i, j = query // len(HALF_NEIGHBOUR_KEYS), self.order[run]
+        # In a vehicle's own cell (column 0) each pair turns up twice, and itself once
+        keep = (query % len(HALF_NEIGHBOUR_KEYS) != 0) | (i < j)
+        i, j = i[keep], j[keep]
+        distance = np.linalg.norm(self.positions[i] - self.positions[j], axis=1)
+        close = distance < radius
+        i, j, distance = i[close], j[close], distance[close]
+        # Report each pair as (lower, higher) index
+        return np.minimum(i, j), np.maximum(i, j), distance
+
+
+def brute_force_pairs(positions, radius):
+    """O(N^2) reference for SpatialGrid.pairs()."""
+    distance = np.linalg.norm(positions[:, None, :] - positions[None, :, :], axis=2)
+    i, j = np.nonzero(np.triu(distance < radius, k=1))
+    return i, j, distance[i, j]
+
+
+def spawn_offsets(count, path=SETTINGS_FILE):
+    """(count, 3) NED spawn offsets of the AirSim Vehicles, in order (zeros if unset)."""
+    offsets = np.zeros((count, 3))
+    try:
+        with open(path) as f:
+            vehicles = json.load(f).get("Vehicles", {})
+    except (OSError, ValueError):
+        return offsets
+    for row, vehicle in zip(offsets, vehicles.values()):
+        row[:] = vehicle.get("X", 0.0), vehicle.get("Y", 0.0), vehicle.get("Z", 0.0)
+    return offsets
+
+
+class Deconflictor:
+    """Adjusts fleet velocity setpoints so that no pair closes inside the radius."""
+
+    def __init__(self, radius=SEPARATION_RADIUS, minimum=MIN_SEPARATION,
+                 speed=SEPARATION_SPEED, limits=None):
+        if not 0 <= minimum < radius:
+            raise ValueError("minimum separation must be below the radius")
+        self.radius = radius
+        self.minimum = minimum
+        self.speed = speed
+        self.limits = limits or speed_limits()
+        self.grid = SpatialGrid(radius)
+        # When off, pairs are still measured but setpoints pass unchanged
+        self.enabled = True
+        # Last tick
+        self.pairs = 0
+        self.conflicts = 0
+        self.closest = math.inf
+        self.reset()
+
+    def reset(self):
+        """Start the run totals over."""
+        self.ticks = 0
+        self.conflict_ticks = 0
+        self.adjusted = 0
+        self.closest_ever = math.inf
+
+    def adjust(self, positions, velocities):
+        """(N, 3) velocities with every close pair's closing speed removed."""
+        velocities = np.array(velocities, dtype=float)
+        i, j, distance = self.grid.build(positions).pairs(self.radius)
+        self.ticks += 1
+        self.pairs = len(i)
+        self.conflicts = int(np.count_nonzero(distance < self.minimum))
+        self.closest = float(distance.min()) if len(i) else math.inf
+        self.closest_ever = min(self.closest_ever, self.closest)
+        self.conflict_ticks += bool(self.conflicts)
+        if not len(i) or not self.enabled:
+            return velocities
+
+        delta = positions[i] - positions[j]
+        stacked = distance < 1e-6
+        if stacked.any():
+            # No line between them: split horizontally along the golden angle
+            angle = np.nonzero(stacked)[0] * 2.399963
+            delta[stacked] = np.column_stack((np.cos(angle), np.sin(angle), np.zeros(len(angle))))
+            distance = np.where(stacked, 1.0, distance)
+        unit = delta / distance[:, None]
+
+        weight = np.clip((self.radius - distance) / (self.radius - self.minimum), 0.0, 1.0)
+        # Positive when the pair is opening; only closing speed is cancelled
+        opening = np.einsum("ij,ij->i", velocities[i] - velocities[j], unit)
+        closing = -np.minimum(opening, 0.0)
+        share = 0.5 * weight * (self.speed * weight + closing)
+        # Each vehicle's right when heading at the other; the same vector
+        # for i and, negated, for j, so both turn right and slide past
+        side = 0.5 * weight * closing * PASS_RIGHT
+        right = np.column_stack((unit[:, 1], -unit[:, 0], np.zeros(len(unit))))
+        count = len(velocities)
+        for axis in range(3):
+            push = share * unit[:, axis] + side * right[:, axis]
+            velocities[:, axis] += (np.bincount(i, push, count) - np.bincount(j, push, count))
+        self.adjusted += int(np.count_nonzero(share))
+        return limit_velocities(velocities, self.limits)
+
+    def summary(self):
+        closest = "-" if math.isinf(self.closest_ever) else f"{self.closest_ever:.2f} m"
+        return (f"deconfliction: {self.ticks} ticks, {self.conflict_ticks} with a pair inside "
+                f"{self.minimum} m, {self.adjusted} pair adjustments, closest pair {closest}")
+
+
+# ----------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------
+
+def bench_fleet(count, seed=0):
+    """Random fleet at BENCH_DENSITY in a 20 m thick layer."""
+    side = math.sqrt(count / BENCH_DENSITY * 1000.0)
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform((0.0, 0.0, -30.0), (side, side, -10.0), (count, 3))
+    return positions, rng.normal(0.0, 1.0, (count, 3))
+
+
+def _mean_us(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def bench_tick(count, rounds=200, brute_force=True):
+    """Mean microseconds for grid query, deconflicted tick and O(N^2) query."""
+    positions, velocities = bench_fleet(count)
+    grid = SpatialGrid(SEPARATION_RADIUS)
+    deconflictor = Deconflictor(limits=(5.0, 2.5, 1.5))
+    result = {
+        "grid_us": _mean_us(lambda: grid.build(positions).pairs(), rounds),
+        "tick_us": _mean_us(lambda: deconflictor.adjust(positions, velocities), rounds),
+        "pairs": deconflictor.pairs,
+    }
+    if brute_force and count <= BRUTE_FORCE_MAX:
+        result["brute_us"] = _mean_us(lambda: brute_force_pairs(positions, SEPARATION_RADIUS),
+                                      max(1, rounds // 10))
+    return result
+
+
+def run_bench():
+    # The grid must find exactly the pairs the O(N^2) check finds
+    positions, _ = bench_fleet(500, seed=1)
+    grid_pairs = set(zip(*(a.tolist() for a in SpatialGrid(SEPARATION_RADIUS).build(positions).pairs()[:2])))
+    brute_pairs = set(zip(*(a.tolist() for a in brute_force_pairs(positions, SEPARATION_RADIUS)[:2])))
+    print(f"{'✓' if grid_pairs == brute_pairs else '✗'} grid matches O(N^2) check "
+          f"({len(grid_pairs)} pairs in a fleet of 500)")
+
+    period_us = 1e6 / SETPOINT_RATE
+    print(f"{'vehicles':>8} {'pairs':>6} {'grid us':>9} {'tick us':>9} {'O(N^2) us':>10} "
+          f"{'tick % of ' + str(SETPOINT_RATE) + ' Hz':>16}")
+    for count in BENCH_SIZES:
+        r = bench_tick(count)
+        brute = f"{r['brute_us']:>10.0f}" if "brute_us" in r else f"{'-':>10}"
+        print(f"{count:>8} {r['pairs']:>6} {r['grid_us']:>9.0f} {r['tick_us']:>9.0f} {brute} "
+              f"{100 * r['tick_us'] / period_us:>15.2f}%")
+
+
+# ----------------------------------------------------------------------
+# Crossing demo: a ring whose slots swap sides through the centre
+# ----------------------------------------------------------------------
+
+async def fly(args):
+    swarm = Swarm.from_ports(args.count, args.base_port, args.port_step, verbose=args.verbose)
+    print(f"Connecting to {len(swarm)} vehicles...")
+    missing = await swarm.connect(timeout=args.timeout)
+    if missing:
+        print(f"No heartbeat from: {', '.join(missing)}")
+    if not len(swarm):
+        print("No vehicles connected. Exiting.")
+        return
+    try:
+        await swarm.apply_profile(verify=False)
+        if args.takeoff:
+            print(f"GUIDED + arm + takeoff to {args.takeoff}m...")
+            await swarm.set_mode("GUIDED")
+            await swarm.arm()
+            await swarm.takeoff(args.takeoff)
+            if not await wait_altitude(swarm, args.takeoff):
+                print("✗ Not every vehicle reached the takeoff altitude")
+
+        altitude = args.takeoff or args.alt
+        ring = Formation(len(swarm), "ring", args.spacing)
+        ring.place((0.0, 0.0, -altitude))
+        deconflictor = Deconflictor(args.radius, args.minimum)
+        deconflictor.enabled = not args.no_deconflict
+        positions = np.empty((len(swarm), 3))
+        offsets = spawn_offsets(len(swarm))
+
+        def velocities(swarm, t):
+            # Out to the ring, then every slot to the opposite side
+            if t > args.duration / 2 and ring.heading == 0.0:
+                ring.place(ring.center, heading=180.0)
+                deconflictor.reset()
+            fleet_positions(swarm.vehicles, out=positions)
+            positions[:] += offsets
+            return deconflictor.adjust(positions, ring.step(positions)).tolist()
+
+        mode = "off" if args.no_deconflict else f"radius {args.radius} m, minimum {args.minimum} m"
+        print(f"Ring of {len(swarm)} swaps sides at t={args.duration / 2:.0f}s; deconfliction {mode}")
+        task = await swarm.stream_velocities(velocities, args.duration, args.rate)
+        print(f"✓ {task.runs} ticks at {args.rate} Hz; slot error mean "
+              f"{ring.errors(positions).mean():.2f} m")
+        print(f"After the swap: {deconflictor.summary()}")
+        if args.rtl:
+            print("Returning fleet to launch...")
+            await swarm.set_mode("RTL")
+    finally:
+        swarm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inter-drone separation with a spatial grid")
+    parser.add_argument("--count", type=int, default=8)
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--port-step", type=int, default=PORT_STEP)
+    parser.add_argument("--timeout", type=float, default=30, help="heartbeat timeout (s)")
+    parser.add_argument("--takeoff", type=float, help="GUIDED, arm and take off to this altitude first")
+    parser.add_argument("--alt", type=float, default=10, help="ring altitude when not taking off")
+    parser.add_argument("--spacing", type=float, default=8.0, help="ring spacing (m)")
+    parser.add_argument("--radius", type=float, default=SEPARATION_RADIUS)
+    parser.add_argument("--minimum", type=float, default=MIN_SEPARATION)
+    parser.add_argument("--no-deconflict", action="store_true",
+                        help="only measure separation, do not adjust setpoints")
+    parser.add_argument("--rate", type=float, default=SETPOINT_RATE, help="setpoint rate (Hz)")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--rtl", action="store_true", help="RTL at the end")
+    parser.add_argument("--bench", action="store_true", help="time the grid and tick and exit")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_bench()
+        return
+    try:
+        asyncio.run(fly(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Send-on-change setpoint streams
+Control loops call update() every tick, but a frame only goes out when the
+setpoint changed or when the keepalive interval has passed. ArduPilot drops
+RC override after RC_OVERRIDE_TIME (3 s by default) and stops GUIDED velocity
+control after 3 s without a target, so the default 1 s keepalive keeps both
+alive while identical values stop flooding a shared radio link.
+"""
+
+import time
+
+# Seconds between repeats of an unchanged setpoint
+KEEPALIVE = 1.0
+
+
+class SetpointStream:
+    """Coalesces repeated setpoints sent through a fast_encode.FrameEncoder."""
+
+    def __init__(self, encoder, keepalive=KEEPALIVE, name=None, clock=time.monotonic):
+        self.encoder = encoder
+        self.keepalive = keepalive
+        self.name = name or encoder.msgname
+        self.clock = clock
+        self.last_values = None
+        self.last_send = -float('inf')
+
+        self.updates = 0
+        self.messages_sent = 0
+        self.keepalives_sent = 0
+        self.bytes_sent = 0
+
+    def update(self, *values):
+        """Offer the current setpoint; returns True if a frame was sent."""
+        self.updates += 1
+        now = self.clock()
+        if values != self.last_values:
+            self.last_values = values
+        elif now - self.last_send < self.keepalive:
+            return False
+        else:
+            self.keepalives_sent += 1
+        self._send(values, now)
+        return True
+
+    def force(self):
+        """Resend the last setpoint immediately (e.g. after a mode change)."""
+        if self.last_values is not None:
+            self._send(self.last_values, self.clock())
+
+    def _send(self, values, now):
+        self.encoder.send(*values)
+        self.last_send = now
+        self.messages_sent += 1
+        self.bytes_sent += self.encoder.last_len
+
+    @property
+    def messages_saved(self):
+        return self.updates - self.messages_sent
+
+    @property
+    def bytes_saved(self):
+        """Estimated from the average frame size actually sent."""
+        if not self.messages_sent:
+            return 0
+        return int(self.messages_saved * self.bytes_sent / self.messages_sent)
+
+    def report(self):
+        return {
+            "name": self.name,
+            "updates": self.updates,
+            "messages_sent": self.messages_sent,
+            "keepalives_sent": self.keepalives_sent,
+            "messages_saved": self.messages_saved,
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.bytes_saved,
+            "saved_pct": 100.0 * self.messages_saved / self.updates if self.updates else 0.0,
+        }
+
+    def summary(self):
+        r = self.report()
+        return (f"{r['name']}: sent {r['messages_sent']}/{r['updates']} "
+                f"({r['keepalives_sent']} keepalives), saved {r['messages_saved']} msgs / "
+                f"{r['bytes_saved']} bytes ({r['saved_pct']:.0f}%)")
@@ -12,13 +12,23 @@ Controls (hold keys down):
   K - Decrease throttle (descend)
   Space - Stop all movement
   ESC - Exit
+
+Key events go through input_pipeline.py: a press or release is sent at once,
+and speeds ramp up and down with an expo curve instead of jumping.
 """
 
 import sys
-import time
 import threading
 from pymavlink import mavutil
 
+from command_dispatcher import command_accepted
+from fast_encode import heartbeat_encoder, position_target_encoder
+from input_pipeline import Axis, InputPipeline
+from scheduler import RateScheduler
+from setpoint_stream import SetpointStream
+from stream_profiles import apply_profile
+from vehicle_state import VehicleState
+
 try:
     from pynput import keyboard
 except ImportError:
@@ -30,11 +40,21 @@ except ImportError:
 # Connection
 CONNECTION_STRING = "udp:127.0.0.1:14551"
 
+# Loop rates (Hz)
+CONTROL_RATE = 10
+HEARTBEAT_RATE = 1
+STATUS_RATE = 5
+
+# Speed ramp (full speed per second) and expo of the key response
+SPEED_RAMP = 2.0
+SPEED_EXPO = 0.3
+
 class SimpleController:
-    def __init__(self):
+    def __init__(self, rate=CONTROL_RATE):
         self.vehicle = None
+        self.rate = rate
+        self.state = VehicleState()
         self.running = True
-        self.keys = set()
         
         # Current velocities (m/s)
         self.vx = 0.0  # Forward/backward
@@ -44,104 +64,101 @@ class SimpleController:
         
         self.throttle = 0.5  # 0 to 1
         self.max_speed = 2.0  # m/s
+        self.climb_speed = 1.0  # m/s
+        
+        # Held keys -> axes (I climbs: negative is up in NED)
+        self.pipeline = InputPipeline({
+            "forward": Axis("s", "w", ramp=SPEED_RAMP, expo=SPEED_EXPO),
+            "right": Axis("a", "d", ramp=SPEED_RAMP, expo=SPEED_EXPO),
+            "down": Axis("i", "k", ramp=SPEED_RAMP, expo=SPEED_EXPO),
+        }, self.apply_axes, actions={"t": self.start_takeoff, "space": self.stop_moving,
+                                     "esc": self.stop})
+        # Key events wake the control loop from its sleep and are sent at once
+        self.scheduler = RateScheduler(sleep=self.pipeline.wait)
         
     def connect(self):
         print(f"Connecting to {CONNECTION_STRING}...")
         self.vehicle = mavutil.mavlink_connection(CONNECTION_STRING)
         self.vehicle.wait_heartbeat()
         print(f"✓ Connected to system {self.vehicle.target_system}")
+        apply_profile(self.vehicle, "manual")
+        # Pre-packed frames for the per-tick messages
+        self.velocity_encoder = position_target_encoder(self.vehicle)
+        self.heartbeat_encoder = heartbeat_encoder(self.vehicle)
+        # Velocity only goes out on change, plus a keepalive
+        self.velocity_stream = SetpointStream(self.velocity_encoder, name="velocity")
         
     def arm_and_takeoff(self, target_alt=3):
         """Simple arm and takeoff."""
+        # The control loop reads the connection; these calls wait on its ACKs
         print("\nArming...")
-        self.vehicle.mav.command_long_send(
-            self.vehicle.target_system, self.vehicle.target_component,
-            mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
-            0, 1, 0, 0, 0, 0, 0, 0)
-        time.sleep(2)
+        if not command_accepted(self.vehicle, mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                                1, read=False):
+            print("✗ Arming rejected")
+            return
         print("✓ Armed")
         
         print(f"\nTaking off to {target_alt}m...")
         # Set GUIDED mode
         mode_id = self.vehicle.mode_mapping()['GUIDED']
-        self.vehicle.set_mode(mode_id)
-        time.sleep(1)
+        if not command_accepted(self.vehicle, mavutil.mavlink.MAV_CMD_DO_SET_MODE,
+                                mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED, mode_id,
+                                read=False):
+            print("✗ GUIDED mode rejected")
+            return
         
         # Takeoff command
-        self.vehicle.mav.command_long_send(
-            self.vehicle.target_system, self.vehicle.target_component,
-            mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
-            0, 0, 0, 0, 0, 0, 0, target_alt)
+        if not command_accepted(self.vehicle, mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
+                                0, 0, 0, 0, 0, 0, target_alt, read=False):
+            print("✗ Takeoff rejected")
+            return
         
-        print("✓ Takeoff command sent")
+        print("✓ Takeoff command accepted")
         print(f"Climbing to {target_alt}m (wait 15-20 seconds)...")
         
     def send_velocity(self):
-        """Send velocity command."""
-        self.vehicle.mav.send(
-            mavutil.mavlink.MAVLink_set_position_target_local_ned_message(
-                10, self.vehicle.target_system, self.vehicle.target_component,
-                mavutil.mavlink.MAV_FRAME_LOCAL_NED,
-                0b0000111111000111,  # Use velocity
-                0, 0, 0,  # Position (not used)
-                self.vx, self.vy, self.vz,  # Velocity
-                0, 0, 0,  # Acceleration (not used)
-                0, 0))  # Yaw, yaw rate
-                
-    def update_velocity(self):
-        """Update velocities based on held keys."""
-        # Reset velocities
-        self.vx = 0
-        self.vy = 0
-        self.vz = 0
-        
-        # Forward/backward
-        if 'w' in self.keys:
-            self.vx = self.max_speed
-        if 's' in self.keys:
-            self.vx = -self.max_speed
-            
-        # Left/right
-        if 'a' in self.keys:
-            self.vy = -self.max_speed
-        if 'd' in self.keys:
-            self.vy = self.max_speed
-            
-        # Up/down
-        if 'i' in self.keys:
-            self.vz = -1.0  # Negative is up in NED
-        if 'k' in self.keys:
-            self.vz = 1.0  # Positive is down in NED
-            
-    def on_press(self, key):
-        try:
-            if hasattr(key, 'char') and key.char:
-                c = key.char.lower()
-                self.keys.add(c)
-                
-                # Special commands
-                if c == 't':
-                    threading.Thread(target=lambda: self.arm_and_takeoff(5), daemon=True).start()
-                    
-            elif key == keyboard.Key.space:
-                self.vx = self.vy = self.vz = 0
-                self.keys.clear()
-                print("\n⏸  Stopped")
-                
-            elif key == keyboard.Key.esc:
-                print("\nExiting...")
-                self.running = False
-                return False
+        """Send velocity command (SET_POSITION_TARGET_LOCAL_NED, velocity only)."""
+        return self.velocity_stream.update(
+            10,  # time_boot_ms (not used)
+            0, 0, 0,  # Position (not used)
+            self.vx, self.vy, self.vz,  # Velocity
+            0, 0, 0,  # Acceleration (not used)
+            0, 0)  # Yaw, yaw rate
                 
-        except AttributeError:
-            pass
-            
-    def on_release(self, key):
-        try:
-            if hasattr(key, 'char') and key.char:
-                self.keys.discard(key.char.lower())
-        except AttributeError:
-            pass
+    def send_heartbeat(self):
+        """Send GCS heartbeat."""
+        self.heartbeat_encoder.send()
+        
+    def control_tick(self):
+        """One control period: read telemetry, update and send velocity."""
+        if not self.running:
+            self.scheduler.stop()
+            return
+        # Fold in whatever telemetry arrived since the last tick
+        self.state.pump(self.vehicle)
+        self.pipeline.tick()
+        
+    def show_status(self):
+        print(f"\r🎮 Vx:{self.vx:+.1f} Vy:{self.vy:+.1f} Vz:{self.vz:+.1f} m/s  "
+              f"Alt:{self.state.altitude:5.1f}m {self.state.mode:<9}", end='', flush=True)
+        
+    def apply_axes(self, axes):
+        """Turn the pipeline's axis outputs into velocities and send them."""
+        self.vx = axes["forward"] * self.max_speed
+        self.vy = axes["right"] * self.max_speed
+        self.vz = axes["down"] * self.climb_speed
+        return self.send_velocity()
+        
+    def start_takeoff(self):
+        threading.Thread(target=lambda: self.arm_and_takeoff(5), daemon=True).start()
+        
+    def stop_moving(self):
+        self.pipeline.centre()
+        print("\n⏸  Stopped")
+        
+    def stop(self):
+        print("\nExiting...")
+        self.running = False
             
     def run(self):
         self.connect()
@@ -162,31 +179,25 @@ class SimpleController:
         print("\n⚠️  Press 'T' to arm and takeoff first!")
         print()
         
-        # Start keyboard listener
-        listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
+        # Start keyboard listener (it only queues events for the control loop)
+        listener = keyboard.Listener(on_press=self.pipeline.on_press,
+                                     on_release=self.pipeline.on_release)
         listener.start()
         
-        # Control loop
-        last_heartbeat = time.time()
-        while self.running:
-            # Update and send velocity
-            self.update_velocity()
-            self.send_velocity()
-            
-            # Send heartbeat
-            if time.time() - last_heartbeat > 1.0:
-                self.vehicle.mav.heartbeat_send(
-                    mavutil.mavlink.MAV_TYPE_GCS,
-                    mavutil.mavlink.MAV_AUTOPILOT_INVALID,
-                    0, 0, 0)
-                last_heartbeat = time.time()
-            
-            # Display status
-            print(f"\r🎮 Vx:{self.vx:+.1f} Vy:{self.vy:+.1f} Vz:{self.vz:+.1f} m/s  ", end='', flush=True)
-            
-            time.sleep(0.1)
+        # Control loop: velocity at the control rate, heartbeat and status slower
+        self.scheduler.add_task(self.control_tick, self.rate, "control")
+        self.scheduler.add_task(self.send_heartbeat, HEARTBEAT_RATE, "heartbeat")
+        self.scheduler.add_task(self.show_status, STATUS_RATE, "status")
+        try:
+            self.scheduler.run()
+        except KeyboardInterrupt:
+            print("\n\nInterrupted")
             
         listener.stop()
+        print("\n")
+        self.scheduler.print_report()
+        print(self.velocity_stream.summary())
+        print(self.pipeline.summary())
         print("\n✓ Done\n")
 
 if __name__ == "__main__":
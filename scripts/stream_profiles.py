@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Telemetry stream profiles
+Each profile names exactly the messages a script reads and the rate it needs
+them at. Applying a profile first stops every legacy data stream
+(REQUEST_DATA_STREAM, rate 0) and then requests each message with
+MAV_CMD_SET_MESSAGE_INTERVAL, so the link only carries what is decoded.
+
+Rates are requested in vehicle time. They are verified by counting what
+actually arrives, measured against the vehicle's time_boot_ms so the check
+holds at any SIM_SPEEDUP.
+
+MAVProxy re-requests its own stream rates on the vehicle link; start it with
+--streamrate=-1 when the scripts manage rates themselves.
+
+Usage:
+  python3 stream_profiles.py --list
+  python3 stream_profiles.py --profile diagnostic --connection udp:127.0.0.1:14551
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from pymavlink import mavutil
+
+from command_dispatcher import dispatcher_for
+
+# Message type -> rate (Hz). HEARTBEAT is always sent at 1 Hz by ArduPilot.
+PROFILES = {
+    # control_drone.py: position waits, altitude, readiness checks
+    "mission": {
+        "LOCAL_POSITION_NED": 10,
+        "GLOBAL_POSITION_INT": 2,
+        "VFR_HUD": 4,
+        "GPS_RAW_INT": 2,
+        "EKF_STATUS_REPORT": 2,
+    },
+    # wasd_control.py / simple_control.py: status line and attitude feel
+    "manual": {
+        "VFR_HUD": 10,
+        "ATTITUDE": 10,
+        "LOCAL_POSITION_NED": 5,
+    },
+    # diagnostic_rc.py / test_motors.py: motor outputs at a high rate
+    "diagnostic": {
+        "SERVO_OUTPUT_RAW": 50,
+        "RC_CHANNELS": 10,
+        "ATTITUDE": 10,
+        "VFR_HUD": 5,
+        "SYS_STATUS": 2,
+    },
+    # mission.py: AUTO progress and readiness; MISSION_ITEM_REACHED is an event
+    "auto": {
+        "MISSION_CURRENT": 1,
+        "GLOBAL_POSITION_INT": 2,
+        "EKF_STATUS_REPORT": 1,
+    },
+    # swarm.py members: just enough for state, waits and formation keeping
+    "minimal-swarm": {
+        "LOCAL_POSITION_NED": 4,
+        "GLOBAL_POSITION_INT": 1,
+        "EKF_STATUS_REPORT": 1,
+    },
+    # assignment.py: positions for the costs, battery for feasibility
+    "intercept": {
+        "LOCAL_POSITION_NED": 10,
+        "GLOBAL_POSITION_INT": 1,
+        "SYS_STATUS": 1,
+        "EKF_STATUS_REPORT": 1,
+    },
+}
+
+# Measured rate must be within this fraction of the requested rate
+RATE_TOLERANCE = 0.3
+# Unrequested periodic messages above this rate (Hz) are reported as leaks
+LEAK_RATE = 0.2
+# Default measurement window (wall seconds)
+VERIFY_WINDOW = 3.0
+
+# Messages sent on events rather than as streams; never counted as leaks
+EVENT_TYPES = {
+    "HEARTBEAT", "COMMAND_ACK", "STATUSTEXT", "PARAM_VALUE", "TIMESYNC",
+    "MISSION_ACK", "MISSION_COUNT", "MISSION_REQUEST", "MISSION_REQUEST_INT",
+    "MISSION_ITEM_INT", "MISSION_ITEM_REACHED", "AUTOPILOT_VERSION", "BAD_DATA",
+}
+
+
+def message_id(mtype):
+    return getattr(mavutil.mavlink, f"MAVLINK_MSG_ID_{mtype}")
+
+
+def interval_us(rate):
+    """SET_MESSAGE_INTERVAL param2: microseconds, or -1 to disable."""
+    return int(1e6 / rate) if rate > 0 else -1
+
+
+class RateMeter:
+    """Counts arrivals per type and converts them to rates in vehicle time."""
+
+    def __init__(self, sysid=None):
+        self.sysid = sysid
+        self.counts = Counter()
+        self.first_boot_ms = None
+        self.last_boot_ms = None
+        self.started = time.monotonic()
+
+    def observe(self, msg):
+        if self.sysid is not None and msg.get_srcSystem() != self.sysid:
+            return
+        self.counts[msg.get_type()] += 1
+        boot_ms = getattr(msg, "time_boot_ms", None)
+        if boot_ms:
+            if self.first_boot_ms is None:
+                self.first_boot_ms = boot_ms
+            self.last_boot_ms = boot_ms
+
+    @property
+    def span(self):
+        """Seconds of vehicle time covered (wall time if no time_boot_ms arrived)."""
+        if self.first_boot_ms is not None and self.last_boot_ms > self.first_boot_ms:
+            return (self.last_boot_ms - self.first_boot_ms) / 1000.0
+        return time.monotonic() - self.started
+
+    def rates(self):
+        span = max(self.span, 1e-3)
+        return {mtype: n / span for mtype, n in self.counts.items()}
+
+
+def check_rates(profile, rates, tolerance=RATE_TOLERANCE):
+    """Compare measured rates with a profile.
+
+    Returns {type: (requested, measured, ok)} and {leaked type: rate}.
+    """
+    wanted = PROFILES[profile] if isinstance(profile, str) else profile
+    report = {}
+    for mtype, rate in wanted.items():
+        measured = rates.get(mtype, 0.0)
+        report[mtype] = (rate, measured, abs(measured - rate) <= tolerance * rate)
+    leaks = {mtype: rate for mtype, rate in rates.items()
+             if mtype not in wanted and mtype not in EVENT_TYPES and rate >= LEAK_RATE}
+    return report, leaks
+
+
+def print_check(profile, report, leaks):
+    name = profile if isinstance(profile, str) else "custom"
+    print(f"Stream profile '{name}':")
+    for mtype, (rate, measured, ok) in report.items():
+        print(f"  {'✓' if ok else '✗'} {mtype:<22} {rate:>6.1f} Hz requested, {measured:>6.1f} Hz measured")
+    for mtype, rate in sorted(leaks.items()):
+        print(f"  ! {mtype:<22} {rate:>6.1f} Hz not requested")
+
+
+# ----------------------------------------------------------------------
+# Blocking (mavutil) connections
+# ----------------------------------------------------------------------
+
+def _command(vehicle, command, params, timeout=1.0, retries=1):
+    """COMMAND_LONG and its ACK; returns the MAV_RESULT or None."""
+    ack = dispatcher_for(vehicle).command(command, *params, timeout=timeout, retries=retries)
+    return ack.result if ack is not None else None
+
+
+def apply_profile(vehicle, profile, verify=True, window=VERIFY_WINDOW):
+    """Switch a mavutil connection to a profile; returns True if it checks out."""
+    wanted = PROFILES[profile] if isinstance(profile, str) else profile
+    vehicle.mav.request_data_stream_send(vehicle.target_system, vehicle.target_component,
+                                         mavutil.mavlink.MAV_DATA_STREAM_ALL, 0, 0)
+    ok = True
+    for mtype, rate in wanted.items():
+        result = _command(vehicle, mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+                          (message_id(mtype), interval_us(rate)))
+        if result != mavutil.mavlink.MAV_RESULT_ACCEPTED:
+            print(f"  {mtype}: interval request {'timed out' if result is None else 'rejected'}")
+            ok = False
+    if not verify:
+        return ok
+    meter = RateMeter(vehicle.target_system)
+    end = time.monotonic() + window
+    while time.monotonic() < end:
+        msg = vehicle.recv_match(blocking=True, timeout=end - time.monotonic())
+        if msg is not None:
+            meter.observe(msg)
+    report, leaks = check_rates(profile, meter.rates())
+    print_check(profile, report, leaks)
+    return ok and all(entry[2] for entry in report.values())
+
+
+# ----------------------------------------------------------------------
+# Asyncio (mav_link.MavLink) connections
+# ----------------------------------------------------------------------
+
+async def apply_profile_async(link, profile, verify=True, window=VERIFY_WINDOW):
+    """apply_profile() for a MavLink; returns (accepted, report, leaks)."""
+    wanted = PROFILES[profile] if isinstance(profile, str) else profile
+    link.mav.request_data_stream_send(link.target_system, link.target_component,
+                                      mavutil.mavlink.MAV_DATA_STREAM_ALL, 0, 0)
+    accepted = True
+    for mtype, rate in wanted.items():
+        ack = await link.command_long(mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+                                      message_id(mtype), interval_us(rate), timeout=1)
+        if not ack or ack.result != mavutil.mavlink.MAV_RESULT_ACCEPTED:
+            link.log(f"{mtype}: interval request {'timed out' if ack is None else 'rejected'}")
+            accepted = False
+    if not verify:
+        return accepted, {}, {}
+    meter = RateMeter(link.target_system)
+    link.subscribe(meter.observe)
+    try:
+        await asyncio.sleep(window)
+    finally:
+        link.unsubscribe(meter.observe)
+    report, leaks = check_rates(profile, meter.rates())
+    return accepted, report, leaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply and verify a telemetry stream profile")
+    parser.add_argument("--connection", default="udp:127.0.0.1:14550")
+    parser.add_argument("--profile", default="mission", choices=sorted(PROFILES))
+    parser.add_argument("--window", type=float, default=VERIFY_WINDOW,
+                        help="seconds to measure arrival rates")
+    parser.add_argument("--list", action="store_true", help="print the profiles and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, rates in PROFILES.items():
+            print(f"{name}: " + ", ".join(f"{m} {r:g} Hz" for m, r in rates.items()))
+        return
+
+    vehicle = mavutil.mavlink_connection(args.connection)
+    print(f"Connecting to {args.connection}...")
+    vehicle.wait_heartbeat()
+    print(f"✓ Connected to system {vehicle.target_system}")
+    if apply_profile(vehicle, args.profile, window=args.window):
+        print("✓ Profile active")
+    else:
+        print("✗ Profile not fully applied")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Swarm controller for AirSim + ArduPilot SITL
+Opens one MAVLink connection per vehicle (SITL instance or system ID) and
+services all of them from a single asyncio event loop.
+
+Fleet commands (arm, mode, takeoff, velocity setpoints) are broadcast
+concurrently or targeted at a subset of vehicles; each vehicle reports
+message throughput, packet loss and command round-trip latency (see
+link_monitor.py).
+
+Usage:
+  python3 swarm.py --base-port 14550 --count 4
+  python3 swarm.py --connections udp:127.0.0.1:14550,udp:127.0.0.1:14560 --takeoff 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from mav_link import MavLink
+from fast_encode import TYPE_MASK_POSITION, TYPE_MASK_TRAJECTORY, encoder_for
+from link_monitor import LinkMonitor, write_snapshot
+from scheduler import RateScheduler
+from setpoint_stream import SetpointStream
+from stream_profiles import apply_profile_async
+from vehicle_state import VehicleState
+
+# Default port layout: one MAVProxy/SITL output per vehicle, 10 ports apart
+BASE_PORT = 14550
+PORT_STEP = 10
+
+# Setpoint stream rate (Hz) used when none is given
+SETPOINT_RATE = 20
+
+# Lean telemetry for fleet members (see stream_profiles.py)
+STREAM_PROFILE = "minimal-swarm"
+
+
+class SwarmVehicle:
+    """One fleet member: its link, live state and traffic counters."""
+
+    def __init__(self, link):
+        self.link = link
+        self.state = VehicleState(sysid=link.sysid).attach(link)
+        self.monitor = LinkMonitor(link.conn, link.name)
+        self._velocity_stream = None
+        self._position_stream = None
+        self._trajectory_stream = None
+        self._last_report = (time.monotonic(), 0, 0)
+
+    @property
+    def name(self):
+        return self.link.name
+
+    @property
+    def velocity_stream(self):
+        """Send-on-change velocity setpoints (created after the heartbeat)."""
+        if self._velocity_stream is None:
+            self._velocity_stream = SetpointStream(
+                encoder_for(self.link.conn, "position_target"), name="velocity")
+        return self._velocity_stream
+
+    @property
+    def position_stream(self):
+        """Send-on-change position targets (created after the heartbeat)."""
+        if self._position_stream is None:
+            self._position_stream = SetpointStream(
+                encoder_for(self.link.conn, "position_target", type_mask=TYPE_MASK_POSITION),
+                name="position")
+        return self._position_stream
+
+    @property
+    def trajectory_stream(self):
+        """Send-on-change position + velocity + acceleration targets."""
+        if self._trajectory_stream is None:
+            self._trajectory_stream = SetpointStream(
+                encoder_for(self.link.conn, "position_target", type_mask=TYPE_MASK_TRAJECTORY),
+                name="trajectory")
+        return self._trajectory_stream
+
+    def report(self):
+        """Throughput since the previous report plus latency figures."""
+        now = time.monotonic()
+        mav = self.link.mav
+        then, msgs, nbytes = self._last_report
+        elapsed = max(now - then, 1e-6)
+        received = self.link.messages_received
+        total_bytes = mav.total_bytes_received
+        self._last_report = (now, received, total_bytes)
+
+        rtts = self.link.command_rtts
+        last = self.link.last_message_time
+        stream = self._velocity_stream
+        timesync = self.monitor.timesync_rtt.merged()
+        return {
+            "name": self.name,
+            "sysid": self.link.target_system,
+            "msgs_per_s": (received - msgs) / elapsed,
+            "bytes_per_s": (total_bytes - nbytes) / elapsed,
+            "setpoints_sent": stream.messages_sent if stream else 0,
+            "setpoints_saved": stream.messages_saved if stream else 0,
+            "setpoint_bytes_saved": stream.bytes_saved if stream else 0,
+            "bad_data": self.link.bad_data,
+            "loss_pct": self.monitor.loss_pct,
+            "timesync_rtt_ms": timesync.percentile(50) * 1000 if timesync.count else None,
+            "telemetry_age_ms": (now - last) * 1000 if last else None,
+            "command_rtt_ms": statistics.median(rtts) * 1000 if rtts else None,
+            "command_rtt_max_ms": max(rtts) * 1000 if rtts else None,
+        }
+
+
+class Swarm:
+    """Fleet of MavLink connections driven from one event loop."""
+
+    def __init__(self, connection_strings, sysids=None, verbose=False):
+        sysids = sysids or [None] * len(connection_strings)
+        self.vehicles = [
+            SwarmVehicle(MavLink(conn, name=f"v{i}", sysid=sysid, verbose=verbose))
+            for i, (conn, sysid) in enumerate(zip(connection_strings, sysids))
+        ]
+        self.tick_overruns = 0
+
+    @classmethod
+    def from_ports(cls, count, base_port=BASE_PORT, step=PORT_STEP, host="127.0.0.1", **kwargs):
+        return cls([f"udp:{host}:{base_port + i * step}" for i in range(count)], **kwargs)
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def select(self, targets=None):
+        """Vehicles matching the given indices or names (all if None)."""
+        if targets is None:
+            return self.vehicles
+        wanted = set(targets)
+        return [v for i, v in enumerate(self.vehicles) if i in wanted or v.name in wanted]
+
+    async def each(self, action, targets=None):
+        """Await action(link) on every selected vehicle at once.
+
+        Returns {name: result}; an exception is returned as that vehicle's
+        result instead of being raised.
+        """
+        vehicles = self.select(targets)
+        results = await asyncio.gather(*(action(v.link) for v in vehicles),
+                                       return_exceptions=True)
+        return {v.name: r for v, r in zip(vehicles, results)}
+
+    # ------------------------------------------------------------------
+    # Fleet lifecycle
+    # ------------------------------------------------------------------
+
+    async def connect(self, timeout=30):
+        """Start every reader and wait for heartbeats; silent vehicles are dropped."""
+        for v in self.vehicles:
+            v.link.start()
+        results = await self.each(lambda link: link.wait_heartbeat(timeout))
+        missing = [name for name, msg in results.items() if not msg or isinstance(msg, Exception)]
+        for v in [v for v in self.vehicles if v.name in missing]:
+            v.link.close()
+        self.vehicles = [v for v in self.vehicles if v.name not in missing]
+        return missing
+
+    async def apply_profile(self, profile=STREAM_PROFILE, targets=None, verify=True):
+        """Apply a stream profile fleet-wide; returns {name: (accepted, report, leaks)}."""
+        return await self.each(lambda link: apply_profile_async(link, profile, verify), targets)
+
+    def close(self):
+        for v in self.vehicles:
+            v.link.close()
+
+    # ------------------------------------------------------------------
+    # Fleet commands (broadcast when targets is None)
+    # ------------------------------------------------------------------
+
+    async def set_mode(self, mode, targets=None):
+        return await self.each(lambda link: link.set_mode(mode), targets)
+
+    async def arm(self, targets=None):
+        return await self.each(lambda link: link.arm_vehicle(), targets)
+
+    async def disarm(self, targets=None):
+        return await self.each(lambda link: link.disarm_vehicle(), targets)
+
+    async def takeoff(self, altitude, targets=None):
+        return await self.each(lambda link: link.takeoff(altitude), targets)
+
+    def goto_position_ned(self, positions):
+        """Send one position target per vehicle: {index or name: (n, e, d)}."""
+        for key, (north, east, down) in positions.items():
+            for v in self.select([key]):
+                v.link.goto_position_ned(north, east, down)
+
+    def send_velocities(self, velocities, targets=None):
+        """Offer one velocity setpoint per selected vehicle, in order.
+
+        Unchanged setpoints are only resent at the keepalive interval.
+        """
+        for v, (vx, vy, vz) in zip(self.select(targets), velocities):
+            v.velocity_stream.update(10, 0, 0, 0, vx, vy, vz, 0, 0, 0, 0, 0)
+
+    def send_positions(self, positions, targets=None):
+        """Offer one (n, e, d) position target per selected vehicle, in order."""
+        for v, (north, east, down) in zip(self.select(targets), positions):
+            v.position_stream.update(10, north, east, down, 0, 0, 0, 0, 0, 0, 0, 0)
+
+    def send_trajectories(self, positions, velocities, accelerations, targets=None):
+        """Offer one (position, velocity, acceleration) NED trajectory sample per vehicle."""
+        for v, p, vel, acc in zip(self.select(targets), positions, velocities, accelerations):
+            v.trajectory_stream.update(10, *p, *vel, *acc, 0, 0)
+
+    async def stream_velocities(self, velocity_fn, duration, rate=SETPOINT_RATE, targets=None):
+        """Call velocity_fn(swarm, t) each tick and send its setpoints at rate Hz.
+
+        Returns the scheduler task, which holds period/jitter statistics.
+        """
+        scheduler = RateScheduler()
+        start = time.monotonic()
+
+        def tick():
+            self.send_velocities(velocity_fn(self, time.monotonic() - start), targets)
+
+        task = scheduler.add_task(tick, rate, "setpoints")
+        await scheduler.run_async(duration)
+        self.tick_overruns += task.overruns
+        return task
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def report(self):
+        return [v.report() for v in self.vehicles]
+
+    def print_report(self):
+        print(f"{'name':<6} {'sysid':>5} {'msg/s':>8} {'kB/s':>7} {'loss%':>6} {'setpts':>7} "
+              f"{'saved':>6} {'age ms':>7} {'rtt ms':>7} {'mode':<10} {'alt':>6}")
+        for v, row in zip(self.vehicles, self.report()):
+            age = row["telemetry_age_ms"]
+            rtt = row["command_rtt_ms"]
+            print(f"{row['name']:<6} {row['sysid']:>5} {row['msgs_per_s']:>8.1f} "
+                  f"{row['bytes_per_s'] / 1000:>7.2f} {row['loss_pct']:>6.1f} "
+                  f"{row['setpoints_sent']:>7} "
+                  f"{row['setpoints_saved']:>6} "
+                  f"{age if age is not None else float('nan'):>7.1f} "
+                  f"{rtt if rtt is not None else float('nan'):>7.1f} "
+                  f"{v.state.mode:<10} {v.state.altitude:>6.1f}")
+        if self.tick_overruns:
+            print(f"setpoint tick overruns: {self.tick_overruns}")
+
+
+async def run(args):
+    if args.connections:
+        swarm = Swarm(args.connections.split(","), verbose=args.verbose)
+    else:
+        swarm = Swarm.from_ports(args.count, args.base_port, args.port_step, verbose=args.verbose)
+
+    print(f"Connecting to {len(swarm)} vehicles...")
+    missing = await swarm.connect(timeout=args.timeout)
+    if missing:
+        print(f"No heartbeat from: {', '.join(missing)}")
+    if not len(swarm):
+        print("No vehicles connected. Exiting.")
+        return
+    print(f"✓ {len(swarm)} vehicles connected")
+
+    if args.profile != "none":
+        results = await swarm.apply_profile(args.profile)
+        bad = [name for name, r in results.items()
+               if isinstance(r, Exception) or not r[0] or not all(ok for _, _, ok in r[1].values())]
+        print(f"Stream profile '{args.profile}': {len(results) - len(bad)}/{len(results)} verified"
+              + (f" (check {', '.join(bad)})" if bad else ""))
+
+    recorder = None
+    if args.record:
+        from telemetry_recorder import TelemetryRecorder
+        recorder = TelemetryRecorder(args.record)
+        for v in swarm.vehicles:
+            recorder.attach(v.link)
+        print(f"Recording telemetry to {recorder.directory}")
+
+    try:
+        if args.takeoff:
+            print(f"\nGUIDED + arm + takeoff to {args.takeoff}m across the fleet...")
+            print(await swarm.set_mode("GUIDED"))
+            print(await swarm.arm())
+            print(await swarm.takeoff(args.takeoff))
+
+        end = time.monotonic() + args.duration
+        while time.monotonic() < end:
+            await asyncio.sleep(args.report_interval)
+            print()
+            swarm.print_report()
+            if args.metrics:
+                write_snapshot(args.metrics, [v.monitor for v in swarm.vehicles])
+
+        if args.rtl:
+            print("\nReturning fleet to launch...")
+            print(await swarm.set_mode("RTL"))
+    finally:
+        if recorder is not None:
+            recorder.close()
+        swarm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-vehicle MAVLink swarm controller")
+    parser.add_argument("--connections", help="comma-separated connection strings")
+    parser.add_argument("--count", type=int, default=1, help="number of vehicles (port layout)")
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--port-step", type=int, default=PORT_STEP)
+    parser.add_argument("--timeout", type=float, default=30, help="heartbeat timeout (s)")
+    parser.add_argument("--profile", default=STREAM_PROFILE,
+                        help="stream profile to apply on connect ('none' keeps vehicle defaults)")
+    parser.add_argument("--takeoff", type=float, help="take off to this altitude (m)")
+    parser.add_argument("--rtl", action="store_true", help="switch the fleet to RTL at the end")
+    parser.add_argument("--duration", type=float, default=30, help="monitoring time (s)")
+    parser.add_argument("--report-interval", type=float, default=5)
+    parser.add_argument("--record", metavar="DIR", help="record fleet telemetry to DIR")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write link health to PATH each report (JSON, or Prometheus for *.prom)")
+    parser.add_argument("--verbose", action="store_true", help="print per-vehicle helper output")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Compact binary telemetry recorder
+Writes selected MAVLink message types to per-type, fixed-width columnar files:
+
+  <log>/<MSG_TYPE>/meta.json     column names, dtypes and row count
+  <log>/<MSG_TYPE>/<field>.bin   one raw little-endian array per field
+  <log>/<MSG_TYPE>/_time.bin     receive time (float64, Unix seconds)
+  <log>/<MSG_TYPE>/_sysid.bin    source system ID (uint8)
+
+Rows are buffered and flushed in batches; reading back maps every column with
+numpy.memmap, so multi-hour, multi-vehicle logs load without parsing.
+
+Usage:
+  python3 telemetry_recorder.py record --connection udp:127.0.0.1:14550 --duration 60
+  python3 telemetry_recorder.py info telemetry_logs/20260101-120000
+  python3 telemetry_recorder.py bench
+"""
+
+import argparse
+import json
+import os
+import time
+from operator import attrgetter
+
+import numpy as np
+from pymavlink import mavutil
+from pymavlink.dialects.v10 import ardupilotmega as mavlink1
+from pymavlink.dialects.v20 import ardupilotmega as mavlink2
+
+DEFAULT_TYPES = (
+    "HEARTBEAT", "COMMAND_ACK", "VFR_HUD", "GPS_RAW_INT", "EKF_STATUS_REPORT", "SERVO_OUTPUT_RAW",
+    "LOCAL_POSITION_NED", "ATTITUDE", "GLOBAL_POSITION_INT",
+)
+LOG_ROOT = "telemetry_logs"
+
+# Rows buffered per type before a flush, and the longest a row may stay buffered
+BATCH_ROWS = 4096
+FLUSH_INTERVAL = 2.0
+
+TIME_COLUMN = "_time"
+SYSID_COLUMN = "_sysid"
+
+_DTYPES = {
+    "float": "<f4", "double": "<f8",
+    "int8_t": "<i1", "uint8_t": "<u1", "uint8_t_mavlink_version": "<u1",
+    "int16_t": "<i2", "uint16_t": "<u2", "int32_t": "<i4", "uint32_t": "<u4",
+    "int64_t": "<i8", "uint64_t": "<u8",
+}
+
+
+def message_schema(mtype):
+    """[(field, dtype)] of the scalar numeric fields of a message type (MAVLink 2 superset)."""
+    cls = mavlink2.mavlink_map[getattr(mavlink2, f"MAVLINK_MSG_ID_{mtype}")]
+    schema = []
+    for name, ftype, length in zip(cls.fieldnames, cls.fieldtypes, cls.array_lengths):
+        if length == 0 and ftype in _DTYPES:
+            schema.append((name, _DTYPES[ftype]))
+    return schema
+
+
+class _TypeWriter:
+    """Batch buffer and open column files for one message type."""
+
+    def __init__(self, directory, mtype):
+        self.directory = os.path.join(directory, mtype)
+        os.makedirs(self.directory, exist_ok=True)
+        self.mtype = mtype
+        self.schema = message_schema(mtype)
+        names = [name for name, _ in self.schema]
+        self.dtype = np.dtype([(TIME_COLUMN, "<f8"), (SYSID_COLUMN, "<u1")] + self.schema)
+
+        # MAVLink 1 messages lack extension fields; read those with a shorter getter
+        base = getattr(mavlink1, f"MAVLink_{mtype.lower()}_message").fieldnames
+        base_names = [n for n in names if n in base]
+        self.get_all = attrgetter(*names)
+        self.get_base = attrgetter(*base_names)
+        self.base_positions = [names.index(n) for n in base_names]
+        self.width = len(names)
+
+        self.rows = []
+        self.rows_written = 0
+        self.first_buffered = None
+        self.files = {name: open(os.path.join(self.directory, name + ".bin"), "ab")
+                      for name in self.dtype.names}
+        self._write_meta()
+
+    def add(self, msg):
+        try:
+            values = self.get_all(msg)
+        except AttributeError:
+            values = [0] * self.width
+            for i, v in zip(self.base_positions, self.get_base(msg)):
+                values[i] = v
+            values = tuple(values)
+        if self.width == 1:
+            values = (values,)
+        if not self.rows:
+            self.first_buffered = time.monotonic()
+        self.rows.append((msg._timestamp, msg.get_srcSystem()) + values)
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = np.array(self.rows, dtype=self.dtype)
+        for name in self.dtype.names:
+            f = self.files[name]
+            f.write(np.ascontiguousarray(table[name]).tobytes())
+            f.flush()
+        self.rows_written += len(self.rows)
+        self.rows = []
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            "type": self.mtype,
+            "rows": self.rows_written,
+            "columns": [[name, self.dtype[name].str] for name in self.dtype.names],
+        }
+        tmp = os.path.join(self.directory, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.directory, "meta.json"))
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+
+class TelemetryRecorder:
+    """Records selected message types from one or more links into a log directory."""
+
+    def __init__(self, directory=None, types=DEFAULT_TYPES, batch_rows=BATCH_ROWS,
+                 flush_interval=FLUSH_INTERVAL):
+        self.directory = directory or os.path.join(LOG_ROOT, time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(self.directory, exist_ok=True)
+        self.types = tuple(types)
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.writers = {mtype: _TypeWriter(self.directory, mtype) for mtype in self.types}
+        self.messages_recorded = 0
+        self._last_flush_check = time.monotonic()
+
+    def record(self, msg):
+        """Buffer one message if its type is recorded."""
+        writer = self.writers.get(msg.get_type())
+        if writer is None:
+            return
+        writer.add(msg)
+        self.messages_recorded += 1
+        if len(writer.rows) >= self.batch_rows:
+            writer.flush()
+        elif self.messages_recorded & 0xFF == 0:
+            self.flush_stale()
+
+    def flush_stale(self):
+        """Flush types whose oldest buffered row is older than flush_interval."""
+        now = time.monotonic()
+        for writer in self.writers.values():
+            if writer.rows and now - writer.first_buffered >= self.flush_interval:
+                writer.flush()
+
+    def attach(self, link):
+        """Record everything of the selected types arriving on an asyncio MavLink."""
+        link.subscribe(self.record, self.types)
+        return self
+
+    def flush(self):
+        for writer in self.writers.values():
+            writer.flush()
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ----------------------------------------------------------------------
+# Reading
+# ----------------------------------------------------------------------
+
+class Table:
+    """Memory-mapped columns of one message type."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.type = meta["type"]
+        self.columns = {}
+        rows = None
+        for name, dtype in meta["columns"]:
+            path = os.path.join(directory, name + ".bin")
+            dtype = np.dtype(dtype)
+            n = os.path.getsize(path) // dtype.itemsize
+            rows = n if rows is None else min(rows, n)
+            self.columns[name] = (path, dtype)
+        self.rows = rows or 0
+        self._maps = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        column = self._maps.get(name)
+        if column is None:
+            path, dtype = self.columns[name]
+            if self.rows:
+                column = np.memmap(path, dtype=dtype, mode="r", shape=(self.rows,))
+            else:
+                column = np.empty(0, dtype=dtype)
+            self._maps[name] = column
+        return column
+
+    @property
+    def fields(self):
+        return [name for name in self.columns if not name.startswith("_")]
+
+    @property
+    def time(self):
+        return self[TIME_COLUMN]
+
+    @property
+    def sysid(self):
+        return self[SYSID_COLUMN]
+
+    def sysids(self):
+        return sorted(int(s) for s in np.unique(self.sysid))
+
+    def for_sysid(self, sysid, name):
+        """Column values from one vehicle."""
+        return self[name][self.sysid == sysid]
+
+
+class TelemetryLog:
+    """A recorded log directory; log['VFR_HUD']['alt'] is a memory-mapped array."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        for entry in sorted(os.listdir(directory)):
+            path = os.path.join(directory, entry)
+            if os.path.isfile(os.path.join(path, "meta.json")):
+                self.tables[entry] = Table(path)
+
+    def __getitem__(self, mtype):
+        return self.tables[mtype]
+
+    def __contains__(self, mtype):
+        return mtype in self.tables
+
+    def types(self):
+        return list(self.tables)
+
+
+# ----------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------
+
+def cmd_record(args):
+    vehicle = mavutil.mavlink_connection(args.connection)
+    print(f"Connecting to {args.connection}...")
+    vehicle.wait_heartbeat()
+    print(f"✓ Connected to system {vehicle.target_system}")
+    types = args.types.split(",") if args.types else DEFAULT_TYPES
+    end = time.monotonic() + args.duration if args.duration else None
+    with TelemetryRecorder(args.out, types) as recorder:
+        print(f"Recording {', '.join(types)} to {recorder.directory} (Ctrl+C to stop)")
+        try:
+            while end is None or time.monotonic() < end:
+                msg = vehicle.recv_match(blocking=True, timeout=1)
+                if msg is not None:
+                    recorder.record(msg)
+                else:
+                    recorder.flush_stale()
+        except KeyboardInterrupt:
+            pass
+        print(f"\n✓ {recorder.messages_recorded} messages recorded")
+
+
+def cmd_info(args):
+    log = TelemetryLog(args.log)
+    print(f"{'type':<22} {'rows':>9} {'vehicles':<12} {'span s':>9}")
+    for mtype in log.types():
+        table = log[mtype]
+        span = float(table.time[-1] - table.time[0]) if len(table) else 0.0
+        print(f"{mtype:<22} {len(table):>9} {str(table.sysids()):<12} {span:>9.1f}")
+
+
+def cmd_bench(args):
+    """Measure recording cost per message against synthetic telemetry."""
+    import tempfile
+    mav = mavlink2.MAVLink(None, srcSystem=1, srcComponent=1)
+    samples = [
+        mavlink2.MAVLink_vfr_hud_message(0, 3.2, 90, 55, 10.1, 0.2),
+        mavlink2.MAVLink_attitude_message(1000, 0.01, 0.02, 1.5, 0, 0, 0),
+        mavlink2.MAVLink_local_position_ned_message(1000, 1, 2, -10, 0.5, 0, 0),
+        mavlink2.MAVLink_servo_output_raw_message(1000, 0, *([1500] * 8)),
+    ]
+    msgs = []
+    for m in samples:
+        m.pack(mav)
+        msgs.append(mav.decode(m.get_msgbuf()))
+    for m in msgs:
+        m._timestamp = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder = TelemetryRecorder(tmp)
+        start = time.perf_counter()
+        for i in range(args.count):
+            recorder.record(msgs[i & 3])
+        recorder.close()
+        elapsed = time.perf_counter() - start
+        log = TelemetryLog(tmp)
+        assert len(log["VFR_HUD"]) == args.count // 4
+    per_msg = elapsed / args.count
+    print(f"{per_msg * 1e6:.2f} us/message; at {args.rate} msg/s that is "
+          f"{per_msg * args.rate * 100:.2f}% of one core")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar MAVLink telemetry recorder")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("record", help="record a live connection")
+    p.add_argument("--connection", default="udp:127.0.0.1:14550")
+    p.add_argument("--out", help="log directory (default telemetry_logs/<timestamp>)")
+    p.add_argument("--types", help="comma-separated message types")
+    p.add_argument("--duration", type=float, help="seconds to record (default: until Ctrl+C)")
+    p.set_defaults(func=cmd_record)
+    p = sub.add_parser("info", help="summarise a recorded log")
+    p.add_argument("log")
+    p.set_defaults(func=cmd_info)
+    p = sub.add_parser("bench", help="measure recording overhead")
+    p.add_argument("--count", type=int, default=200000)
+    p.add_argument("--rate", type=float, default=10000, help="message rate to express cost at")
+    p.set_defaults(func=cmd_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Minimum-jerk trajectories streamed as high-rate setpoints
+goto_position_ned() sends one position jump and leaves the smoothing to the
+autopilot's WPNAV limits; velocity control steps between setpoints. This
+module plans the whole path instead: each leg between waypoints is a
+quintic (minimum-jerk) polynomial matching position, velocity and
+acceleration at both ends, so the setpoints are continuous up to
+acceleration.
+
+Legs are timed from WPNAV_SPEED(_UP/_DN) and WPNAV_ACCEL(_Z) in
+config/ardupilot/airsim.parm (the peak speed of a rest-to-rest quintic is
+15/8 d/T, its peak acceleration 10/sqrt(3) d/T^2). Interior waypoints are
+passed at the Catmull-Rom velocity (the chord between their neighbours);
+the trajectory starts from a given state and ends at rest. Legs whose
+samples still exceed a limit are slowed down by their own worst ratio
+and the plan is made again (with the knot velocities that follow), so a
+tight corner does not slow the straight legs around it.
+
+Everything is planned for a batch of vehicles at once and sampled into a
+TrajectoryTable: (vehicles, samples, 3) position, velocity and acceleration
+arrays on a common clock. Streaming a tick is then one slice per array,
+sent with SET_POSITION_TARGET_LOCAL_NED carrying all three
+(Swarm.send_trajectories()). Re-planning from the current sample (its
+position, velocity and acceleration) overwrites the rows from that tick on,
+so changing the path mid-flight costs one small batch plan.
+
+Positions are LOCAL_POSITION_NED, so all vehicles must share one local
+origin (true for fake_vehicle.py fleets).
+
+Usage:
+  python3 fake_vehicle.py --count 10 &
+  python3 trajectory.py --count 10 --takeoff 10 --size 20
+  python3 trajectory.py --count 10 --takeoff 10 --replan-at 20
+  python3 trajectory.py --count 10 --takeoff 10 --output position   # no feed-forward
+  python3 trajectory.py --bench
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+import waits
+from formation import fleet_positions, speed_limits, wait_altitude
+from scheduler import RateScheduler
+from swarm import BASE_PORT, PORT_STEP, SETPOINT_RATE, Swarm
+
+# ArduCopter defaults for the acceleration limits (cm/s/s) when the .parm file is missing
+WPNAV_ACCEL_DEFAULTS = {"WPNAV_ACCEL": 250, "WPNAV_ACCEL_Z": 100}
+
+# Peak speed and acceleration of a rest-to-rest quintic over d in T, as
+# multiples of d/T and d/T^2
+PEAK_SPEED = 15.0 / 8.0
+PEAK_ACCEL = 10.0 / 3.0 ** 0.5
+# Shortest leg (s), so repeated waypoints stay well defined
+MIN_LEG_TIME = 0.5
+# Re-plans slowing down the legs that exceed a limit (slower legs change
+# the knot velocities and a moving start is kept, so it can take a few)
+SCALE_ITERATIONS = 6
+# Limits are met within this factor, checked at these fractions of each leg
+SCALE_TOLERANCE = 1.02
+LIMIT_CHECKS = np.linspace(0.0, 1.0, 17)
+
+# Demo: square side (m), distance between the vehicles' squares (m)
+SQUARE_SIZE = 20.0
+SPACING = 6.0
+
+BENCH_SIZES = (1, 10, 100, 1000)
+BENCH_WAYPOINTS = 5
+# Half-width of the square the benchmark waypoints are drawn from (m)
+BENCH_SPREAD = 25.0
+
+
+def accel_limits(path=waits.PARAM_FILE):
+    """(horizontal, vertical) acceleration limits in m/s/s from the vehicle parameter file."""
+    try:
+        params = waits.load_param_file(path)
+    except OSError:
+        params = {}
+    return tuple(params.get(name, default) / 100.0 for name, default in WPNAV_ACCEL_DEFAULTS.items())
+
+
+# ----------------------------------------------------------------------
+# Planning
+# ----------------------------------------------------------------------
+
+def quintic_coefficients(p0, v0, a0, p1, v1, a1, duration):
+    """(..., 6, 3) coefficients c0..c5 of the quintics joining two states in duration."""
+    T = duration[..., None]
+    dp = p1 - p0
+    c3 = (20 * dp - (8 * v1 + 12 * v0) * T - (3 * a0 - a1) * T ** 2) / (2 * T ** 3)
+    c4 = (-30 * dp + (14 * v1 + 16 * v0) * T + (3 * a0 - 2 * a1) * T ** 2) / (2 * T ** 4)
+    c5 = (12 * dp - 6 * (v1 + v0) * T - (a0 - a1) * T ** 2) / (2 * T ** 5)
+    return np.stack((p0, v0, a0 / 2, c3, c4, c5), axis=-2)
+
+
+def leg_times(starts, ends, limits, accel):
+    """(..., legs) durations for rest-to-rest quintics within the speed and acceleration limits."""
+    delta = ends - starts
+    horizontal = np.hypot(delta[..., 0], delta[..., 1])
+    vertical = np.abs(delta[..., 2])
+    climb = np.where(delta[..., 2] < 0, limits[1], limits[2])
+    return np.maximum.reduce([
+        PEAK_SPEED * horizontal / limits[0],
+        PEAK_SPEED * vertical / climb,
+        np.sqrt(PEAK_ACCEL * horizontal / accel[0]),
+        np.sqrt(PEAK_ACCEL * vertical / accel[1]),
+        np.full(horizontal.shape, MIN_LEG_TIME),
+    ])
+
+
+def sample_legs(coefficients, durations, times):
+    """Position, velocity and acceleration (N, K, 3) of piecewise quintics at times (K,).
+
+    Times past the end hold the final state.
+    """
+    count, legs = durations.shape
+    ends = np.cumsum(durations, axis=1)
+    starts = ends - durations
+    # Leg of each vehicle at each time, and the time into it
+    leg = np.zeros((count, len(times)), dtype=np.intp)
+    for end in ends[:, :-1].T:
+        leg += times[None, :] >= end[:, None]
+    rows = np.arange(count)[:, None]
+    tau = np.minimum(times[None, :] - starts[rows, leg], durations[rows, leg])[..., None]
+    return _evaluate([coefficients[rows, leg, k] for k in range(6)], tau)
+
+
+def _evaluate(c, tau):
+    """Position, velocity and acceleration of quintics with coefficients c at tau (Horner)."""
+    position = c[0] + tau * (c[1] + tau * (c[2] + tau * (c[3] + tau * (c[4] + tau * c[5]))))
+    velocity = c[1] + tau * (2 * c[2] + tau * (3 * c[3] + tau * (4 * c[4] + tau * 5 * c[5])))
+    acceleration = 2 * c[2] + tau * (6 * c[3] + tau * (12 * c[4] + tau * 20 * c[5]))
+    return position, velocity, acceleration
+
+
+def limit_ratio(velocities, accelerations, limits, accel, keep=1):
+    """Worst ratio of a speed or acceleration to its limit, over (N, ..., 3) samples.
+
+    The first keep axes are kept: (N,) per vehicle by default, keep=2 gives
+    (N, legs) for samples shaped (N, legs, K, 3). Accelerations count by
+    their square root, the factor by which slowing down uniformly brings
+    them within the limit.
+    """
+    v = velocities.reshape(velocities.shape[:keep] + (-1, 3))
+    a = accelerations.reshape(accelerations.shape[:keep] + (-1, 3))
+    return np.maximum.reduce([
+        np.hypot(v[..., 0], v[..., 1]).max(axis=-1) / limits[0],
+        np.maximum(-v[..., 2], 0.0).max(axis=-1) / limits[1],
+        np.maximum(v[..., 2], 0.0).max(axis=-1) / limits[2],
+        np.sqrt(np.hypot(a[..., 0], a[..., 1]).max(axis=-1) / accel[0]),
+        np.sqrt(np.abs(a[..., 2]).max(axis=-1) / accel[1]),
+    ])
+
+
+def plan(waypoints, start=None, rate=SETPOINT_RATE, limits=None, accel=None):
+    """TrajectoryTable through (N, W, 3) waypoints for N vehicles.
+
+    start is a (position, velocity, acceleration) tuple of (N, 3) arrays; by
+    default each vehicle starts at rest on its first waypoint.
+    """
+    waypoints = np.asarray(waypoints, dtype=float)
+    if waypoints.ndim == 2:
+        waypoints = waypoints[None]
+    limits = speed_limits() if limits is None else limits
+    accel = accel_limits() if accel is None else accel
+    if start is None:
+        p0 = waypoints[:, 0]
+        v0 = a0 = np.zeros_like(p0)
+        waypoints = waypoints[:, 1:]
+    else:
+        p0, v0, a0 = (np.asarray(s, dtype=float).reshape(-1, 3) for s in start)
+    # Knots: the start state, then every waypoint
+    knots = np.concatenate((p0[:, None], waypoints), axis=1)
+    durations = leg_times(knots[:, :-1], knots[:, 1:], limits, accel)
+
+    for _ in range(SCALE_ITERATIONS):
+        # Catmull-Rom velocities at interior waypoints, rest at the last
+        velocities = np.zeros_like(knots)
+        velocities[:, 0] = v0
+        velocities[:, 1:-1] = (knots[:, 2:] - knots[:, :-2]) / \
+            (durations[:, :-1] + durations[:, 1:])[..., None]
+        accelerations = np.zeros_like(knots)
+        accelerations[:, 0] = a0
+        coefficients = quintic_coefficients(
+            knots[:, :-1], velocities[:, :-1], accelerations[:, :-1],
+            knots[:, 1:], velocities[:, 1:], accelerations[:, 1:], durations)
+        # Check the limits on a few points per leg before sampling the table
+        tau = (durations[..., None] * LIMIT_CHECKS)[..., None]
+        _, v, a = _evaluate([coefficients[:, :, k, None, :] for k in range(6)], tau)
+        scale = limit_ratio(v, a, limits, accel, keep=2)
+        if np.all(scale <= SCALE_TOLERANCE):
+            break
+        # Only the legs over a limit slow down; the knot velocities follow
+        durations = durations * np.maximum(scale, 1.0)
+    return TrajectoryTable(*sample_legs(coefficients, durations, _sample_times(durations, rate)), rate)
+
+
+def _sample_times(durations, rate):
+    total = float(durations.sum(axis=1).max())
+    return np.arange(int(np.ceil(total * rate)) + 1) / rate
+
+
+# ----------------------------------------------------------------------
+# Tables
+# ----------------------------------------------------------------------
+
+class TrajectoryTable:
+    """Sampled trajectories of N vehicles on a common clock at rate Hz."""
+
+    def __init__(self, positions, velocities, accelerations, rate=SETPOINT_RATE):
+        self.positions = positions
+        self.velocities = velocities
+        self.accelerations = accelerations
+        self.rate = rate
+
+    def __len__(self):
+        return self.positions.shape[0]
+
+    @property
+    def samples(self):
+        return self.positions.shape[1]
+
+    @property
+    def duration(self):
+        return (self.samples - 1) / self.rate
+
+    def index(self, t):
+        """Sample index for t seconds into the table (the last one holds)."""
+        return min(max(int(t * self.rate), 0), self.samples - 1)
+
+    def at(self, t):
+        """(N, 3) position, velocity and acceleration at t seconds."""
+        k = self.index(t)
+        return self.positions[:, k], self.velocities[:, k], self.accelerations[:, k]
+
+    def limit_ratio(self, limits, accel):
+        """(N,) worst ratio of a sampled speed or acceleration to its limit."""
+        return limit_ratio(self.velocities, self.accelerations, limits, accel)
+
+    def replan(self, t, waypoints, rows=None, limits=None, accel=None):
+        """Re-plan rows (default all) from their sample at t through new waypoints.
+
+        The new trajectories start from the current position, velocity and
+        acceleration, so the setpoints stay continuous; samples before t are
+        kept. Returns the seconds the planning took.
+        """
+        started = time.perf_counter()
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        k = self.index(t)
+        state = (self.positions[rows, k], self.velocities[rows, k], self.accelerations[rows, k])
+        new = plan(waypoints, state, self.rate, limits, accel)
+        self._grow(k + new.samples)
+        for mine, theirs in ((self.positions, new.positions), (self.velocities, new.velocities),
+                             (self.accelerations, new.accelerations)):
+            mine[rows, k:k + new.samples] = theirs
+            # Hold the end state for the rest of the table
+            mine[rows, k + new.samples:] = theirs[:, -1:]
+        return time.perf_counter() - started
+
+    def _grow(self, samples):
+        extra = samples - self.samples
+        if extra > 0:
+            self.positions = np.pad(self.positions, ((0, 0), (0, extra), (0, 0)), mode="edge")
+            self.velocities = np.pad(self.velocities, ((0, 0), (0, extra), (0, 0)), mode="edge")
+            self.accelerations = np.pad(self.accelerations, ((0, 0), (0, extra), (0, 0)), mode="edge")
+
+
+async def stream_table(swarm, table, duration=None, output="full", on_tick=None):
+    """Send the table's samples at its rate; output 'full' or 'position' (no feed-forward).
+
+    on_tick(t, k) runs before each send and may re-plan. Without a duration
+    the stream ends a second after the (possibly re-planned) table does.
+    Returns the scheduler task.
+    """
+    scheduler = RateScheduler()
+    start = time.monotonic()
+
+    def tick():
+        t = time.monotonic() - start
+        if duration is None and t > table.duration + 1.0:
+            scheduler.stop()
+            return
+        if on_tick:
+            on_tick(t, table.index(t))
+        positions, velocities, accelerations = table.at(t)
+        if output == "position":
+            swarm.send_positions(positions.tolist())
+        else:
+            swarm.send_trajectories(positions.tolist(), velocities.tolist(), accelerations.tolist())
+
+    task = scheduler.add_task(tick, table.rate, "trajectory")
+    await scheduler.run_async(duration)
+    swarm.tick_overruns += task.overruns
+    return task
+
+
+# ----------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------
+
+def bench_waypoints(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform((-BENCH_SPREAD, -BENCH_SPREAD, -15), (BENCH_SPREAD, BENCH_SPREAD, -5),
+                       (count, BENCH_WAYPOINTS, 3))
+
+
+def bench_plan(count, rounds=20):
+    """{plan_ms, replan_us, sample_us} for count vehicles through BENCH_WAYPOINTS waypoints."""
+    waypoints = bench_waypoints(count)
+    limits, accel = speed_limits(), accel_limits()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        table = plan(waypoints, limits=limits, accel=accel)
+    plan_ms = (time.perf_counter() - start) / rounds * 1000
+    samples = table.samples
+
+    # One vehicle changes course halfway
+    halfway = table.duration / 2
+    replans = [table.replan(halfway, waypoints[:1, ::-1], rows=[0], limits=limits, accel=accel)
+               for _ in range(max(rounds, 10))]
+
+    start = time.perf_counter()
+    for i in range(rounds * 50):
+        table.at(i * 0.05)
+    sample_us = (time.perf_counter() - start) / (rounds * 50) * 1e6
+    return {"plan_ms": plan_ms, "replan_us": float(np.median(replans)) * 1e6,
+            "sample_us": sample_us, "samples": samples}
+
+
+def run_bench():
+    print(f"{'vehicles':>8} {'plan ms':>9} {'samples':>8} {'replan 1 us':>12} {'tick us':>8}")
+    for count in BENCH_SIZES:
+        r = bench_plan(count, rounds=max(2, 200 // count))
+        print(f"{count:>8} {r['plan_ms']:>9.2f} {r['samples']:>8} {r['replan_us']:>12.0f} "
+              f"{r['sample_us']:>8.2f}")
+    print(f"{BENCH_WAYPOINTS} random waypoints per vehicle within {2 * BENCH_SPREAD:.0f} m, sampled at "
+          f"{SETPOINT_RATE} Hz; tick = one table lookup for the whole fleet")
+
+
+# ----------------------------------------------------------------------
+# Flying trajectories
+# ----------------------------------------------------------------------
+
+def square_waypoints(positions, altitude, size=SQUARE_SIZE, spacing=SPACING, reverse=False):
+    """(N, 6, 3) waypoints: climb to a slot on a line, then a square from it and back."""
+    count = len(positions)
+    slots = np.zeros((count, 3))
+    slots[:, 1] = (np.arange(count) - (count - 1) / 2.0) * spacing
+    slots[:, 2] = -altitude
+    corners = np.array([(size, 0, 0), (size, size, 0), (0, size, 0)], dtype=float)
+    if reverse:
+        corners = corners[::-1]
+    square = slots[:, None, :] + np.vstack((corners, np.zeros((1, 3))))[None]
+    return np.concatenate((slots[:, None, :], square), axis=1)
+
+
+async def fly(args):
+    swarm = Swarm.from_ports(args.count, args.base_port, args.port_step, verbose=args.verbose)
+    print(f"Connecting to {len(swarm)} vehicles...")
+    missing = await swarm.connect(timeout=args.timeout)
+    if missing:
+        print(f"No heartbeat from: {', '.join(missing)}")
+    if not len(swarm):
+        print("No vehicles connected. Exiting.")
+        return
+    try:
+        await swarm.apply_profile(verify=False)
+        if args.takeoff:
+            print(f"GUIDED + arm + takeoff to {args.takeoff}m...")
+            await swarm.set_mode("GUIDED")
+            await swarm.arm()
+            await swarm.takeoff(args.takeoff)
+            if not await wait_altitude(swarm, args.takeoff):
+                print("✗ Not every vehicle reached the takeoff altitude")
+
+        altitude = args.takeoff or args.alt
+        limits, accel = speed_limits(), accel_limits()
+        positions = fleet_positions(swarm.vehicles)
+        started = time.perf_counter()
+        table = plan(square_waypoints(positions, altitude, args.size),
+                     (positions, np.zeros_like(positions), np.zeros_like(positions)),
+                     args.rate, limits, accel)
+        print(f"Planned {len(table)} trajectories in {(time.perf_counter() - started) * 1000:.1f} ms: "
+              f"{table.samples} samples, {table.duration:.1f} s, {args.output} setpoints at {args.rate} Hz")
+
+        errors = []
+        replanned = [args.replan_at is None]
+
+        def on_tick(t, k):
+            fleet_positions(swarm.vehicles, out=positions)
+            errors.append(np.linalg.norm(positions - table.positions[:, k], axis=1))
+            if not replanned[0] and t >= args.replan_at:
+                replanned[0] = True
+                # Fly the rest of the square the other way round, from where the setpoints are
+                elapsed = table.replan(t, square_waypoints(positions, altitude, args.size,
+                                                           reverse=True)[:, 1:], None, limits, accel)
+                print(f"  re-planned at t={t:.1f}s in {elapsed * 1000:.2f} ms; "
+                      f"now {table.duration:.1f} s")
+
+        task = await stream_table(swarm, table, args.duration, args.output, on_tick)
+        errors = np.array(errors)
+        final = np.linalg.norm(fleet_positions(swarm.vehicles) - table.positions[:, -1], axis=1)
+        print(f"✓ {task.runs} ticks; tracking error mean {errors.mean():.2f} m, "
+              f"max {errors.max():.2f} m; final error max {final.max():.2f} m")
+        if args.rtl:
+            print("Returning fleet to launch...")
+            await swarm.set_mode("RTL")
+    finally:
+        swarm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimum-jerk trajectories streamed as setpoints")
+    parser.add_argument("--count", type=int, default=4)
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--port-step", type=int, default=PORT_STEP)
+    parser.add_argument("--timeout", type=float, default=30, help="heartbeat timeout (s)")
+    parser.add_argument("--takeoff", type=float, help="GUIDED, arm and take off to this altitude first")
+    parser.add_argument("--alt", type=float, default=10, help="square altitude when not taking off")
+    parser.add_argument("--size", type=float, default=SQUARE_SIZE, help="square side (m)")
+    parser.add_argument("--output", choices=("full", "position"), default="full",
+                        help="position + velocity + acceleration, or position only")
+    parser.add_argument("--replan-at", type=float, help="fly the square the other way from this time (s)")
+    parser.add_argument("--rate", type=float, default=SETPOINT_RATE, help="sample and setpoint rate (Hz)")
+    parser.add_argument("--duration", type=float, help="seconds to stream (default: the plan + 1 s)")
+    parser.add_argument("--rtl", action="store_true", help="RTL at the end")
+    parser.add_argument("--bench", action="store_true", help="time planning and sampling and exit")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_bench()
+        return
+    try:
+        asyncio.run(fly(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+
+
+if __name__ == "__main__":
+    main()
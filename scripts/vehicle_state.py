@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Live vehicle state cache
+Continuously updated from the incoming MAVLink stream so control loops can
+read the latest position, attitude, GPS, EKF, battery, arming/mode and servo state
+without waiting on the socket.
+
+Reads are plain attribute lookups on a __slots__ object; servo outputs and
+per-group timestamps live in preallocated arrays.
+"""
+
+import time
+from array import array
+from pymavlink import mavutil
+
+# Field groups, one timestamp each (index into VehicleState.stamps)
+HEARTBEAT = 0
+LOCAL_POSITION = 1
+GLOBAL_POSITION = 2
+ATTITUDE = 3
+VFR_HUD = 4
+GPS = 5
+EKF = 6
+SERVO = 7
+SYS_STATUS = 8
+GROUP_NAMES = ("heartbeat", "local_position", "global_position", "attitude",
+               "vfr_hud", "gps", "ekf", "servo", "sys_status")
+
+SERVO_CHANNELS = 16
+_SERVO_EXTENSIONS = tuple((i, f"servo{i + 1}_raw") for i in range(8, SERVO_CHANNELS))
+
+# EKF_STATUS_REPORT flags needed before GUIDED flight
+EKF_HEALTHY_FLAGS = (mavutil.mavlink.EKF_ATTITUDE |
+                     mavutil.mavlink.EKF_VELOCITY_HORIZ |
+                     mavutil.mavlink.EKF_VELOCITY_VERT |
+                     mavutil.mavlink.EKF_POS_HORIZ_ABS |
+                     mavutil.mavlink.EKF_POS_VERT_ABS)
+
+
+class VehicleState:
+    """Latest known state of one vehicle, fed message by message."""
+
+    __slots__ = (
+        "sysid", "clock", "stamps", "servo", "_handlers",
+        # heartbeat
+        "armed", "custom_mode", "mode", "system_status",
+        # LOCAL_POSITION_NED (m, m/s)
+        "x", "y", "z", "vx", "vy", "vz",
+        # GLOBAL_POSITION_INT (deg, m)
+        "lat", "lon", "alt_msl", "relative_alt", "heading",
+        # ATTITUDE (rad, rad/s)
+        "roll", "pitch", "yaw", "rollspeed", "pitchspeed", "yawspeed",
+        # VFR_HUD
+        "alt", "groundspeed", "airspeed", "climb", "throttle",
+        # GPS_RAW_INT
+        "fix_type", "satellites_visible", "eph",
+        # EKF_STATUS_REPORT
+        "ekf_flags",
+        # SYS_STATUS (%, -1 if unknown; V)
+        "battery_remaining", "voltage",
+        # latest time_boot_ms seen from the vehicle
+        "time_boot_ms",
+    )
+
+    def __init__(self, sysid=None, clock=time.monotonic):
+        self.sysid = sysid
+        self.clock = clock
+        self.stamps = array('d', [0.0] * len(GROUP_NAMES))
+        self.servo = array('H', [0] * SERVO_CHANNELS)
+
+        self.armed = False
+        self.custom_mode = -1
+        self.mode = "UNKNOWN"
+        self.system_status = 0
+        self.x = self.y = self.z = 0.0
+        self.vx = self.vy = self.vz = 0.0
+        self.lat = self.lon = 0.0
+        self.alt_msl = self.relative_alt = 0.0
+        self.heading = 0.0
+        self.roll = self.pitch = self.yaw = 0.0
+        self.rollspeed = self.pitchspeed = self.yawspeed = 0.0
+        self.alt = self.groundspeed = self.airspeed = self.climb = 0.0
+        self.throttle = 0
+        self.fix_type = 0
+        self.satellites_visible = 0
+        self.eph = 0
+        self.ekf_flags = 0
+        self.battery_remaining = -1
+        self.voltage = 0.0
+        self.time_boot_ms = 0
+
+        self._handlers = {
+            'HEARTBEAT': self._on_heartbeat,
+            'LOCAL_POSITION_NED': self._on_local_position,
+            'GLOBAL_POSITION_INT': self._on_global_position,
+            'ATTITUDE': self._on_attitude,
+            'VFR_HUD': self._on_vfr_hud,
+            'GPS_RAW_INT': self._on_gps,
+            'EKF_STATUS_REPORT': self._on_ekf,
+            'SERVO_OUTPUT_RAW': self._on_servo,
+            'SYS_STATUS': self._on_sys_status,
+        }
+
+    # ------------------------------------------------------------------
+    # Feeding
+    # ------------------------------------------------------------------
+
+    def update(self, msg):
+        """Fold one message into the state; other vehicles' messages are ignored."""
+        handler = self._handlers.get(msg.get_type())
+        if handler is None:
+            return
+        src = msg.get_srcSystem()
+        if self.sysid is None:
+            if msg.get_type() != 'HEARTBEAT' or not _is_vehicle_heartbeat(msg):
+                return
+            self.sysid = src
+        elif src != self.sysid:
+            return
+        handler(msg)
+
+    def attach(self, link):
+        """Keep the state updated from an asyncio MavLink."""
+        link.subscribe(self.update, self._handlers.keys())
+        return self
+
+    def pump(self, vehicle):
+        """Drain pending messages from a blocking mavutil connection without waiting.
+
+        Returns the number of messages consumed.
+        """
+        count = 0
+        msg = vehicle.recv_msg()
+        while msg is not None:
+            self.update(msg)
+            count += 1
+            msg = vehicle.recv_msg()
+        return count
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def age(self, group):
+        """Seconds since the given field group was last updated (inf if never)."""
+        stamp = self.stamps[group]
+        if stamp == 0.0:
+            return float('inf')
+        return self.clock() - stamp
+
+    def fresh(self, group, max_age=1.0):
+        return self.age(group) <= max_age
+
+    @property
+    def ekf_healthy(self):
+        return (self.ekf_flags & EKF_HEALTHY_FLAGS) == EKF_HEALTHY_FLAGS
+
+    @property
+    def altitude(self):
+        """Height above home in metres (positive up)."""
+        return -self.z if self.stamps[LOCAL_POSITION] else self.relative_alt
+
+    def snapshot(self):
+        """Plain dict copy of the state, for logging."""
+        data = {name: getattr(self, name) for name in self.__slots__
+                if name not in ("clock", "stamps", "servo", "_handlers")}
+        data["servo"] = list(self.servo)
+        data["age"] = {name: self.age(i) for i, name in enumerate(GROUP_NAMES)}
+        return data
+
+    # ------------------------------------------------------------------
+    # Handlers
+    # ------------------------------------------------------------------
+
+    def _on_heartbeat(self, msg):
+        if not _is_vehicle_heartbeat(msg):
+            return
+        self.armed = bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
+        self.system_status = msg.system_status
+        if msg.custom_mode != self.custom_mode:
+            self.custom_mode = msg.custom_mode
+            self.mode = mavutil.mode_string_v10(msg)
+        self.stamps[HEARTBEAT] = self.clock()
+
+    def _on_local_position(self, msg):
+        self.x = msg.x
+        self.y = msg.y
+        self.z = msg.z
+        self.vx = msg.vx
+        self.vy = msg.vy
+        self.vz = msg.vz
+        self.time_boot_ms = msg.time_boot_ms
+        self.stamps[LOCAL_POSITION] = self.clock()
+
+    def _on_global_position(self, msg):
+        self.lat = msg.lat * 1e-7
+        self.lon = msg.lon * 1e-7
+        self.alt_msl = msg.alt * 1e-3
+        self.relative_alt = msg.relative_alt * 1e-3
+        self.heading = msg.hdg * 1e-2
+        self.time_boot_ms = msg.time_boot_ms
+        self.stamps[GLOBAL_POSITION] = self.clock()
+
+    def _on_attitude(self, msg):
+        self.roll = msg.roll
+        self.pitch = msg.pitch
+        self.yaw = msg.yaw
+        self.rollspeed = msg.rollspeed
+        self.pitchspeed = msg.pitchspeed
+        self.yawspeed = msg.yawspeed
+        self.time_boot_ms = msg.time_boot_ms
+        self.stamps[ATTITUDE] = self.clock()
+
+    def _on_vfr_hud(self, msg):
+        self.alt = msg.alt
+        self.groundspeed = msg.groundspeed
+        self.airspeed = msg.airspeed
+        self.climb = msg.climb
+        self.throttle = msg.throttle
+        self.stamps[VFR_HUD] = self.clock()
+
+    def _on_gps(self, msg):
+        self.fix_type = msg.fix_type
+        self.satellites_visible = msg.satellites_visible
+        self.eph = msg.eph
+        self.stamps[GPS] = self.clock()
+
+    def _on_ekf(self, msg):
+        self.ekf_flags = msg.flags
+        self.stamps[EKF] = self.clock()
+
+    def _on_sys_status(self, msg):
+        self.battery_remaining = msg.battery_remaining
+        self.voltage = msg.voltage_battery * 1e-3
+        self.stamps[SYS_STATUS] = self.clock()
+
+    def _on_servo(self, msg):
+        servo = self.servo
+        servo[0] = msg.servo1_raw
+        servo[1] = msg.servo2_raw
+        servo[2] = msg.servo3_raw
+        servo[3] = msg.servo4_raw
+        servo[4] = msg.servo5_raw
+        servo[5] = msg.servo6_raw
+        servo[6] = msg.servo7_raw
+        servo[7] = msg.servo8_raw
+        # MAVLink 2 extension fields; absent on MAVLink 1 links
+        for i, name in _SERVO_EXTENSIONS:
+            servo[i] = getattr(msg, name, 0) or 0
+        self.stamps[SERVO] = self.clock()
+
+
+def _is_vehicle_heartbeat(msg):
+    return (msg.autopilot != mavutil.mavlink.MAV_AUTOPILOT_INVALID and
+            msg.type not in (mavutil.mavlink.MAV_TYPE_GCS,
+                             mavutil.mavlink.MAV_TYPE_GIMBAL,
+                             mavutil.mavlink.MAV_TYPE_ADSB,
+                             mavutil.mavlink.MAV_TYPE_ONBOARD_CONTROLLER))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Event-driven waits on live telemetry
+Instead of sleeping a guessed number of seconds, a wait re-checks a predicate
+on the VehicleState every time a message arrives and returns as soon as it
+holds. Timeouts are given in simulated seconds and converted to wall time
+through the measured sim clock rate, so the same mission works at
+SIM_SPEEDUP 1 or 20.
+"""
+
+import asyncio
+import math
+import os
+import time
+
+PARAM_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "..", "config", "ardupilot", "airsim.parm")
+
+# Wall-clock span needed before the measured sim rate is trusted
+SIM_RATE_WINDOW = 1.0
+
+
+def load_param_file(path=PARAM_FILE):
+    """Parse an ArduPilot .parm file into {name: float}."""
+    params = {}
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.replace(',', ' ').split()
+            if len(parts) >= 2:
+                params[parts[0]] = float(parts[1])
+    return params
+
+
+class SimClock:
+    """Converts simulated seconds to wall seconds.
+
+    The rate starts at the configured SIM_SPEEDUP and is replaced by the rate
+    measured from the vehicle's time_boot_ms once enough data has arrived.
+    """
+
+    def __init__(self, speedup=1.0):
+        self.configured = speedup
+        self.measured = None
+        self._ref = None  # (time_boot_ms, monotonic)
+
+    @classmethod
+    def from_param_file(cls, path=PARAM_FILE):
+        try:
+            return cls(load_param_file(path).get('SIM_SPEEDUP', 1.0))
+        except OSError:
+            return cls()
+
+    @property
+    def speedup(self):
+        return self.measured if self.measured else self.configured
+
+    def observe(self, time_boot_ms, now=None):
+        """Feed the vehicle's boot time to refine the measured rate."""
+        if not time_boot_ms:
+            return
+        now = time.monotonic() if now is None else now
+        if self._ref is None or time_boot_ms < self._ref[0]:
+            self._ref = (time_boot_ms, now)
+            return
+        wall = now - self._ref[1]
+        if wall >= SIM_RATE_WINDOW:
+            self.measured = max((time_boot_ms - self._ref[0]) * 1e-3 / wall, 1e-3)
+            if wall >= 10 * SIM_RATE_WINDOW:
+                # Slide the reference so the estimate follows speed changes
+                self._ref = (time_boot_ms, now)
+
+    def to_wall(self, sim_seconds):
+        return sim_seconds / self.speedup
+
+
+# ----------------------------------------------------------------------
+# Predicates (callables taking a VehicleState)
+# ----------------------------------------------------------------------
+
+def altitude_reached(target, tolerance=0.3):
+    """Altitude above home within tolerance of target (m)."""
+    return lambda s: abs(s.altitude - target) <= tolerance
+
+
+def position_reached(north, east, down, radius=1.0):
+    """Local NED position within radius of the target (m)."""
+    return lambda s: math.sqrt((s.x - north) ** 2 + (s.y - east) ** 2 +
+                               (s.z - down) ** 2) <= radius
+
+
+def landed_and_disarmed():
+    return lambda s: not s.armed and s.altitude < 0.5
+
+
+def armed(state=True):
+    return lambda s: s.armed == state
+
+
+def mode_is(mode):
+    return lambda s: s.mode == mode
+
+
+def ekf_healthy():
+    return lambda s: s.ekf_healthy
+
+
+def gps_fix(fix_type=3):
+    return lambda s: s.fix_type >= fix_type
+
+
+# ----------------------------------------------------------------------
+# Waits
+# ----------------------------------------------------------------------
+
+def wait_until(vehicle, state, predicate, timeout, clock=None, description=None):
+    """Block on a mavutil connection until predicate(state) holds.
+
+    timeout is in simulated seconds. Returns True when the predicate held,
+    False on timeout.
+    """
+    clock = clock or SimClock()
+    if description:
+        print(f"Waiting for {description}...")
+    start = time.monotonic()
+    state.pump(vehicle)
+    clock.observe(state.time_boot_ms)
+    while not predicate(state):
+        remaining = start + clock.to_wall(timeout) - time.monotonic()
+        if remaining <= 0:
+            if description:
+                print(f"Timed out waiting for {description}")
+            return False
+        msg = vehicle.recv_match(blocking=True, timeout=min(remaining, 1.0))
+        if msg is not None:
+            state.update(msg)
+            state.pump(vehicle)
+            clock.observe(state.time_boot_ms)
+    if description:
+        print(f"✓ {description} ({time.monotonic() - start:.1f}s)")
+    return True
+
+
+async def wait_until_async(link, state, predicate, timeout, clock=None, description=None):
+    """Awaitable wait_until for a MavLink whose messages feed state."""
+    clock = clock or SimClock()
+    if description:
+        link.log(f"Waiting for {description}...")
+    start = time.monotonic()
+    changed = asyncio.Event()
+
+    def on_message(msg):
+        clock.observe(state.time_boot_ms)
+        changed.set()
+
+    link.subscribe(on_message)
+    try:
+        while not predicate(state):
+            remaining = start + clock.to_wall(timeout) - time.monotonic()
+            if remaining <= 0:
+                if description:
+                    link.log(f"Timed out waiting for {description}")
+                return False
+            changed.clear()
+            try:
+                await asyncio.wait_for(changed.wait(), min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        link.unsubscribe(on_message)
+    if description:
+        link.log(f"✓ {description} ({time.monotonic() - start:.1f}s)")
+    return True
+
@@ -1,21 +1,37 @@
 #!/usr/bin/env python3
 """
 WASD Control - EXACT copy of test_motors.py pattern with keyboard
+Sticks deflect while a key is held and re-centre on release; throttle moves
+while Up/Down is held. Key events go through input_pipeline.py, so a change
+is sent as soon as the key is pressed rather than on the next tick.
 """
 
 import time
 from pymavlink import mavutil
 
-try:
-    from pynput import keyboard
-except ImportError:
-    import subprocess
-    import sys
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "pynput"])
-    from pynput import keyboard
+from fast_encode import encoder_for
+from input_pipeline import Axis, InputPipeline
+from scheduler import RateScheduler
+from setpoint_stream import SetpointStream
+from stream_profiles import apply_profile
+from vehicle_state import VehicleState
 
 CONNECTION = "udp:127.0.0.1:14551"
 
+# Loop rates (Hz)
+CONTROL_RATE = 10
+HEARTBEAT_RATE = 1
+STATUS_RATE = 5
+
+# Stick deflection at full key travel (PWM either side of 1500), the time to
+# reach it (ramp, 1/s) and the expo of the response
+STICK_RANGE = 200
+STICK_RAMP = 4.0
+STICK_EXPO = 0.3
+# Throttle: PWM per press and PWM per second while Up/Down is held
+THROTTLE_STEP = 50
+THROTTLE_RATE = 200
+
 # RC values
 roll_val = 1500
 pitch_val = 1500
@@ -26,117 +42,159 @@ yaw_val = 1500
 running = True
 armed = False
 
+# Live telemetry, refreshed every loop tick
+state = VehicleState()
+
+# RC override stream (created on first send)
+rc_stream = None
+
+# Connection, set by main()
+vehicle = None
+
 def send_rc(vehicle):
-    """Send RC override - EXACTLY like test_motors.py"""
-    vehicle.mav.rc_channels_override_send(
-        vehicle.target_system, vehicle.target_component,
+    """Send RC override - same frame as test_motors.py, only on change or keepalive"""
+    global rc_stream
+    if rc_stream is None:
+        rc_stream = SetpointStream(encoder_for(vehicle, "rc_override"), name="rc_override")
+    return rc_stream.update(
         roll_val, pitch_val, throttle_val, yaw_val,
         0, 0, 0, 0)
 
-def on_press(key):
-    global throttle_val, pitch_val, roll_val, yaw_val, running, armed
-    try:
-        if hasattr(key, 'char'):
-            if key.char == 'w':
-                pitch_val = max(1000, pitch_val - 50)
-            elif key.char == 's':
-                pitch_val = min(2000, pitch_val + 50)
-            elif key.char == 'a':
-                roll_val = max(1000, roll_val - 50)
-            elif key.char == 'd':
-                roll_val = min(2000, roll_val + 50)
-            elif key.char == 'q':
-                yaw_val = max(1000, yaw_val - 50)
-            elif key.char == 'e':
-                yaw_val = min(2000, yaw_val + 50)
-        elif key == keyboard.Key.up:
-            throttle_val = min(2000, throttle_val + 50)
-        elif key == keyboard.Key.down:
-            throttle_val = max(1000, throttle_val - 50)
-        elif key == keyboard.Key.space:
-            pitch_val = roll_val = yaw_val = 1500
-        elif key == keyboard.Key.esc:
-            running = False
-            return False
-    except:
-        pass
-
-# Connect - EXACTLY like test_motors.py
-print("="*60)
-print("WASD CONTROL - Based on test_motors.py")
-print("="*60)
-
-print(f"\n1. Connecting to {CONNECTION}...")
-vehicle = mavutil.mavlink_connection(CONNECTION)
-vehicle.wait_heartbeat()
-print(f"✓ Connected to system {vehicle.target_system}")
-
-# Set STABILIZE - EXACTLY like test_motors.py
-print("\n2. Setting STABILIZE mode...")
-mode_id = vehicle.mode_mapping()['STABILIZE']
-vehicle.set_mode(mode_id)
-time.sleep(2)
-print("✓ STABILIZE mode set")
-
-# Arm - EXACTLY like test_motors.py
-print("\n3. Arming motors...")
-vehicle.mav.command_long_send(
-    vehicle.target_system, vehicle.target_component,
-    mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
-    0, 1, 0, 0, 0, 0, 0, 0)
-time.sleep(3)
-armed = True
-print("✓ Armed")
-
-print("\n4. Sending RC override - AUTO TAKEOFF...")
-print("   Watch AirSim window!\n")
-
-# EXACTLY like test_motors.py takeoff
-for throttle in range(1400, 1700, 50):
-    throttle_val = throttle
-    send_rc(vehicle)
-    print(f"   Throttle: {throttle}")
-    time.sleep(1)
+def send_sticks(axes):
+    """Map the pipeline's axis outputs to PWM and send them."""
+    global throttle_val, pitch_val, roll_val, yaw_val
+    roll_val = 1500 + round(axes["roll"] * STICK_RANGE)
+    pitch_val = 1500 + round(axes["pitch"] * STICK_RANGE)
+    yaw_val = 1500 + round(axes["yaw"] * STICK_RANGE)
+    throttle_val = 1500 + round(axes["throttle"] * 500)
+    return send_rc(vehicle)
 
-print("\n5. AIRBORNE! Now you can control with WASD")
-print("   W/S - Pitch  |  A/D - Roll  |  Q/E - Yaw")
-print("   Up/Down - Throttle  |  Space - Center  |  ESC - Exit\n")
+def send_heartbeat(vehicle):
+    """Send GCS heartbeat."""
+    encoder_for(vehicle, "heartbeat").send()
 
-# Start keyboard listener
-listener = keyboard.Listener(on_press=on_press)
-listener.start()
+def stop():
+    global running
+    running = False
 
-# Main loop - EXACTLY like test_motors.py pattern
-print("="*60)
-try:
-    while running:
+def main():
+    global vehicle, armed, throttle_val
+
+    try:
+        from pynput import keyboard
+    except ImportError:
+        import subprocess
+        import sys
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "pynput"])
+        from pynput import keyboard
+
+    # Connect - EXACTLY like test_motors.py
+    print("="*60)
+    print("WASD CONTROL - Based on test_motors.py")
+    print("="*60)
+
+    print(f"\n1. Connecting to {CONNECTION}...")
+    vehicle = mavutil.mavlink_connection(CONNECTION)
+    vehicle.wait_heartbeat()
+    print(f"✓ Connected to system {vehicle.target_system}")
+    apply_profile(vehicle, "manual")
+
+    # Set STABILIZE - EXACTLY like test_motors.py
+    print("\n2. Setting STABILIZE mode...")
+    mode_id = vehicle.mode_mapping()['STABILIZE']
+    vehicle.set_mode(mode_id)
+    time.sleep(2)
+    print("✓ STABILIZE mode set")
+
+    # Arm - EXACTLY like test_motors.py
+    print("\n3. Arming motors...")
+    vehicle.mav.command_long_send(
+        vehicle.target_system, vehicle.target_component,
+        mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+        0, 1, 0, 0, 0, 0, 0, 0)
+    time.sleep(3)
+    armed = True
+    print("✓ Armed")
+
+    print("\n4. Sending RC override - AUTO TAKEOFF...")
+    print("   Watch AirSim window!\n")
+
+    # EXACTLY like test_motors.py takeoff
+    for throttle in range(1400, 1700, 50):
+        throttle_val = throttle
         send_rc(vehicle)
+        print(f"   Throttle: {throttle}")
+        time.sleep(1)
+
+    print("\n5. AIRBORNE! Now you can control with WASD")
+    print("   W/S - Pitch  |  A/D - Roll  |  Q/E - Yaw")
+    print("   Up/Down - Throttle  |  Space - Center  |  ESC - Exit\n")
+
+    # Keys -> axes; W pitches forward (low PWM), A rolls left, Q yaws left
+    pipeline = InputPipeline({
+        "roll": Axis("a", "d", ramp=STICK_RAMP, expo=STICK_EXPO),
+        "pitch": Axis("w", "s", ramp=STICK_RAMP, expo=STICK_EXPO),
+        "yaw": Axis("q", "e", ramp=STICK_RAMP, expo=STICK_EXPO),
+        "throttle": Axis("down", "up", rate=THROTTLE_RATE / 500, nudge=THROTTLE_STEP / 500,
+                         value=(throttle_val - 1500) / 500),
+    }, send_sticks, actions={"space": lambda: pipeline.centre(), "esc": stop})
+
+    # Start keyboard listener (it only queues events)
+    listener = keyboard.Listener(on_press=pipeline.on_press, on_release=pipeline.on_release)
+    listener.start()
+
+    def control_tick():
+        if not running:
+            scheduler.stop()
+            return
+        state.pump(vehicle)
+        pipeline.tick()
+
+    def show_status():
         status = "🟢 ARMED" if armed else "🔴 DISARMED"  
-        print(f"\r{status} | Thr:{throttle_val:4d} Roll:{roll_val:4d} Pitch:{pitch_val:4d} Yaw:{yaw_val:4d}    ",
+        print(f"\r{status} | Thr:{throttle_val:4d} Roll:{roll_val:4d} Pitch:{pitch_val:4d} Yaw:{yaw_val:4d} "
+              f"| Alt:{state.altitude:5.1f}m {state.mode:<9}",
               end='', flush=True)
-        time.sleep(0.1)
-except KeyboardInterrupt:
-    print("\n\nInterrupted")
-
-# Cleanup
-listener.stop()
-
-# Land - EXACTLY like test_motors.py
-print("\n\n6. Landing...")
-for throttle in range(throttle_val, 1200, -50):
-    throttle_val = throttle
-    send_rc(vehicle)
-    print(f"   Throttle: {throttle}")
-    time.sleep(0.5)
-
-# Disarm - EXACTLY like test_motors.py
-print("\n7. Disarming...")
-vehicle.mav.command_long_send(
-    vehicle.target_system, vehicle.target_component,
-    mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
-    0, 0, 0, 0, 0, 0, 0, 0)
-time.sleep(1)
-
-print("\n" + "="*60)
-print("COMPLETE")
-print("="*60)
+
+    # Main loop - RC override at a fixed rate, heartbeat and status slower
+    print("="*60)
+    # Key events wake the loop from its sleep and are sent at once
+    scheduler = RateScheduler(sleep=pipeline.wait)
+    scheduler.add_task(control_tick, CONTROL_RATE, "rc")
+    scheduler.add_task(lambda: send_heartbeat(vehicle), HEARTBEAT_RATE, "heartbeat")
+    scheduler.add_task(show_status, STATUS_RATE, "status")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("\n\nInterrupted")
+
+    # Cleanup
+    listener.stop()
+    print("\n")
+    scheduler.print_report()
+    print(rc_stream.summary())
+    print(pipeline.summary())
+
+    # Land - EXACTLY like test_motors.py
+    print("\n\n6. Landing...")
+    for throttle in range(throttle_val, 1200, -50):
+        throttle_val = throttle
+        send_rc(vehicle)
+        print(f"   Throttle: {throttle}")
+        time.sleep(0.5)
+
+    # Disarm - EXACTLY like test_motors.py
+    print("\n7. Disarming...")
+    vehicle.mav.command_long_send(
+        vehicle.target_system, vehicle.target_component,
+        mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+        0, 0, 0, 0, 0, 0, 0, 0)
+    time.sleep(1)
+
+    print("\n" + "="*60)
+    print("COMPLETE")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()